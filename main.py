@@ -1,21 +1,36 @@
+import argparse
+
 import src.aggregate_daily_points
+import src.build_event_columns
 import src.daily_states_v2
 import src.daily_points_v2
+import src.event_index
+import src.events_backfill
 import src.find_deployment_blocks
 import src.find_daily_blocks
-import src.nft_events
-import src.pilot_vault_events
+import src.fused_replay
 import test.main_test
 from src.copy_last_aggregated_points_file_to_latest_folder import copy_last_aggregated_points_file_to_latest_folder
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the full points pipeline")
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="Write daily states and points in a single replay per day",
+    )
+    args = parser.parse_args()
+
     src.find_deployment_blocks.main()
     src.find_daily_blocks.main()
-    src.nft_events.main()
-    src.pilot_vault_events.main()
-    src.daily_states_v2.process_daily_states()
-    
-    src.daily_points_v2.process_points()
+    src.events_backfill.main()
+    src.build_event_columns.build_event_columns()
+    src.event_index.update_event_index()
+    if args.fused:
+        src.fused_replay.main(with_integrity=False)
+    else:
+        src.daily_states_v2.process_daily_states()
+        src.daily_points_v2.process_points()
     src.aggregate_daily_points.aggregate_daily_points()
     test.main_test.run_all_tests()
-    copy_last_aggregated_points_file_to_latest_folder()
\ No newline at end of file
+    copy_last_aggregated_points_file_to_latest_folder()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import traceback
+from collections import defaultdict
+from contextlib import redirect_stdout
+from datetime import datetime
+from queue import Empty
+from .synthetic_chain import (
+    add_config_arguments,
+    generate_synthetic_chain,
+    get_config_from_arguments,
+)
+from .utils.get_days_amount import get_days_amount
+from .utils.get_additional_data import (
+    get_start_block_for_day,
+    get_end_block_for_day,
+    get_day_date,
+)
+
+STAGES = [
+    "replay_events",
+    "daily_states",
+    "daily_points",
+    "fused_replay",
+    "aggregate_points",
+]
+
+
+def _get_blocks_amount():
+    return sum(
+        get_end_block_for_day(day_index) - get_start_block_for_day(day_index) + 1
+        for day_index in range(get_days_amount())
+    )
+
+
+def _get_events_amount():
+    events_amount = 0
+    for day_index in range(get_days_amount()):
+        for folder in ("nft", "pilot_vault"):
+            with open(f"data/events/{folder}/{day_index}.json", "r") as f:
+                events_amount += len(json.load(f)["events"])
+    return events_amount
+
+
+def _get_user_days_amount():
+    from .daily_points_v2 import get_user_state_at_day
+
+    return sum(
+        len(get_user_state_at_day(day_index, "start_state"))
+        for day_index in range(get_days_amount())
+    )
+
+
+def _run_replay_events(options):
+    from .utils.read_combined_sorted_events import read_combined_sorted_events
+    from .utils.process_event_above_user_state import (
+        UserState,
+        process_event_above_user_state,
+    )
+
+    days = [
+        (get_day_date(day_index), read_combined_sorted_events(day_index))
+        for day_index in range(get_days_amount())
+    ]
+    user_state = defaultdict(UserState)
+    start = time.perf_counter()
+    for date, block_number_to_events in days:
+        for block_number in sorted(block_number_to_events.keys()):
+            for event in block_number_to_events[block_number]:
+                user_state = process_event_above_user_state(event, user_state, date)
+    return time.perf_counter() - start
+
+
+def _run_daily_states(options):
+    from .daily_states_v2 import process_daily_states
+
+    start = time.perf_counter()
+    process_daily_states()
+    return time.perf_counter() - start
+
+
+def _run_daily_points(options):
+    from .daily_points_v2 import AccrualMode, process_points
+
+    start = time.perf_counter()
+    process_points(
+        workers=options["workers"],
+        accrual_mode=AccrualMode(options["accrual_mode"]),
+        force_days=range(get_days_amount()),
+    )
+    return time.perf_counter() - start
+
+
+def _run_fused_replay(options):
+    from .fused_replay import main
+
+    start = time.perf_counter()
+    main()
+    return time.perf_counter() - start
+
+
+def _run_aggregate_points(options):
+    from .aggregate_daily_points import aggregate_daily_points
+
+    start = time.perf_counter()
+    aggregate_daily_points()
+    return time.perf_counter() - start
+
+
+STAGE_FUNCTIONS = {
+    "replay_events": _run_replay_events,
+    "daily_states": _run_daily_states,
+    "daily_points": _run_daily_points,
+    "fused_replay": _run_fused_replay,
+    "aggregate_points": _run_aggregate_points,
+}
+
+
+def _run_stage_in_process(stage, work_dir, options, queue):
+    os.chdir(work_dir)
+    try:
+        with redirect_stdout(io.StringIO()):
+            seconds = STAGE_FUNCTIONS[stage](options)
+    except Exception:
+        # Sent to the parent, which raises it instead of waiting for a result
+        queue.put({"error": traceback.format_exc()})
+        return
+    # ru_maxrss is in kilobytes on Linux
+    queue.put(
+        {
+            "seconds": seconds,
+            "peak_memory_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+    )
+
+
+def run_stage(stage, work_dir, options):
+    """Run a stage in a fresh process, so its peak memory is not shared with other stages"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=_run_stage_in_process, args=(stage, work_dir, options, queue)
+    )
+    process.start()
+    result = None
+    while result is None:
+        exited = process.exitcode is not None
+        try:
+            result = queue.get(timeout=1)
+        except Empty:
+            # Exited without a result, e.g. killed or crashed in native code
+            if exited:
+                raise RuntimeError(
+                    f"Stage {stage} failed with exit code {process.exitcode}"
+                )
+    process.join()
+    if "error" in result:
+        raise RuntimeError(f"Stage {stage} failed:\n{result['error']}")
+    if process.exitcode != 0:
+        raise RuntimeError(f"Stage {stage} failed with exit code {process.exitcode}")
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+
+def run_benchmark(config, stages, options, work_dir):
+    print(f"Generating synthetic chain in {work_dir}...")
+    generate_synthetic_chain(work_dir, config)
+
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        dataset = {
+            "days": get_days_amount(),
+            "blocks": _get_blocks_amount(),
+            "events": _get_events_amount(),
+        }
+    finally:
+        os.chdir(previous_dir)
+
+    results = {}
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        print(f"Running {stage}...")
+        result = run_stage(stage, work_dir, options)
+        if stage == "daily_states":
+            os.chdir(work_dir)
+            try:
+                dataset["user_days"] = _get_user_days_amount()
+            finally:
+                os.chdir(previous_dir)
+        seconds = max(result["seconds"], 1e-9)
+        result["blocks_per_second"] = dataset["blocks"] / seconds
+        result["events_per_second"] = dataset["events"] / seconds
+        if "user_days" in dataset:
+            result["users_per_second"] = dataset["user_days"] / seconds
+        results[stage] = result
+        print(
+            f"  {seconds:.3f}s, {result['blocks_per_second']:,.0f} blocks/s, "
+            f"{result['events_per_second']:,.0f} events/s, "
+            f"peak memory {result['peak_memory_bytes'] / 2**20:.1f} MiB"
+        )
+
+    return {
+        "commit": get_commit(),
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": config.to_dict(),
+        "options": options,
+        "dataset": dataset,
+        "stages": results,
+    }
+
+
+def compare_results(result, baseline):
+    print(f"\nCompared to {baseline['commit']}:")
+    for stage, stage_result in result["stages"].items():
+        baseline_stage = baseline["stages"].get(stage)
+        if baseline_stage is None:
+            continue
+        speedup = baseline_stage["seconds"] / max(stage_result["seconds"], 1e-9)
+        memory_ratio = stage_result["peak_memory_bytes"] / max(
+            baseline_stage["peak_memory_bytes"], 1
+        )
+        print(f"  {stage}: {speedup:.2f}x speed, {memory_ratio:.2f}x peak memory")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the points pipeline on a synthetic chain"
+    )
+    add_config_arguments(parser)
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        default=STAGES,
+        help="Stages to run, states are needed before points",
+    )
+    parser.add_argument("--accrual-mode", default="interval")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--work-dir", help="Directory for the synthetic data (default: temporary)"
+    )
+    parser.add_argument(
+        "--output", help="Result file (default: benchmark_results/{commit}.json)"
+    )
+    parser.add_argument("--compare", help="Previous result file to compare with")
+    args = parser.parse_args()
+
+    options = {"accrual_mode": args.accrual_mode, "workers": args.workers}
+    config = get_config_from_arguments(args)
+    if args.work_dir:
+        result = run_benchmark(
+            config, args.stages, options, os.path.abspath(args.work_dir)
+        )
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            result = run_benchmark(config, args.stages, options, work_dir)
+
+    output = args.output or os.path.join("benchmark_results", f"{result['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare_results(result, json.load(f))
@@ -0,0 +1,27 @@
+import argparse
+from .utils.event_columns import is_day_columns_current, write_day_columns
+from .utils.get_days_amount import get_days_amount
+
+
+def build_event_columns(days_amount: int = None, force: bool = False):
+    """Write the columns file of every day whose file is missing or older than its event files"""
+    if days_amount is None:
+        days_amount = get_days_amount()
+    written_days = 0
+    for day_index in range(days_amount):
+        if not force and is_day_columns_current(day_index):
+            continue
+        write_day_columns(day_index)
+        written_days += 1
+    print(f"Wrote event columns of {written_days} days, {days_amount - written_days} up to date")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write binary event columns of days from the JSON event files"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Rewrite the columns of every day"
+    )
+    args = parser.parse_args()
+    build_event_columns(force=args.force)
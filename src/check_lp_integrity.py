@@ -11,7 +11,7 @@ from .utils.get_additional_data import (
 )
 from .utils.get_days_amount import get_days_amount
 from .daily_points_v2 import LP_PROGRAM_DURATION_DAYS
-from datetime import datetime
+from .utils.day_ordinal import NO_DAY_ORDINAL, day_to_ordinal
 from .daily_points_v2 import (
     get_user_state_at_day,
 )
@@ -30,28 +30,19 @@ class LpIntegrityChecker:
         self.lp_balances_snapshot_start_block = lp_balances_snapshot_start_block
 
     def _validate_lp_integrity(self, users_state, date_unparsed) -> dict[str, bool]:
-        date = datetime.fromisoformat(date_unparsed)
+        date = day_to_ordinal(date_unparsed)
         result = defaultdict(bool)
         for address, user_state in users_state.items():
             user_balance = user_state.balance
-            if user_state.last_positive_balance_update_day == "":
+            lp_entering_day = user_state.last_positive_balance_update_ordinal
+            if lp_entering_day == NO_DAY_ORDINAL:
                 if user_balance > 0:
                     raise ValueError(
                         f"User {address} has balance {user_balance} but no last positive balance update day"
                     )
                 result[address] = False
                 continue
-            try:
-                lp_entering_day = datetime.fromisoformat(
-                    user_state.last_positive_balance_update_day
-                )
-            except:
-                print(
-                    f"Error converting {user_state.last_positive_balance_update_day} to datetime"
-                )
-                print(type(user_state.last_positive_balance_update_day))
-                raise 1
-            if (date - lp_entering_day).days > LP_PROGRAM_DURATION_DAYS:
+            if date - lp_entering_day > LP_PROGRAM_DURATION_DAYS:
                 result[address] = False
                 continue
 
@@ -70,7 +61,8 @@ class LpIntegrityChecker:
         user_state = get_user_state_at_day(day_index, "start_state")
         date_unparsed = get_day_date(day_index)
 
-        # We only need to check blocks after the snapshot start block
+        # We only need to check blocks after the snapshot start block.
+        # Earlier events of the day are not applied, unlike in the fused replay.
         start_block = max(start_block, self.lp_balances_snapshot_start_block)
         for block_number in range(start_block, end_block + 1):
             events = block_number_to_events[block_number]
@@ -1,20 +1,38 @@
+import argparse
+import io
 import json
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
 import os
+from enum import Enum
 from typing import Dict, List
 from .utils.event_type import EventType
 from .utils.read_combined_sorted_events import read_combined_sorted_events
 from .utils.process_event_above_user_state import (
     process_event_above_user_state,
+    get_event_addresses,
     UserState,
 )
 from .utils.get_days_amount import get_days_amount
+from .utils import vectorized_points
 from .utils.get_additional_data import (
+    get_days_blocks_filename,
     get_start_block_for_day,
     get_end_block_for_day,
     get_day_date,
 )
-from datetime import datetime
+from .utils.fingerprint import get_fingerprint
+from .utils.address_table import normalize_address
+from .utils.state_store import get_state_input_files, load_state_data
+from .utils.day_ordinal import NO_DAY_ORDINAL, day_to_ordinal
+from .utils.state_digest import (
+    format_state_diff,
+    get_state_diff,
+    get_state_digest,
+    get_users_state_hash,
+    update_state_digest,
+)
 
 ZERO_ADDRESS = "0x" + "0" * 40
 
@@ -23,30 +41,41 @@ POINTS_PER_PILOT_VAULT_TOKEN_FOR_NFT = (142 * 1500) // 100  # 1.42
 
 LP_PROGRAM_DURATION_DAYS = 90
 
+LP_BALANCES_SNAPSHOT_FILE = "data/lp_balances_snapshot.json"
+
 type Points = int
 
 
+class AccrualMode(Enum):
+    PER_BLOCK = "per_block"
+    INTERVAL = "interval"
+    VECTORIZED = "vectorized"
+
+
 def get_user_state(filename, state_key):
     with open(filename, "r") as f:
         state = json.load(f)
+    return get_user_state_from_data(state, state_key)
+
 
+def get_user_state_from_data(state, state_key):
     user_state = defaultdict(UserState)
     for address, nft in state["nft"][state_key].items():
-        user_state[address.lower()].nft_ids = set(nft)
+        user_state[normalize_address(address)].nft_ids = nft
     for address, state in state["pilot_vault"][state_key].items():
-        user_state[address.lower()].balance = state["balance"]
-        user_state[address.lower()].last_positive_balance_update_day = state[
+        address_state = user_state[normalize_address(address)]
+        address_state.balance = state["balance"]
+        address_state.last_positive_balance_update_day = state[
             "last_positive_balance_update_day"
         ]
-        user_state[address.lower()].last_negative_balance_update_day = state[
+        address_state.last_negative_balance_update_day = state[
             "last_negative_balance_update_day"
         ]
     return user_state
 
 
 def get_user_state_at_day(day_index, state_key):
-    state_file = f"data/states/{day_index}.json"
-    return get_user_state(state_file, state_key)
+    return get_user_state_from_data(load_state_data(day_index, [state_key]), state_key)
 
 
 class DailyPointsProcessor:
@@ -54,57 +83,63 @@ class DailyPointsProcessor:
         self,
         lp_balances_snapshot: Dict[str, UserState],
         lp_balances_snapshot_start_block: int,
+        accrual_mode: AccrualMode = AccrualMode.INTERVAL,
     ):
         self.lp_balances_snapshot = lp_balances_snapshot
         self.lp_balances_snapshot_start_block = lp_balances_snapshot_start_block
+        self.accrual_mode = accrual_mode
+        if accrual_mode == AccrualMode.VECTORIZED:
+            vectorized_points.require_numpy()
 
-    def get_balance_excluding_snapshot(self, address, user_state, date_unparsed) -> int:
-        if address not in self.lp_balances_snapshot.keys():
-            return user_state.balance
+    def get_accrual_blocks(self, start_block, end_block) -> tuple[int, int]:
+        """Blocks of the day that earn points, as a half-open [start, end) range."""
+        return max(start_block, self.lp_balances_snapshot_start_block + 1), end_block + 1
+
+    def get_excluded_snapshot_balance(self, address, date_unparsed) -> int:
+        snapshot_entry = self.lp_balances_snapshot.get(address)
+        if snapshot_entry is None:
+            return 0
 
-        snapshot_entering_day_unparsed = self.lp_balances_snapshot[
-            address
-        ].last_positive_balance_update_day
+        snapshot_entering_day = snapshot_entry.last_positive_balance_update_ordinal
 
-        if snapshot_entering_day_unparsed == "":
-            if self.lp_balances_snapshot[address].balance > 0:
+        if snapshot_entering_day == NO_DAY_ORDINAL:
+            if snapshot_entry.balance > 0:
                 raise ValueError(
-                    f"User {address} has balance {self.lp_balances_snapshot[address].balance} but no last positive balance update day"
+                    f"User {address} has balance {snapshot_entry.balance} but no last positive balance update day"
                 )
-            return user_state.balance
+            return 0
 
-        snapshot_entering_day = datetime.fromisoformat(
-            snapshot_entering_day_unparsed
-        ).date()
+        date = day_to_ordinal(date_unparsed)
 
-        date = datetime.fromisoformat(date_unparsed).date()
+        if date - snapshot_entering_day > LP_PROGRAM_DURATION_DAYS:
+            return 0
+        return snapshot_entry.balance
 
-        if (date - snapshot_entering_day).days > LP_PROGRAM_DURATION_DAYS:
-            return user_state.balance
-        return max(0, user_state.balance - self.lp_balances_snapshot[address].balance)
+    def get_balance_excluding_snapshot(self, address, user_state, date_unparsed) -> int:
+        return max(
+            0,
+            user_state.balance
+            - self.get_excluded_snapshot_balance(address, date_unparsed),
+        )
+
+    def get_points_per_block(self, address, user_state, date) -> Points:
+        balance_excluding_snapshot = self.get_balance_excluding_snapshot(
+            address, user_state, date
+        )
+        if not user_state.has_nft:
+            return balance_excluding_snapshot * POINTS_PER_PILOT_VAULT_TOKEN
+        return balance_excluding_snapshot * POINTS_PER_PILOT_VAULT_TOKEN_FOR_NFT
 
     def give_points_for_user_state(self, user_state, points, date) -> Dict[str, Points]:
         for address, user_state in user_state.items():
-            balance_excluding_snapshot = self.get_balance_excluding_snapshot(
+            points[address.lower()] += self.get_points_per_block(
                 address, user_state, date
             )
-            if len(user_state.nft_ids) == 0:
-                points[address.lower()] += (
-                    balance_excluding_snapshot * POINTS_PER_PILOT_VAULT_TOKEN
-                )
-            else:
-                points[address.lower()] += (
-                    balance_excluding_snapshot * POINTS_PER_PILOT_VAULT_TOKEN_FOR_NFT
-                )
         return points
 
-    def get_points(self, day_index) -> Dict[str, Points]:
-        start_block = get_start_block_for_day(day_index)
-        end_block = get_end_block_for_day(day_index)
-        block_number_to_events = read_combined_sorted_events(day_index)
-        user_state = get_user_state_at_day(day_index, "start_state")
-        date = get_day_date(day_index)
-
+    def accrue_points_per_block(
+        self, start_block, end_block, block_number_to_events, user_state, date
+    ):
         points: Dict[str, Points] = defaultdict(int)
 
         for block_number in range(start_block, end_block + 1):
@@ -114,98 +149,417 @@ class DailyPointsProcessor:
             if block_number > self.lp_balances_snapshot_start_block:
                 points = self.give_points_for_user_state(user_state, points, date)
 
-        validate_end_state(day_index, user_state)
+        return points, user_state
+
+    def accrue_points_by_interval(
+        self, start_block, end_block, block_number_to_events, user_state, date
+    ):
+        accumulator = IntervalPointsAccumulator(
+            self, user_state, date, start_block, end_block
+        )
+        for block_number in sorted(block_number_to_events.keys()):
+            if block_number < start_block or block_number > end_block:
+                continue
+            for event in block_number_to_events[block_number]:
+                accumulator.before_event(event)
+                user_state = process_event_above_user_state(event, user_state, date)
+
+        return accumulator.finish(), user_state
+
+    def accrue_points_vectorized(
+        self, start_block, end_block, block_number_to_events, user_state, date
+    ):
+        """
+        Credit the start state for the whole day with the numpy kernel, then add
+        the change in points per block caused by every event for the remaining blocks.
+        """
+        accrual_start_block, accrual_end_block = self.get_accrual_blocks(
+            start_block, end_block
+        )
+        span = max(0, accrual_end_block - accrual_start_block)
+        points: Dict[str, Points] = defaultdict(int)
+
+        if span > 0 and len(user_state) > 0:
+            addresses = list(user_state.keys())
+            states = [user_state[address] for address in addresses]
+            address_to_index = {address: i for i, address in enumerate(addresses)}
+            excluded_balances = [0] * len(addresses)
+            for address in self.lp_balances_snapshot.keys():
+                if address in address_to_index:
+                    excluded_balances[address_to_index[address]] = (
+                        self.get_excluded_snapshot_balance(address, date)
+                    )
+            weighted_balances = vectorized_points.compute_points_for_blocks(
+                [state.balance for state in states],
+                excluded_balances,
+                [state.has_nft for state in states],
+                POINTS_PER_PILOT_VAULT_TOKEN,
+                POINTS_PER_PILOT_VAULT_TOKEN_FOR_NFT,
+                span,
+            )
+            for address, value in zip(addresses, weighted_balances):
+                points[address.lower()] += value
+
+        def get_weight(address):
+            if address not in user_state:
+                return 0
+            return self.get_points_per_block(address, user_state[address], date)
+
+        for block_number in sorted(block_number_to_events.keys()):
+            if block_number < start_block or block_number > end_block:
+                continue
+            remaining_span = max(
+                0, accrual_end_block - max(block_number, accrual_start_block)
+            )
+            for event in block_number_to_events[block_number]:
+                addresses = get_event_addresses(event)
+                weights_before = [get_weight(address) for address in addresses]
+                user_state = process_event_above_user_state(event, user_state, date)
+                for address, weight_before in zip(addresses, weights_before):
+                    points[address] += (
+                        get_weight(address) - weight_before
+                    ) * remaining_span
+
+        return order_points_like_user_state(points, user_state), user_state
+
+    def get_points(self, day_index) -> Dict[str, Points]:
+        start_block = get_start_block_for_day(day_index)
+        end_block = get_end_block_for_day(day_index)
+        block_number_to_events = read_combined_sorted_events(day_index)
+        user_state = get_user_state_at_day(day_index, "start_state")
+        date = get_day_date(day_index)
+        changed_addresses = get_changed_addresses(block_number_to_events)
+        changed_users_hash = get_users_state_hash(user_state, changed_addresses)
+
+        if self.accrual_mode == AccrualMode.PER_BLOCK:
+            accrue_points = self.accrue_points_per_block
+        elif self.accrual_mode == AccrualMode.VECTORIZED:
+            accrue_points = self.accrue_points_vectorized
+        else:
+            accrue_points = self.accrue_points_by_interval
+        points, user_state = accrue_points(
+            start_block, end_block, block_number_to_events, user_state, date
+        )
+
+        validate_end_state(
+            day_index, user_state, changed_addresses, changed_users_hash
+        )
         return points
 
-    def process_points(self) -> List[Dict]:
-        """Process points for all days and return results as a list of dictionaries."""
+    def get_points_result(self, day_index, points, fingerprint=None) -> Dict:
+        points = {
+            address.lower(): points
+            for address, points in points.items()
+            if points > 0
+        }
+
+        return {
+            "day_index": day_index,
+            "date": get_day_date(day_index),
+            "start_block": get_start_block_for_day(day_index),
+            "end_block": get_end_block_for_day(day_index),
+            "fingerprint": fingerprint,
+            "points": points,
+        }
+
+    def get_points_fingerprint(self, day_index) -> str:
+        """Fingerprint of every input a day's points depend on."""
+        return get_fingerprint(
+            get_points_input_files(day_index),
+            {
+                "points_per_pilot_vault_token": POINTS_PER_PILOT_VAULT_TOKEN,
+                "points_per_pilot_vault_token_for_nft": POINTS_PER_PILOT_VAULT_TOKEN_FOR_NFT,
+                "lp_program_duration_days": LP_PROGRAM_DURATION_DAYS,
+                "lp_balances_snapshot_start_block": self.lp_balances_snapshot_start_block,
+            },
+        )
+
+    def process_points(self, workers: int = 1, force_days: range = None) -> List[Dict]:
+        """
+        Process points for all days and return results as a list of dictionaries.
+
+        Days whose stored fingerprint matches their current inputs are not recomputed,
+        unless they are in force_days.
+        """
         days_amount = get_days_amount()
-        results = []
+        results = [None] * days_amount
+        days_to_compute = []
 
         for day_index in range(days_amount):
+            fingerprint = self.get_points_fingerprint(day_index)
+            is_forced = force_days is not None and day_index in force_days
+            stored_result = load_points_result(day_index)
+            if (
+                not is_forced
+                and stored_result is not None
+                and stored_result.get("fingerprint") == fingerprint
+            ):
+                print(f"Skipping day {day_index}: points are up to date")
+                results[day_index] = stored_result
+                continue
+            days_to_compute.append((day_index, fingerprint))
+
+        if workers > 1:
+            self._process_points_in_parallel(days_to_compute, workers, results)
+            return results
+
+        for day_index, fingerprint in days_to_compute:
             points = self.get_points(day_index)
-            path = f"data/points/{day_index}.json"
-            os.makedirs(os.path.dirname(path), exist_ok=True)
+            results[day_index] = self.get_points_result(day_index, points, fingerprint)
+            write_points_result(results[day_index])
 
-            points = {
-                address.lower(): points
-                for address, points in points.items()
-                if points > 0
-            }
+        return results
 
-            result = {
-                "day_index": day_index,
-                "date": get_day_date(day_index),
-                "start_block": get_start_block_for_day(day_index),
-                "end_block": get_end_block_for_day(day_index),
-                "points": points,
+    def _process_points_in_parallel(self, days_to_compute, workers, results):
+        """
+        Days only depend on their own state and event files, so they are computed
+        in worker processes. Each points file is written as soon as its day is done,
+        while worker output is printed in day order.
+        """
+        logs = [None] * len(days_to_compute)
+        next_day_to_log = 0
+
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_points_worker,
+            initargs=(self,),
+        )
+        try:
+            futures = {
+                executor.submit(_get_points_in_worker, day_index): position
+                for position, (day_index, _) in enumerate(days_to_compute)
             }
+            for future in as_completed(futures):
+                position = futures[future]
+                day_index, fingerprint = days_to_compute[position]
+                points, logs[position] = future.result()
+                results[day_index] = self.get_points_result(
+                    day_index, points, fingerprint
+                )
+                write_points_result(results[day_index])
 
-            json.dump(
-                result,
-                open(path, "w"),
-                indent=2,
-            )
+                while next_day_to_log < len(logs) and logs[next_day_to_log] is not None:
+                    print(logs[next_day_to_log], end="")
+                    next_day_to_log += 1
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown()
 
-            results.append(result)
 
-        return results
+_worker_processor: DailyPointsProcessor = None
 
-def validate_end_state(day_index, result_user_balances):
-    cached_user_balances = get_user_state_at_day(day_index, "end_state")
 
-    result_user_balances_items = sorted(
-        [
-            [address.lower(), balance]
-            for address, balance in result_user_balances.items()
-            if balance.balance > 0
-            or balance.last_negative_balance_update_day != ""
-            or balance.last_positive_balance_update_day != ""
-            or len(balance.nft_ids) > 0
-        ]
-    )
-    cached_user_balances_items = sorted(list(cached_user_balances.items()))
+def _init_points_worker(processor):
+    global _worker_processor
+    _worker_processor = processor
+
+
+def _get_points_in_worker(day_index):
+    log = io.StringIO()
+    with redirect_stdout(log):
+        points = _worker_processor.get_points(day_index)
+    return dict(points), log.getvalue()
+
+
+def get_points_path(day_index) -> str:
+    return f"data/points/{day_index}.json"
+
+
+def get_points_input_files(day_index) -> List[str]:
+    input_files = [
+        *get_state_input_files(day_index),
+        f"data/events/nft/{day_index}.json",
+        f"data/events/pilot_vault/{day_index}.json",
+        LP_BALANCES_SNAPSHOT_FILE,
+        get_days_blocks_filename(day_index),
+    ]
+    # The start block of a day comes from the previous day's boundaries
+    if day_index == 0:
+        input_files.append("data/deployment_blocks.json")
+    else:
+        input_files.append(get_days_blocks_filename(day_index - 1))
+    return input_files
 
-    assert len(result_user_balances_items) == len(
-        cached_user_balances_items
-    ), f"User balances length mismatch: {len(result_user_balances_items)} != {len(cached_user_balances_items)}"
 
-    for result_user_balance, cached_user_balance in zip(
-        result_user_balances_items, cached_user_balances_items
+def load_points_result(day_index) -> Dict:
+    path = get_points_path(day_index)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return None
+
+
+def write_points_result(result):
+    path = get_points_path(result["day_index"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+class IntervalPointsAccumulator:
+    """
+    Accrues points for a day by settling each user's balance x rate x block span
+    only when the user's state is about to change, plus once at the end of the day.
+
+    Gives the same totals as crediting every user on every block, since a user's
+    points per block only depend on their own state and the (fixed) day date.
+    """
+
+    def __init__(
+        self,
+        processor: DailyPointsProcessor,
+        user_state: Dict[str, UserState],
+        date,
+        start_block: int,
+        end_block: int,
     ):
-        assert (
-            result_user_balance[0].lower() == cached_user_balance[0].lower()
-        ), f"User address mismatch: {result_user_balance[0]} != {cached_user_balance[0]}"
-        assert (
-            result_user_balance[1].balance == cached_user_balance[1].balance
-        ), f"User balance mismatch: {result_user_balance[1]} != {cached_user_balance[1]}"
-        assert (
-            result_user_balance[1].nft_ids == cached_user_balance[1].nft_ids
-        ), f"User NFT IDs mismatch: {result_user_balance[1].nft_ids} != {cached_user_balance[1].nft_ids}"
-        assert (
-            result_user_balance[1].last_positive_balance_update_day
-            == cached_user_balance[1].last_positive_balance_update_day
-        ), f"User last positive balance update day mismatch: {result_user_balance[1].last_positive_balance_update_day} != {cached_user_balance[1].last_positive_balance_update_day}"
-        assert (
-            result_user_balance[1].last_negative_balance_update_day
-            == cached_user_balance[1].last_negative_balance_update_day
-        ), f"User last negative balance update day mismatch: {result_user_balance[1].last_negative_balance_update_day} != {cached_user_balance[1].last_negative_balance_update_day}"
+        self.processor = processor
+        self.user_state = user_state
+        self.date = date
+        self.accrual_start_block, self.accrual_end_block = (
+            processor.get_accrual_blocks(start_block, end_block)
+        )
+        self.points: Dict[str, Points] = defaultdict(int)
+        self.settled_until_block: Dict[str, int] = {}
+
+    def settle(self, address, block_number):
+        """Credit the address's current state for all unsettled blocks before block_number."""
+        from_block = self.settled_until_block.get(address, self.accrual_start_block)
+        to_block = min(block_number, self.accrual_end_block)
+        if to_block <= from_block:
+            return
+        user_state = self.user_state.get(address)
+        if user_state is not None:
+            self.points[address.lower()] += self.processor.get_points_per_block(
+                address, user_state, self.date
+            ) * (to_block - from_block)
+        self.settled_until_block[address] = to_block
+
+    def before_event(self, event):
+        for address in get_event_addresses(event):
+            self.settle(address, event["blockNumber"])
+
+    def finish(self) -> Dict[str, Points]:
+        for address in list(self.user_state.keys()):
+            self.settle(address, self.accrual_end_block)
+        return order_points_like_user_state(self.points, self.user_state)
+
+
+def order_points_like_user_state(points, user_state) -> Dict[str, Points]:
+    """
+    Per block accrual credits users in user state order, which is the order
+    the points files are written in. Other accrual modes reorder their result to match.
+    """
+    ordered_points: Dict[str, Points] = defaultdict(int)
+    for address in user_state.keys():
+        if address.lower() in points:
+            ordered_points[address.lower()] = points[address.lower()]
+    return ordered_points
+
+
+def get_changed_addresses(block_number_to_events) -> set[str]:
+    return {
+        address
+        for events in block_number_to_events.values()
+        for event in events
+        for address in get_event_addresses(event)
+    }
+
+
+def validate_end_state(
+    day_index,
+    result_user_balances,
+    changed_addresses: set[str] = None,
+    changed_users_start_hash: int = None,
+):
+    """
+    Check the computed end state against the day's state file.
+
+    When the state file has digests, the end state digest is derived from the start
+    state digest and the changed users only (or from the whole state if they are not
+    given). Only if it does not match, all users are compared and every mismatch is
+    reported in one AssertionError.
+    """
+    state = load_state_data(day_index, [])
+
+    digest = state.get("digest")
+    if digest is not None:
+        if changed_addresses is not None:
+            result_digest = update_state_digest(
+                digest["start_state"],
+                changed_users_start_hash,
+                get_users_state_hash(result_user_balances, changed_addresses),
+            )
+        else:
+            result_digest = get_state_digest(result_user_balances)
+        if result_digest == digest["end_state"]:
+            print(f"Verified end state for day {day_index}")
+            return
+
+    cached_user_balances = get_user_state_at_day(day_index, "end_state")
+    diff = get_state_diff(result_user_balances, cached_user_balances)
+    assert (
+        len(diff) == 0
+    ), f"End state mismatch for day {day_index} in {len(diff)} users (result != cached):\n{format_state_diff(diff)}"
     print(f"Verified end state for day {day_index}")
 
 
 def load_lp_balances_snapshot_data():
     """Load LP balances snapshot data from file and return as tuple (snapshot, start_block)."""
-    lp_balances_snapshot_data_dir = "data/lp_balances_snapshot.json"
+    lp_balances_snapshot_data_dir = LP_BALANCES_SNAPSHOT_FILE
     lp_balances_snapshot = get_user_state(lp_balances_snapshot_data_dir, "start_state")
     lp_balances_snapshot_start_block = json.load(
         open(lp_balances_snapshot_data_dir, "r")
     )["start_block"]
     return lp_balances_snapshot, lp_balances_snapshot_start_block
 
-def process_points():
+def process_points(
+    workers: int = 1,
+    accrual_mode: AccrualMode = AccrualMode.INTERVAL,
+    force_days: range = None,
+):
     lp_balances_snapshot, lp_balances_snapshot_start_block = load_lp_balances_snapshot_data()
-    processor = DailyPointsProcessor(lp_balances_snapshot, lp_balances_snapshot_start_block)
-    processor.process_points()    
+    processor = DailyPointsProcessor(
+        lp_balances_snapshot, lp_balances_snapshot_start_block, accrual_mode
+    )
+    processor.process_points(workers, force_days)
+
 
 if __name__ == "__main__":
-    process_points()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Calculate daily points")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes computing days in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--accrual-mode",
+        choices=[mode.value for mode in AccrualMode],
+        default=AccrualMode.INTERVAL.value,
+        help="How points are accrued within a day (default: interval)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Recompute all days even if their inputs did not change",
+    )
+    parser.add_argument(
+        "--force-range",
+        type=int,
+        nargs=2,
+        metavar=("FIRST_DAY", "LAST_DAY"),
+        help="Recompute days FIRST_DAY..LAST_DAY (inclusive) even if their inputs did not change",
+    )
+    args = parser.parse_args()
+
+    force_days = None
+    if args.force:
+        force_days = range(get_days_amount())
+    elif args.force_range is not None:
+        force_days = range(args.force_range[0], args.force_range[1] + 1)
+    process_points(args.workers, AccrualMode(args.accrual_mode), force_days)
\ No newline at end of file
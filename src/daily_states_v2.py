@@ -1,14 +1,27 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from enum import Enum
 from .utils.process_event_above_user_state import (
     UserState,
     process_event_above_user_state,
 )
 from .utils.read_combined_sorted_events import read_combined_sorted_events
+from .utils.state_digest import (
+    get_state_digest,
+    get_users_state_hash,
+    update_state_digest,
+)
+from .utils.copy_on_write_user_state import CopyOnWriteUserState
+from .utils.day_delta import DayDelta, get_day_delta
+from .utils.state_store import (
+    DEFAULT_CHECKPOINT_INTERVAL,
+    StateStore,
+    get_state_file,
+)
 import json
 import glob
-from collections import defaultdict
 import os
-import copy
 from .utils.get_days_amount import get_days_amount
 from .utils.get_additional_data import (
     get_start_block_for_day,
@@ -17,6 +30,11 @@ from .utils.get_additional_data import (
 )
 
 
+class StateFormat(Enum):
+    FULL = "full"
+    DELTA = "delta"
+
+
 class DailyState:
     def __init__(
         self,
@@ -57,10 +75,39 @@ def calculate_daily_state_after_end_block(
     )
 
 
+def get_day_digests(
+    daily_state_after_end_block: DailyState,
+    user_state_before_start_block: dict[str, UserState],
+    start_digest: str = None,
+) -> tuple[str, str]:
+    """
+    Digests of the states before and after the day. start_digest is the previous
+    day's end digest if known, the end digest is then updated for the users the day
+    changed instead of hashing every user.
+    """
+    user_state = daily_state_after_end_block.user_state
+    if start_digest is None:
+        start_digest = get_state_digest(user_state_before_start_block)
+    if not isinstance(user_state, CopyOnWriteUserState):
+        return start_digest, get_state_digest(user_state)
+    changed_addresses = user_state.get_changed_addresses()
+    end_digest = update_state_digest(
+        start_digest,
+        get_users_state_hash(user_state_before_start_block, changed_addresses),
+        get_users_state_hash(user_state, changed_addresses),
+    )
+    return start_digest, end_digest
+
+
 def write_user_state_to_file(
     daily_state_after_end_block: DailyState,
     user_state_before_start_block: dict[str, UserState],
-):
+    start_digest: str = None,
+) -> str:
+    """Write data/states/{i}.json and return the digest of the end state."""
+    start_digest, end_digest = get_day_digests(
+        daily_state_after_end_block, user_state_before_start_block, start_digest
+    )
     daily_balances_after_end_block = {
         address.lower(): {
             "balance": state.balance,
@@ -75,7 +122,7 @@ def write_user_state_to_file(
     daily_nft_ids_after_end_block = {
         address.lower(): list(state.nft_ids)
         for address, state in daily_state_after_end_block.user_state.items()
-        if len(state.nft_ids) > 0
+        if state.has_nft
     }
     daily_balances_before_start_block = {
         address.lower(): {
@@ -91,7 +138,7 @@ def write_user_state_to_file(
     daily_nft_ids_before_start_block = {
         address.lower(): list(state.nft_ids)
         for address, state in user_state_before_start_block.items()
-        if len(state.nft_ids) > 0
+        if state.has_nft
     }
 
     os.makedirs(os.path.dirname(f"data/states/"), exist_ok=True)
@@ -110,22 +157,117 @@ def write_user_state_to_file(
                     "start_state": daily_balances_before_start_block,
                     "end_state": daily_balances_after_end_block,
                 },
+                "digest": {"start_state": start_digest, "end_state": end_digest},
             },
             f,
             indent=2,
         )
+    return end_digest
+
+
+def write_user_state_to_store(
+    state_store: StateStore,
+    daily_state_after_end_block: DailyState,
+    user_state_before_start_block: dict[str, UserState],
+):
+    user_state = daily_state_after_end_block.user_state
+    changed_addresses = None
+    if isinstance(user_state, CopyOnWriteUserState):
+        changed_addresses = user_state.get_changed_addresses()
+    state_store.write_day(
+        daily_state_after_end_block.day_index,
+        daily_state_after_end_block.date,
+        daily_state_after_end_block.start_block,
+        daily_state_after_end_block.end_block,
+        user_state_before_start_block,
+        user_state,
+        changed_addresses,
+    )
+    # A full state file is read instead of the store, so it must not be left outdated
+    state_file = get_state_file(daily_state_after_end_block.day_index)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+
+
+def calculate_daily_state_from_delta(
+    day_delta: DayDelta, users_state_before_start_block: dict[str, UserState]
+):
+    return DailyState(
+        day_index=day_delta.day_index,
+        date=day_delta.date,
+        start_block=day_delta.start_block,
+        end_block=day_delta.end_block,
+        user_state=day_delta.apply(users_state_before_start_block),
+    )
 
 
-def process_daily_states():
+def process_daily_states(
+    state_format: StateFormat = StateFormat.FULL,
+    checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    workers: int = 1,
+):
+    """
+    Reconstruct and write the state of every day.
+
+    With several workers, each day's net delta is computed in parallel from its events
+    alone, and the deltas are applied in day order to get the states.
+    """
     days_amount = get_days_amount()
-    user_state_before_start_block = defaultdict(UserState)
-    for day_index in range(days_amount):
-        daily_state = calculate_daily_state_after_end_block(
-            day_index, copy.deepcopy(user_state_before_start_block)
-        )
-        write_user_state_to_file(daily_state, user_state_before_start_block)
-        user_state_before_start_block = daily_state.user_state
+    state_store = StateStore(checkpoint_interval=checkpoint_interval)
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        day_deltas = executor.map(get_day_delta, range(days_amount))
+
+    try:
+        user_state_before_start_block = {}
+        end_digest = None
+        for day_index in range(days_amount):
+            user_state = CopyOnWriteUserState(user_state_before_start_block)
+            if executor is not None:
+                daily_state = calculate_daily_state_from_delta(
+                    next(day_deltas), user_state
+                )
+            else:
+                daily_state = calculate_daily_state_after_end_block(
+                    day_index, user_state
+                )
+            if state_format == StateFormat.DELTA:
+                write_user_state_to_store(
+                    state_store, daily_state, user_state_before_start_block
+                )
+            else:
+                end_digest = write_user_state_to_file(
+                    daily_state, user_state_before_start_block, end_digest
+                )
+            user_state_before_start_block = daily_state.user_state.commit()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
 
 if __name__ == "__main__":
-    process_daily_states()
+    parser = argparse.ArgumentParser(description="Reconstruct daily states")
+    parser.add_argument(
+        "--state-format",
+        choices=[state_format.value for state_format in StateFormat],
+        default=StateFormat.FULL.value,
+        help="full: data/states/{i}.json with both states of each day, "
+        "delta: data/state_store with checkpoints and per-day changes",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        help="Days between full checkpoints of the delta format",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Compute the days' changes in N parallel processes",
+    )
+    args = parser.parse_args()
+    process_daily_states(
+        StateFormat(args.state_format), args.checkpoint_interval, args.workers
+    )
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+from collections import defaultdict
+from typing import Dict, List
+from .utils.address_table import normalize_address
+from .utils.event_columns import (
+    get_event_columns_file,
+    is_day_columns_current,
+    open_event_columns,
+)
+from .utils.event_type import EventType
+from .utils.fingerprint import hash_file
+from .utils.get_days_amount import get_days_amount
+from .utils.process_event_above_user_state import get_event_addresses
+
+EVENT_INDEX_DIR = "data/event_index"
+
+EVENT_FOLDERS = {"nft": EventType.NFT, "pilot_vault": EventType.TRANSFER}
+
+# [day_index, blockNumber, transactionIndex, logIndex, events folder]
+type EventPosition = list
+
+
+def get_events_file(folder, day_index) -> str:
+    return f"data/events/{folder}/{day_index}.json"
+
+
+def get_file_info(path) -> dict:
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _write_lines(path, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for line in lines:
+            f.write(json.dumps(line) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _append_lines(path, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        for line in lines:
+            f.write(json.dumps(line) + "\n")
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class AddressEventIndex:
+    """
+    Persistent index from address to the positions of the events it is from or to in.
+
+    Positions are split into 256 shards by the first byte of the address, so a lookup
+    reads one shard. A shard holds a JSON line per day with positions in it. update()
+    only indexes days whose event files are new or changed, appends new days to the
+    shards their addresses are in and rewrites only shards with positions of changed days.
+    """
+
+    def __init__(self, root: str = EVENT_INDEX_DIR):
+        self.root = str(root)
+
+    def get_days_path(self) -> str:
+        return os.path.join(self.root, "days.json")
+
+    def get_shard_path(self, shard) -> str:
+        return os.path.join(self.root, "shards", f"{shard}.jsonl")
+
+    def get_shard(self, address) -> str:
+        return normalize_address(address)[2:4]
+
+    def _load_indexed_days(self) -> Dict[str, dict]:
+        return _read_json(self.get_days_path(), {})
+
+    def _is_day_unchanged(self, day_index, indexed_day) -> bool:
+        # Days indexed before shards were recorded per day, or by an interrupted
+        # update, are indexed again
+        if indexed_day is None or "shards" not in indexed_day or indexed_day.get("pending"):
+            return False
+        for folder in EVENT_FOLDERS:
+            path = get_events_file(folder, day_index)
+            indexed_file = indexed_day[folder]
+            file_info = get_file_info(path)
+            if file_info is None or indexed_file is None:
+                if file_info != indexed_file:
+                    return False
+                continue
+            if (
+                file_info["mtime_ns"] != indexed_file["mtime_ns"]
+                or file_info["size"] != indexed_file["size"]
+            ) and hash_file(path) != indexed_file["sha256"]:
+                return False
+        return True
+
+    def get_outdated_days(self, days_amount: int = None) -> List[int]:
+        """Days to index or to remove from the index."""
+        if days_amount is None:
+            days_amount = get_days_amount()
+        indexed_days = self._load_indexed_days()
+        outdated_days = [
+            day_index
+            for day_index in range(days_amount)
+            if not self._is_day_unchanged(day_index, indexed_days.get(str(day_index)))
+        ]
+        outdated_days += [
+            int(day_index) for day_index in indexed_days if int(day_index) >= days_amount
+        ]
+        return outdated_days
+
+    def is_up_to_date(self, days_amount: int = None) -> bool:
+        return len(self.get_outdated_days(days_amount)) == 0
+
+    def update(self, days_amount: int = None) -> List[int]:
+        """Index new and changed days and return them."""
+        if days_amount is None:
+            days_amount = get_days_amount()
+        outdated_days = self.get_outdated_days(days_amount)
+        if len(outdated_days) == 0:
+            return []
+
+        indexed_days = self._load_indexed_days()
+        removed_days = set()
+        # Only shards with positions of changed days are rewritten
+        rewritten_shards = set()
+        old_shards: Dict[int, List[str]] = {}
+        for day_index in outdated_days:
+            indexed_day = indexed_days.pop(str(day_index), None)
+            if indexed_day is not None:
+                removed_days.add(day_index)
+                old_shards[day_index] = indexed_day.get("shards", [])
+                rewritten_shards.update(old_shards[day_index])
+        pending_days = dict(indexed_days)
+
+        new_lines: Dict[str, List[dict]] = defaultdict(list)
+        for day_index in outdated_days:
+            if day_index >= days_amount:
+                continue
+            indexed_day = {}
+            day_positions: Dict[str, Dict[str, List[EventPosition]]] = defaultdict(
+                lambda: defaultdict(list)
+            )
+            for folder in EVENT_FOLDERS:
+                path = get_events_file(folder, day_index)
+                file_info = get_file_info(path)
+                indexed_day[folder] = file_info
+                if file_info is None:
+                    continue
+                file_info["sha256"] = hash_file(path)
+                with open(path, "r") as f:
+                    events = json.load(f)["events"]
+                for event in events:
+                    position = [
+                        day_index,
+                        event["blockNumber"],
+                        event["transactionIndex"],
+                        event["logIndex"],
+                        folder,
+                    ]
+                    for address in get_event_addresses(event):
+                        day_positions[self.get_shard(address)][address].append(position)
+            for shard, positions in day_positions.items():
+                new_lines[shard].append(
+                    {
+                        "day_index": day_index,
+                        "positions": {
+                            address: sorted(address_positions)
+                            for address, address_positions in positions.items()
+                        },
+                    }
+                )
+            indexed_day["shards"] = sorted(day_positions.keys())
+            indexed_days[str(day_index)] = indexed_day
+
+        # Until the shards are written the outdated days are listed as pending, with
+        # every shard they can have lines in. An interrupted update leaves them
+        # outdated, and the next one rewrites those shards without their lines
+        # instead of appending the days a second time.
+        for day_index in outdated_days:
+            shards = set(old_shards.get(day_index, []))
+            if str(day_index) in indexed_days:
+                shards.update(indexed_days[str(day_index)]["shards"])
+            pending_days[str(day_index)] = {"pending": True, "shards": sorted(shards)}
+        _write_json(
+            self.get_days_path(),
+            dict(sorted(pending_days.items(), key=lambda item: int(item[0]))),
+        )
+
+        for shard in sorted(rewritten_shards):
+            lines = [
+                line
+                for line in self._read_shard(shard)
+                if line["day_index"] not in removed_days
+            ]
+            _write_lines(self.get_shard_path(shard), lines + new_lines.pop(shard, []))
+        # Shards of only new days get the days appended
+        for shard, lines in sorted(new_lines.items()):
+            _append_lines(self.get_shard_path(shard), lines)
+
+        _write_json(
+            self.get_days_path(),
+            dict(sorted(indexed_days.items(), key=lambda item: int(item[0]))),
+        )
+        return sorted(day for day in outdated_days if day < days_amount)
+
+    def _read_shard(self, shard) -> List[dict]:
+        """Lines of a shard in day order, a day indexed after later days is appended last."""
+        path = self.get_shard_path(shard)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as f:
+            lines = [json.loads(line) for line in f]
+        return sorted(lines, key=lambda line: line["day_index"])
+
+    def get_positions(self, address) -> List[EventPosition]:
+        """Positions of the address's events, in replay order."""
+        address = normalize_address(address)
+        positions = []
+        for line in self._read_shard(self.get_shard(address)):
+            positions += line["positions"].get(address, [])
+        return positions
+
+    def get_days(self, address) -> List[int]:
+        return sorted({position[0] for position in self.get_positions(address)})
+
+    def get_events(self, address) -> List[dict]:
+        """The address's events, reading only the event files of days it has events in."""
+        return get_events_at(self.get_positions(address))
+
+
+def get_events_at(positions: List[EventPosition]) -> List[dict]:
+    """
+    Events at the positions, in the same order. Days with a current event columns
+    file read only the events at the positions from it, other days their event files.
+    """
+    day_to_positions = defaultdict(list)
+    for position in positions:
+        day_to_positions[position[0]].append(position)
+    events_by_position = {}
+    for day_index, day_positions in sorted(day_to_positions.items()):
+        if is_day_columns_current(day_index):
+            columns = open_event_columns(get_event_columns_file(day_index))
+            for position in day_positions:
+                events_by_position[tuple(position)] = columns.get_event(
+                    columns.find_event(*position[1:4])
+                )
+            continue
+        for folder in sorted({position[4] for position in day_positions}):
+            with open(get_events_file(folder, day_index), "r") as f:
+                for event in json.load(f)["events"]:
+                    event["event_type"] = EVENT_FOLDERS[folder]
+                    events_by_position[
+                        (
+                            day_index,
+                            event["blockNumber"],
+                            event["transactionIndex"],
+                            event["logIndex"],
+                            folder,
+                        )
+                    ] = event
+    return [events_by_position[tuple(position)] for position in positions]
+
+
+def update_event_index():
+    updated_days = AddressEventIndex().update()
+    print(f"Indexed events of {len(updated_days)} days")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Update the per-address event index, or print an address's events"
+    )
+    parser.add_argument("address", nargs="?", help="Address to print the events of")
+    args = parser.parse_args()
+
+    update_event_index()
+    if args.address:
+        for event in AddressEventIndex().get_events(args.address):
+            event["event_type"] = event["event_type"].name
+            print(json.dumps(event))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import argparse
+from . import nft_events, pilot_vault_events
+from .utils.aggregated_w3_request import (
+    DEFAULT_MAX_IN_FLIGHT,
+    provider_lags,
+    set_provider_limit,
+)
+from .utils.events_fetcher import fetch_events
+
+
+def main(max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, combined: bool = True):
+    """Fetch the missing days of NFT and pilot_vault events together"""
+    fetch_events(
+        [nft_events.get_events_source(), pilot_vault_events.get_events_source()],
+        max_in_flight,
+        combined,
+    )
+    for provider, lags in sorted(provider_lags.items()):
+        print(f"{provider} lagged behind the quorum in {lags} calls")
+
+
+def parse_provider_limit(value):
+    provider, _, max_in_flight = value.rpartition("=")
+    if not provider:
+        raise argparse.ArgumentTypeError(f"Expected URL=N, got {value}")
+    return provider, int(max_in_flight)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fetch NFT and pilot_vault Transfer events of all days concurrently"
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=DEFAULT_MAX_IN_FLIGHT,
+        help="getLogs requests in flight to each provider without --provider-limit",
+    )
+    parser.add_argument(
+        "--provider-limit",
+        type=parse_provider_limit,
+        action="append",
+        default=[],
+        metavar="URL=N",
+        help="Requests in flight to the provider URL",
+    )
+    parser.add_argument(
+        "--separate-requests",
+        action="store_true",
+        help="Request the logs of each contract separately instead of both at once",
+    )
+    args = parser.parse_args()
+    for provider, max_in_flight in args.provider_limit:
+        set_provider_limit(provider, max_in_flight)
+    main(args.max_in_flight, not args.separate_requests)
@@ -2,7 +2,10 @@
 import json
 from datetime import datetime, timezone
 import os
-from .utils.aggregated_w3_request import w3_instances, make_aggregated_call
+from .utils.aggregated_w3_request import w3_instances, get_block_number, get_blocks
+
+# Blocks probed per step of the search, all fetched in one batch request
+SEARCH_PROBES = 15
 
 
 def get_min_deployment_block():
@@ -27,13 +30,17 @@ def get_min_deployment_block():
     return min_block
 
 
+def get_blocks_cached(nums, cache):
+    """Fetch blocks not in the cache with one batch request."""
+    missing = sorted({num for num in nums if num not in cache})
+    for blk in get_blocks(missing, w3_instances):
+        cache[blk["number"]] = blk
+    return [cache[num] for num in nums]
+
+
 def get_block(num, cache):
     """Fetch block with simple cache."""
-    if num in cache:
-        return cache[num]
-    blk = make_aggregated_call(w3_instances, lambda w3: w3.eth.get_block(num))
-    cache[num] = blk
-    return blk
+    return get_blocks_cached([num], cache)[0]
 
 
 def get_block_date(block):
@@ -41,27 +48,31 @@ def get_block_date(block):
     return datetime.fromtimestamp(block["timestamp"], tz=timezone.utc).date()
 
 
-def find_first_block_strictly_after_day(start_block, latest_block, target_day):
+def find_first_block_strictly_after_day(start_block, latest_block, target_day, cache=None):
     """
-    Binary search for the smallest block number in [start_block, latest_block]
+    Search for the smallest block number in [start_block, latest_block]
     whose UTC date is strictly greater than target_day.
+    Every step fetches SEARCH_PROBES evenly spaced blocks in one batch request,
+    narrowing the range SEARCH_PROBES + 1 times instead of halving it.
     Returns block number or None if not found.
     """
-    cache = {}
+    if cache is None:
+        cache = {}
     lo = start_block
     hi = latest_block + 1  # exclusive
 
     while lo < hi:
-        mid = (lo + hi) // 2
-        blk = get_block(mid, cache)
-        blk_day = get_block_date(blk)
-
-        if blk_day <= target_day:
-            # still same day or earlier (shouldn’t be earlier if start_block is same day)
-            lo = mid + 1
-        else:
-            # this block is after target_day, move left
-            hi = mid
+        probes = sorted({
+            lo + (hi - lo) * (i + 1) // (SEARCH_PROBES + 1) for i in range(SEARCH_PROBES)
+        })
+        for probe, blk in zip(probes, get_blocks_cached(probes, cache)):
+            if get_block_date(blk) <= target_day:
+                # still same day or earlier (shouldn’t be earlier if start_block is same day)
+                lo = probe + 1
+            else:
+                # this block is after target_day, move left
+                hi = probe
+                break
 
     # lo is the first index where blk_day > target_day, if it exists
     if lo > latest_block:
@@ -75,18 +86,17 @@ def find_first_block_strictly_after_day(start_block, latest_block, target_day):
 
 
 def main():
-    latest_block = make_aggregated_call(w3_instances, lambda w3: w3.eth.block_number)
+    latest_block = get_block_number(w3_instances)
     start_block = get_min_deployment_block()
 
     if start_block > latest_block:
         raise ValueError(f"start-block {start_block} is greater than latest block {latest_block}")
 
-    # Get starting block and its day
-    start_blk = make_aggregated_call(w3_instances, lambda w3: w3.eth.get_block(start_block))
+    cache = {}  # Reuse cache across iterations
+
+    # Get starting and latest block and their days
+    start_blk, latest_blk = get_blocks_cached([start_block, latest_block], cache)
     start_day = get_block_date(start_blk)
-    
-    # Get latest block and its day
-    latest_blk = make_aggregated_call(w3_instances, lambda w3: w3.eth.get_block(latest_block))
     latest_day = get_block_date(latest_blk)
 
     print(f"Starting from block {start_block}, day = {start_day}")
@@ -96,14 +106,13 @@ def main():
     all_boundaries = []
     current_day = start_day
     current_search_start = start_block
-    cache = {}  # Reuse cache across iterations
 
     while current_day <= latest_day:
         print(f"\nProcessing day: {current_day}")
         
         # Binary search for first block *after* this day
         first_after = find_first_block_strictly_after_day(
-            current_search_start, latest_block, current_day
+            current_search_start, latest_block, current_day, cache
         )
 
         if first_after is None:
@@ -129,8 +138,9 @@ def main():
             break
 
         last_block_same_day = first_after - 1
-        last_blk = get_block(last_block_same_day, cache)
-        first_next_blk = get_block(first_after, cache)
+        last_blk, first_next_blk = get_blocks_cached(
+            [last_block_same_day, first_after], cache
+        )
         next_day = get_block_date(first_next_blk)
 
         all_boundaries.append({
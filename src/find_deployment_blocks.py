@@ -2,7 +2,8 @@ import json
 import sys
 import os
 from datetime import datetime, timezone
-from .utils.aggregated_w3_request import w3_instances, make_aggregated_call
+from hexbytes import HexBytes
+from .utils.aggregated_w3_request import w3_instances, make_aggregated_call, make_raw_request, get_block_number, get_blocks
 from web3 import Web3
 
 def load_contract_addresses():
@@ -38,8 +39,10 @@ def load_contract_addresses():
 def has_contract_code(address, block_number):
     """Check if contract has code at a specific block"""
     try:
-        code = make_aggregated_call(w3_instances, lambda w3: w3.eth.get_code(address, block_number))
-        return len(code) > 0
+        code = make_aggregated_call(
+            w3_instances, lambda w3: make_raw_request(w3, "eth_getCode", [address, hex(block_number)])
+        )
+        return len(HexBytes(code)) > 0
     except Exception as e:
         print(f"Warning: Error checking code at block {block_number}: {e}")
         return False
@@ -58,7 +61,7 @@ def find_deployment_block(address, start_block=0, end_block=None):
         Block number where contract was deployed, or None if not found
     """
     if end_block is None:
-        end_block = make_aggregated_call(w3_instances, lambda w3: w3.eth.block_number)
+        end_block = get_block_number(w3_instances)
     
     print(f"  Searching for deployment block between {start_block} and {end_block}...")
     
@@ -89,7 +92,7 @@ def find_deployment_block(address, start_block=0, end_block=None):
 def get_block_info(block_number):
     """Get block information including timestamp"""
     try:
-        block = make_aggregated_call(w3_instances, lambda w3: w3.eth.get_block(block_number))
+        block = get_blocks([block_number], w3_instances)[0]
         return {
             'block_number': block_number,
             'timestamp': block.timestamp,
@@ -113,7 +116,7 @@ def main():
     # Initialize Web3 connection
     print("\n2. Connecting to blockchain...")
     # Get latest block
-    latest_block = make_aggregated_call(w3_instances, lambda w3: w3.eth.block_number)
+    latest_block = get_block_number(w3_instances)
     print(f"   Latest block: {latest_block}")
     
     # Find deployment blocks
@@ -0,0 +1,313 @@
+import argparse
+import sys
+from collections import defaultdict
+from typing import Dict, List
+from .daily_states_v2 import (
+    DailyState,
+    StateFormat,
+    write_user_state_to_file,
+    write_user_state_to_store,
+)
+from .daily_points_v2 import (
+    DailyPointsProcessor,
+    IntervalPointsAccumulator,
+    load_lp_balances_snapshot_data,
+    order_points_like_user_state,
+    write_points_result,
+)
+from .check_lp_integrity import LpIntegrityChecker
+from .utils.read_combined_sorted_events import read_combined_sorted_events
+from .utils.process_event_above_user_state import (
+    UserState,
+    get_event_addresses,
+    process_event_above_user_state,
+)
+from .utils.get_days_amount import get_days_amount
+from .utils.copy_on_write_user_state import CopyOnWriteUserState
+from .utils.state_store import DEFAULT_CHECKPOINT_INTERVAL, StateStore
+from .utils.get_additional_data import (
+    get_start_block_for_day,
+    get_end_block_for_day,
+    get_day_date,
+)
+
+
+class ReplayObserver:
+    """
+    Receives the replay of a day. Blocks without events are not visited, since
+    nothing can change between two events within a day.
+    """
+
+    def on_day_start(self, day: DailyState, user_state: Dict[str, UserState]):
+        pass
+
+    def before_event(self, event, user_state: Dict[str, UserState]):
+        pass
+
+    def after_block(
+        self, block_number, user_state: Dict[str, UserState], changed_addresses
+    ):
+        pass
+
+    def on_day_end(
+        self,
+        day: DailyState,
+        user_state_before_start_block: Dict[str, UserState],
+    ):
+        pass
+
+
+class StateFileObserver(ReplayObserver):
+    """
+    Writes data/states/{i}.json, or the day to the state store if one is given.
+    Keep it before observers reading the state file.
+    """
+
+    def __init__(self, state_store: StateStore = None):
+        self.state_store = state_store
+        self.end_digest = None
+        self.last_day_index = None
+
+    def on_day_end(self, day, user_state_before_start_block):
+        if self.state_store is not None:
+            write_user_state_to_store(
+                self.state_store, day, user_state_before_start_block
+            )
+        else:
+            start_digest = None
+            if self.last_day_index == day.day_index - 1:
+                start_digest = self.end_digest
+            self.end_digest = write_user_state_to_file(
+                day, user_state_before_start_block, start_digest
+            )
+            self.last_day_index = day.day_index
+
+
+class PointsObserver(ReplayObserver):
+    """Accrues points by interval and writes data/points/{i}.json."""
+
+    def __init__(self, processor: DailyPointsProcessor):
+        self.processor = processor
+        self.accumulator = None
+        self.address_order = {}
+
+    def on_day_start(self, day, user_state):
+        self.accumulator = IntervalPointsAccumulator(
+            self.processor, user_state, day.date, day.start_block, day.end_block
+        )
+        # Points files list users in the order the start state reads back from its
+        # state file, followed by users in the order events first touch them
+        self.address_order = dict.fromkeys(
+            [address for address, state in user_state.items() if state.has_nft]
+            + [
+                address
+                for address, state in user_state.items()
+                if state.balance > 0
+                or state.last_negative_balance_update_day != ""
+                or state.last_positive_balance_update_day != ""
+            ]
+        )
+
+    def before_event(self, event, user_state):
+        self.accumulator.before_event(event)
+        for address in get_event_addresses(event):
+            self.address_order.setdefault(address)
+
+    def on_day_end(self, day, user_state_before_start_block):
+        points = order_points_like_user_state(
+            self.accumulator.finish(), self.address_order
+        )
+        write_points_result(
+            self.processor.get_points_result(
+                day.day_index,
+                points,
+                self.processor.get_points_fingerprint(day.day_index),
+            )
+        )
+        print(f"Calculated points for day {day.day_index}")
+
+
+class LpIntegrityObserver(ReplayObserver):
+    """
+    Records the first block each user's balance is below their LP snapshot balance.
+
+    Integrity only depends on the user's state and the day, so all users are checked
+    once at the first checked block of the day and afterwards only users changed by events.
+
+    Events of the snapshot day before the snapshot start block are applied but not checked,
+    whereas `check_lp_integrity` skips them. Both give the same result when the snapshot
+    starts at the first block of a day, as a snapshot copied from a state file does.
+    """
+
+    def __init__(self, checker: LpIntegrityChecker):
+        self.checker = checker
+        self.user_to_first_broken_integrity_block = defaultdict(lambda: -1)
+        self.day = None
+        self.first_checked_block = None
+        self.is_full_check_pending = False
+
+    def on_day_start(self, day, user_state):
+        self.day = day
+        # We only need to check blocks after the snapshot start block
+        self.first_checked_block = max(
+            day.start_block, self.checker.lp_balances_snapshot_start_block
+        )
+        self.is_full_check_pending = self.first_checked_block <= day.end_block
+
+    def before_event(self, event, user_state):
+        if self.is_full_check_pending and event["blockNumber"] > self.first_checked_block:
+            self._check_all(self.first_checked_block, user_state)
+
+    def after_block(self, block_number, user_state, changed_addresses):
+        if block_number < self.first_checked_block:
+            return
+        if self.is_full_check_pending:
+            self._check_all(block_number, user_state)
+            return
+        self._check(
+            block_number,
+            {address: user_state[address] for address in changed_addresses},
+        )
+
+    def on_day_end(self, day, user_state_before_start_block):
+        if self.is_full_check_pending:
+            self._check_all(self.first_checked_block, day.user_state)
+
+    def _check_all(self, block_number, user_state):
+        self.is_full_check_pending = False
+        self._check(block_number, user_state)
+
+    def _check(self, block_number, user_state):
+        result = self.checker._validate_lp_integrity(user_state, self.day.date)
+        for address, is_integrity_broken in result.items():
+            if is_integrity_broken:
+                print(f"Integrity broken for user {address} at block {block_number}")
+                if self.user_to_first_broken_integrity_block[address] == -1:
+                    self.user_to_first_broken_integrity_block[address] = block_number
+
+    def get_exit_code(self):
+        return self.checker._print_user_to_first_broken_integrity_block(
+            self.user_to_first_broken_integrity_block
+        )
+
+
+def replay_day(
+    day_index,
+    user_state_before_start_block: Dict[str, UserState],
+    observers: List[ReplayObserver],
+) -> Dict[str, UserState]:
+    """
+    Replay a day's events once, feeding every observer, and return the end state.
+
+    The end state is user_state_before_start_block updated in place, so it must not
+    be used afterwards.
+    """
+    start_block = get_start_block_for_day(day_index)
+    end_block = get_end_block_for_day(day_index)
+    date = get_day_date(day_index)
+    block_number_to_events = read_combined_sorted_events(day_index)
+    user_state = CopyOnWriteUserState(user_state_before_start_block)
+
+    day = DailyState(
+        day_index=day_index,
+        date=date,
+        start_block=start_block,
+        end_block=end_block,
+        user_state=user_state,
+    )
+    for observer in observers:
+        observer.on_day_start(day, user_state)
+
+    for block_number in sorted(block_number_to_events.keys()):
+        if block_number < start_block or block_number > end_block:
+            continue
+        changed_addresses = []
+        for event in block_number_to_events[block_number]:
+            for observer in observers:
+                observer.before_event(event, user_state)
+            for address in get_event_addresses(event):
+                if address not in changed_addresses:
+                    changed_addresses.append(address)
+            user_state = process_event_above_user_state(event, user_state, date)
+        for observer in observers:
+            observer.after_block(block_number, user_state, changed_addresses)
+
+    for observer in observers:
+        observer.on_day_end(day, user_state_before_start_block)
+    return user_state.commit()
+
+
+def process_days_fused(observers: List[ReplayObserver]):
+    user_state = {}
+    for day_index in range(get_days_amount()):
+        print(f"Replaying day {day_index}")
+        user_state = replay_day(day_index, user_state, observers)
+
+
+def main(
+    with_states=True,
+    with_points=True,
+    with_integrity=True,
+    state_format: StateFormat = StateFormat.FULL,
+    checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+) -> int:
+    lp_balances_snapshot, lp_balances_snapshot_start_block = (
+        load_lp_balances_snapshot_data()
+    )
+    observers = []
+    if with_states:
+        state_store = None
+        if state_format == StateFormat.DELTA:
+            state_store = StateStore(checkpoint_interval=checkpoint_interval)
+        observers.append(StateFileObserver(state_store))
+    if with_points:
+        observers.append(
+            PointsObserver(
+                DailyPointsProcessor(
+                    lp_balances_snapshot, lp_balances_snapshot_start_block
+                )
+            )
+        )
+    integrity_observer = None
+    if with_integrity:
+        integrity_observer = LpIntegrityObserver(
+            LpIntegrityChecker(lp_balances_snapshot, lp_balances_snapshot_start_block)
+        )
+        observers.append(integrity_observer)
+
+    process_days_fused(observers)
+
+    if integrity_observer is not None:
+        return integrity_observer.get_exit_code()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay every day once, writing states and points and checking LP integrity"
+    )
+    parser.add_argument("--no-states", action="store_true", help="Do not write state files")
+    parser.add_argument("--no-points", action="store_true", help="Do not write points files")
+    parser.add_argument("--no-integrity", action="store_true", help="Do not check LP integrity")
+    parser.add_argument(
+        "--state-format",
+        choices=[state_format.value for state_format in StateFormat],
+        default=StateFormat.FULL.value,
+        help="Write full state files or the delta state store",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        help="Days between full checkpoints of the delta format",
+    )
+    args = parser.parse_args()
+    sys.exit(
+        main(
+            with_states=not args.no_states,
+            with_points=not args.no_points,
+            with_integrity=not args.no_integrity,
+            state_format=StateFormat(args.state_format),
+            checkpoint_interval=args.checkpoint_interval,
+        )
+    )
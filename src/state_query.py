@@ -0,0 +1,172 @@
+import argparse
+import bisect
+import json
+from collections import defaultdict
+from typing import Dict, List
+from .daily_points_v2 import get_user_state_at_day
+from .event_index import AddressEventIndex, get_events_at
+from .utils.read_combined_sorted_events import read_combined_sorted_events
+from .utils.process_event_above_user_state import (
+    ZERO_ADDRESS,
+    UserState,
+    get_event_addresses,
+    process_event_above_user_state,
+)
+from .utils.address_table import normalize_address
+from .utils.get_days_amount import get_days_amount
+from .utils.get_additional_data import (
+    get_start_block_for_day,
+    get_end_block_for_day,
+    get_day_date,
+)
+
+
+def get_event_for_address(event, address):
+    """The event with the other side replaced by the zero address, so only address is changed."""
+    args = dict(event["args"])
+    for key in ("from", "to"):
+        if normalize_address(args[key]) != address:
+            args[key] = ZERO_ADDRESS
+    return {**event, "args": args}
+
+
+class StateQuery:
+    """
+    State of addresses at any block from local data, without RPC calls.
+
+    The state at a block is the state after all events of that block. A query reads
+    the start state of the block's day and replays the events of the day up to the
+    block, for a single address only the events of that address.
+    """
+
+    def __init__(self):
+        days_amount = get_days_amount()
+        self.start_blocks = [get_start_block_for_day(i) for i in range(days_amount)]
+        self.end_blocks = [get_end_block_for_day(i) for i in range(days_amount)]
+        self._start_states: Dict[int, Dict[str, UserState]] = {}
+        self._address_events: Dict[int, Dict[str, List[dict]]] = {}
+        # Only the events of a queried address are read if the event index is current
+        self.event_index = AddressEventIndex()
+        if not self.event_index.is_up_to_date(days_amount):
+            self.event_index = None
+
+    def get_day_index(self, block_number) -> int:
+        """Day containing the block, -1 for blocks before the first day."""
+        if len(self.start_blocks) == 0 or block_number < self.start_blocks[0]:
+            return -1
+        day_index = bisect.bisect_left(self.end_blocks, block_number)
+        if day_index == len(self.end_blocks):
+            raise ValueError(
+                f"Block {block_number} is after the last processed block {self.end_blocks[-1]}"
+            )
+        return day_index
+
+    def get_start_state(self, day_index) -> Dict[str, UserState]:
+        if day_index not in self._start_states:
+            self._start_states[day_index] = get_user_state_at_day(
+                day_index, "start_state"
+            )
+        return self._start_states[day_index]
+
+    def get_address_events(self, day_index, address) -> List[dict]:
+        """Events of the day that change the address, in replay order."""
+        if self.event_index is not None:
+            # Only the address's events are read, from the day's event columns if current
+            return get_events_at(
+                [
+                    position
+                    for position in self.event_index.get_positions(address)
+                    if position[0] == day_index
+                ]
+            )
+        if day_index not in self._address_events:
+            address_events = defaultdict(list)
+            block_number_to_events = read_combined_sorted_events(day_index)
+            for block_number in sorted(block_number_to_events.keys()):
+                for event in block_number_to_events[block_number]:
+                    for event_address in get_event_addresses(event):
+                        address_events[event_address].append(event)
+            self._address_events[day_index] = address_events
+        return self._address_events[day_index].get(address, [])
+
+    def state_at(self, address, block_number) -> UserState:
+        address = normalize_address(address)
+        day_index = self.get_day_index(block_number)
+        if day_index == -1:
+            return UserState()
+
+        start_state = self.get_start_state(day_index).get(address)
+        user_state = defaultdict(UserState)
+        if start_state is not None:
+            user_state[address] = start_state.copy()
+        date = get_day_date(day_index)
+        for event in self.get_address_events(day_index, address):
+            if event["blockNumber"] > block_number:
+                break
+            user_state = process_event_above_user_state(
+                get_event_for_address(event, address), user_state, date
+            )
+        return user_state[address]
+
+    def holders_at(self, block_number) -> Dict[str, UserState]:
+        """Addresses with a vault balance or an NFT at the block."""
+        day_index = self.get_day_index(block_number)
+        if day_index == -1:
+            return {}
+
+        user_state = defaultdict(UserState)
+        for address, state in self.get_start_state(day_index).items():
+            user_state[address] = state.copy()
+        date = get_day_date(day_index)
+        block_number_to_events = read_combined_sorted_events(day_index)
+        for event_block_number in sorted(block_number_to_events.keys()):
+            if event_block_number > block_number:
+                break
+            for event in block_number_to_events[event_block_number]:
+                user_state = process_event_above_user_state(event, user_state, date)
+        return {
+            address: state
+            for address, state in user_state.items()
+            if state.balance > 0 or state.has_nft
+        }
+
+
+def get_state_json(state: UserState) -> dict:
+    return {
+        "balance": state.balance,
+        "nft_ids": list(state.nft_ids),
+        "last_positive_balance_update_day": state.last_positive_balance_update_day,
+        "last_negative_balance_update_day": state.last_negative_balance_update_day,
+    }
+
+
+def state_at(address, block_number) -> UserState:
+    return StateQuery().state_at(address, block_number)
+
+
+def holders_at(block_number) -> Dict[str, UserState]:
+    return StateQuery().holders_at(block_number)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Vault balance and NFTs at a block, from local data"
+    )
+    parser.add_argument("block", type=int, help="State after this block")
+    parser.add_argument(
+        "addresses", nargs="*", help="Addresses to query (default: all holders)"
+    )
+    args = parser.parse_args()
+
+    query = StateQuery()
+    if args.addresses:
+        result = {
+            normalize_address(address): get_state_json(query.state_at(address, args.block))
+            for address in args.addresses
+        }
+    else:
+        result = {
+            address: get_state_json(state)
+            for address, state in query.holders_at(args.block).items()
+        }
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+ZERO_ADDRESS = "0x" + "0" * 40
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class SyntheticChainConfig:
+    def __init__(
+        self,
+        days: int = 10,
+        users: int = 1000,
+        events_per_day: int = 200,
+        blocks_per_day: int = 7200,
+        nft_holder_ratio: float = 0.3,
+        nft_event_ratio: float = 0.1,
+        snapshot_day: int = None,
+        first_block: int = 23_000_000,
+        first_day: str = "2025-09-01",
+        seed: int = 0,
+    ):
+        self.days = days
+        self.users = users
+        self.events_per_day = events_per_day
+        self.blocks_per_day = blocks_per_day
+        self.nft_holder_ratio = nft_holder_ratio
+        self.nft_event_ratio = nft_event_ratio
+        # Day whose start state is used as LP balances snapshot, defaults to the middle day
+        self.snapshot_day = days // 2 if snapshot_day is None else snapshot_day
+        self.first_block = first_block
+        self.first_day = first_day
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class _SyntheticChain:
+    """Keeps balances and NFT owners while events are generated, so every event is valid"""
+
+    def __init__(self, config: SyntheticChainConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.users = [self._random_address() for _ in range(config.users)]
+        self.nft_address = self._random_address()
+        self.pilot_vault_address = self._random_address()
+        self.balances = {user: 0 for user in self.users}
+        self.last_positive_balance_update_day = {user: "" for user in self.users}
+        self.last_negative_balance_update_day = {user: "" for user in self.users}
+        self.token_owner = {}
+        self.next_token_id = 1
+        self.nft_holders = self.rng.sample(
+            self.users, round(config.users * config.nft_holder_ratio)
+        )
+
+    def _random_address(self):
+        return "0x" + "".join(self.rng.choice("0123456789abcdef") for _ in range(40))
+
+    def _random_hash(self):
+        return "".join(self.rng.choice("0123456789abcdef") for _ in range(64))
+
+    def get_day(self, day_index):
+        return str(
+            datetime.fromisoformat(self.config.first_day).date()
+            + timedelta(days=day_index)
+        )
+
+    def get_start_block(self, day_index):
+        return self.config.first_block + day_index * self.config.blocks_per_day
+
+    def get_block_info(self, block_number):
+        day_index = (block_number - self.config.first_block) // self.config.blocks_per_day
+        midnight = datetime.fromisoformat(self.get_day(day_index)).replace(
+            tzinfo=timezone.utc
+        )
+        seconds = (
+            (block_number - self.get_start_block(day_index))
+            * SECONDS_PER_DAY
+            // self.config.blocks_per_day
+        )
+        timestamp = int(midnight.timestamp()) + seconds
+        return {
+            "number": block_number,
+            "timestamp": timestamp,
+            "utc_datetime": datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat(),
+            "hash": self._random_hash(),
+        }
+
+    def generate_day_events(self, day_index):
+        start_block = self.get_start_block(day_index)
+        end_block = start_block + self.config.blocks_per_day - 1
+        day = self.get_day(day_index)
+
+        # Every NFT holder gets a token with the first events of the chain
+        mints = []
+        if day_index == 0:
+            mints = list(self.nft_holders)
+        events_amount = self.config.events_per_day + len(mints)
+
+        block_numbers = sorted(
+            self.rng.randint(start_block, end_block) for _ in range(events_amount)
+        )
+        transfer_events, nft_events = [], []
+        for log_index, block_number in enumerate(block_numbers):
+            position = {
+                "blockNumber": block_number,
+                "transactionHash": self._random_hash(),
+                "logIndex": log_index,
+                # Replay orders events by transaction and log index, keep generation order
+                "transactionIndex": log_index,
+            }
+            if mints:
+                nft_events.append({**position, "args": self._mint_nft(mints.pop())})
+            elif self.token_owner and self.rng.random() < self.config.nft_event_ratio:
+                nft_events.append({**position, "args": self._transfer_nft()})
+            else:
+                transfer_events.append({**position, "args": self._transfer(day)})
+        return transfer_events, nft_events
+
+    def _mint_nft(self, to_addr):
+        token_id = self.next_token_id
+        self.next_token_id += 1
+        self.token_owner[token_id] = to_addr
+        return {"from": ZERO_ADDRESS, "to": to_addr, "tokenId": token_id}
+
+    def _transfer_nft(self):
+        token_id = self.rng.choice(list(self.token_owner.keys()))
+        from_addr = self.token_owner[token_id]
+        to_addr = self.rng.choice(self.users)
+        self.token_owner[token_id] = to_addr
+        return {"from": from_addr, "to": to_addr, "tokenId": token_id}
+
+    def _transfer(self, day):
+        holders = [user for user, balance in self.balances.items() if balance > 0]
+        kind = self.rng.random()
+        if not holders or kind < 0.4:
+            # Deposit
+            from_addr, to_addr = ZERO_ADDRESS, self.rng.choice(self.users)
+            value = self.rng.randint(10**15, 10**22)
+        elif kind < 0.6:
+            # Withdrawal
+            from_addr, to_addr = self.rng.choice(holders), ZERO_ADDRESS
+            value = self.rng.randint(0, self.balances[from_addr])
+        else:
+            from_addr, to_addr = self.rng.choice(holders), self.rng.choice(self.users)
+            value = self.rng.randint(0, self.balances[from_addr])
+
+        if from_addr != ZERO_ADDRESS:
+            self.balances[from_addr] -= value
+            self.last_negative_balance_update_day[from_addr] = day
+        if to_addr != ZERO_ADDRESS:
+            self.balances[to_addr] += value
+            self.last_positive_balance_update_day[to_addr] = day
+        return {"from": from_addr, "to": to_addr, "value": value}
+
+    def get_lp_balances_snapshot(self, day_index):
+        nft_ids = {}
+        for token_id, owner in self.token_owner.items():
+            nft_ids.setdefault(owner, []).append(token_id)
+        balances = {
+            user: {
+                "balance": self.balances[user],
+                "last_positive_balance_update_day": self.last_positive_balance_update_day[user],
+                "last_negative_balance_update_day": self.last_negative_balance_update_day[user],
+            }
+            for user in self.users
+            if self.balances[user] > 0
+            or self.last_positive_balance_update_day[user] != ""
+            or self.last_negative_balance_update_day[user] != ""
+        }
+        return {
+            "start_block": self.get_start_block(day_index),
+            "end_block": self.get_start_block(day_index) + self.config.blocks_per_day - 1,
+            "date": self.get_day(day_index),
+            "day_index": day_index,
+            "nft": {"start_state": nft_ids},
+            "pilot_vault": {"start_state": balances},
+        }
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def _get_events_file(contract_address, start_block, end_block, events):
+    return {
+        "error": False,
+        "metadata": {
+            "contractAddress": contract_address,
+            "eventName": "Transfer",
+            "startBlock": start_block,
+            "endBlock": end_block,
+            "totalEvents": len(events),
+            "exportedAt": datetime.now().isoformat(),
+        },
+        "events": events,
+    }
+
+
+def generate_synthetic_chain(root: str, config: SyntheticChainConfig):
+    """
+    Write data/deployment_blocks.json, data/days_blocks, data/events/{nft,pilot_vault}
+    and data/lp_balances_snapshot.json under root, in the format the pipeline produces.
+    """
+    chain = _SyntheticChain(config)
+    data_dir = os.path.join(root, "data")
+
+    deployment = chain.get_block_info(config.first_block)
+    _write_json(
+        os.path.join(data_dir, "deployment_blocks.json"),
+        {
+            "deployments": {
+                name: {
+                    "address": address,
+                    "deployment_block": config.first_block,
+                    "block_number": config.first_block,
+                    "timestamp": deployment["timestamp"],
+                    "datetime": deployment["utc_datetime"],
+                    "hash": deployment["hash"],
+                }
+                for name, address in (
+                    ("nft", chain.nft_address),
+                    ("pilot_vault", chain.pilot_vault_address),
+                )
+            }
+        },
+    )
+
+    for day_index in range(config.days):
+        if day_index == config.snapshot_day:
+            _write_json(
+                os.path.join(data_dir, "lp_balances_snapshot.json"),
+                chain.get_lp_balances_snapshot(day_index),
+            )
+
+        start_block = chain.get_start_block(day_index)
+        end_block = start_block + config.blocks_per_day - 1
+        day = chain.get_day(day_index)
+        _write_json(
+            os.path.join(data_dir, "days_blocks", f"{day_index}_{day}.json"),
+            {
+                "day": day,
+                "last_block_of_day": chain.get_block_info(end_block),
+                "first_block_of_next_day": chain.get_block_info(end_block + 1),
+                "is_final_day": False,
+            },
+        )
+
+        transfer_events, nft_events = chain.generate_day_events(day_index)
+        _write_json(
+            os.path.join(data_dir, "events", "pilot_vault", f"{day_index}.json"),
+            _get_events_file(chain.pilot_vault_address, start_block, end_block, transfer_events),
+        )
+        _write_json(
+            os.path.join(data_dir, "events", "nft", f"{day_index}.json"),
+            _get_events_file(chain.nft_address, start_block, end_block, nft_events),
+        )
+
+    if config.snapshot_day >= config.days:
+        _write_json(
+            os.path.join(data_dir, "lp_balances_snapshot.json"),
+            chain.get_lp_balances_snapshot(config.days),
+        )
+
+
+def add_config_arguments(parser):
+    defaults = SyntheticChainConfig()
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--events-per-day", type=int, default=defaults.events_per_day)
+    parser.add_argument("--blocks-per-day", type=int, default=defaults.blocks_per_day)
+    parser.add_argument("--nft-holder-ratio", type=float, default=defaults.nft_holder_ratio)
+    parser.add_argument("--nft-event-ratio", type=float, default=defaults.nft_event_ratio)
+    parser.add_argument("--snapshot-day", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def get_config_from_arguments(args) -> SyntheticChainConfig:
+    return SyntheticChainConfig(
+        days=args.days,
+        users=args.users,
+        events_per_day=args.events_per_day,
+        blocks_per_day=args.blocks_per_day,
+        nft_holder_ratio=args.nft_holder_ratio,
+        nft_event_ratio=args.nft_event_ratio,
+        snapshot_day=args.snapshot_day,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic data/ tree for benchmarks and tests"
+    )
+    parser.add_argument("root", help="Directory to create the data/ tree in")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    generate_synthetic_chain(args.root, get_config_from_arguments(args))
+    print(f"Synthetic chain written to {os.path.join(args.root, 'data')}")
@@ -0,0 +1,15 @@
+import sys
+from functools import lru_cache
+
+# Enough for every address of the vault and NFT contracts, while a process
+# normalizing more distinct addresses does not grow without bound
+NORMALIZED_ADDRESSES_CACHE_SIZE = 2**20
+
+
+@lru_cache(maxsize=NORMALIZED_ADDRESSES_CACHE_SIZE)
+def normalize_address(address: str) -> str:
+    """
+    The address lowercased. Every address is lowercased once and interned, so events
+    and user states loaded from different files share the same string objects.
+    """
+    return sys.intern(address.lower())
@@ -1,6 +1,15 @@
+from hexbytes import HexBytes
 from web3 import Web3
+from web3.datastructures import AttributeDict
+from web3.exceptions import BlockNotFound
 from collections import defaultdict
+from collections.abc import Mapping
+from concurrent.futures import Future, as_completed
 from typing import Optional
+import hashlib
+import json
+import os
+import queue
 import threading
 
 w3_instances = [
@@ -9,53 +18,66 @@ w3_instances = [
     Web3(Web3.HTTPProvider("https://eth.drpc.org")),
 ]
 
+DEFAULT_MAX_IN_FLIGHT = 4
+
+# Calls waiting for a provider's workers before submitting more blocks
+MAX_QUEUED_CALLS = 256
+
+# Calls per JSON-RPC batch request, public providers reject large batches
+MAX_BATCH_SIZE = 50
+BLOCK_HEADER_FIELDS = ("number", "hash", "parentHash", "timestamp")
+
+# Provider endpoint -> most requests in flight to it, DEFAULT_MAX_IN_FLIGHT if not set
+provider_max_in_flight: dict[str, int] = {}
+# Provider endpoint -> calls that returned before it answered
+provider_lags: dict[str, int] = defaultdict(int)
+provider_lags_lock = threading.Lock()
+
+def encode_json_value(value):
+    if isinstance(value, bytes):
+        return "0x" + value.hex()
+    # AttributeDict is a Mapping but not a dict
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, tuple):
+        return list(value)
+    return repr(value)
+
+def get_result_digest(result) -> bytes:
+    """
+    Digest of a result from its canonical JSON encoding, equal for equal results.
+
+    Dict keys are sorted, so AttributeDicts and dicts with the same items in another
+    order have the same digest. bytes (HexBytes) are encoded as hex strings, other
+    values json does not encode by their repr. web3's HTTPProvider does not expose
+    the response bytes, so the parsed JSON-RPC result is hashed. Calls that return
+    it as is, like make_raw_request, leave only the winning result to be decoded.
+    """
+    encoded = json.dumps(
+        [type(result).__name__, result],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=encode_json_value,
+    )
+    return hashlib.blake2b(encoded.encode(), digest_size=32).digest()
+
 class RequestResult:
-    def __init__(self, result, error):
+    """Result or error of a call to one provider, results are compared by their digest"""
+
+    def __init__(self, result, error, provider: Optional[str] = None):
         self.result = result
         self.error: Optional[Exception] = error
+        # Endpoint the result came from, not compared
+        self.provider = provider
+        self.digest = get_result_digest(result) if error is None else None
 
     def __eq__(self, other):
         if not isinstance(other, RequestResult):
             return False
-        # Deep comparison for dicts and lists, normal for primitives
-        if type(self.result) != type(other.result):
-            return False
-        # Compare content, not just address, via recursive structural equality for dicts/lists
-        def deep_equal(a, b):
-            if isinstance(a, dict) and isinstance(b, dict):
-                if set(a.keys()) != set(b.keys()):
-                    return False
-                for k in a:
-                    if not deep_equal(a[k], b[k]):
-                        return False
-                return True
-            elif isinstance(a, list) and isinstance(b, list):
-                if len(a) != len(b):
-                    return False
-                for x, y in zip(a, b):
-                    if not deep_equal(x, y):
-                        return False
-                return True
-            else:
-                return a == b
-
-        if not deep_equal(self.result, other.result):
-            return False
-        return self.error == other.error
+        return self.digest == other.digest and self.error == other.error
 
     def __hash__(self):
-        def deep_hash(obj):
-            if isinstance(obj, dict):
-                # Hash based only on its content, independent of order
-                return hash(frozenset((k, deep_hash(v)) for k, v in obj.items()))
-            elif isinstance(obj, list):
-                # Hash based on the hashes of its items
-                return hash(tuple(deep_hash(x) for x in obj))
-            else:
-                return hash(obj)
-        result_hash = deep_hash(self.result)
-        error_hash = hash(self.error)
-        return hash((result_hash, error_hash))
+        return hash((self.digest, self.error))
 
     def __repr__(self):
         # Pretty-print the result and error, with introspection for deeply nested dicts/lists
@@ -70,6 +92,25 @@ class RequestResult:
         # Use __repr__ for str, for pretty printing in print()
         return self.__repr__()
 
+class NoQuorumError(ValueError):
+    """No result was returned by a majority of the providers"""
+
+    def __init__(self, result_to_amount: dict[RequestResult, int]):
+        super().__init__(f"No result found, results: {result_to_amount}")
+        self.results = list(result_to_amount.keys())
+        self.result_to_amount = dict(result_to_amount)
+
+    def get_errors(self) -> list[Exception]:
+        return [result.error for result in self.results if result.error is not None]
+
+    def get_provider_errors(self) -> list[tuple[Optional[str], Exception]]:
+        """(provider endpoint, error) of every provider that returned an error"""
+        return [
+            (result.provider, result.error)
+            for result in self.results
+            if result.error is not None
+        ]
+
 def create_contract_instances(w3_instances, address, abi):
     contract_instances = []
     address = Web3.to_checksum_address(address)
@@ -86,23 +127,208 @@ def return_result_or_raise(result_to_amount: dict[RequestResult, int]):
                 raise result.error
             return result.result
     
-    raise ValueError(f"No result found, results: {result_to_amount}")
+    raise NoQuorumError(result_to_amount)
+
+class ProviderExecutor:
+    """
+    Long-lived worker threads making the calls of one provider, one per request in flight.
+
+    web3 keeps an HTTP session per thread and endpoint, so the workers reuse their
+    sessions and connections across calls. submit() blocks while MAX_QUEUED_CALLS
+    calls are waiting.
+    """
+
+    def __init__(self, provider: str, max_in_flight: int):
+        self.calls = queue.Queue(maxsize=MAX_QUEUED_CALLS)
+        self.workers = [
+            threading.Thread(target=self._work, name=f"{provider}-{i}", daemon=True)
+            for i in range(max_in_flight)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def _work(self):
+        while True:
+            call = self.calls.get()
+            if call is None:
+                return
+            future, function, instance = call
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(instance))
+            except Exception as e:
+                future.set_exception(e)
+
+    def submit(self, function, instance) -> Future:
+        future = Future()
+        self.calls.put((future, function, instance))
+        return future
+
+    def shutdown(self):
+        """Stop the workers once the queued calls are made"""
+        for _ in self.workers:
+            self.calls.put(None)
 
-def make_call(i, results, instance, function):
+provider_executors: dict[str, ProviderExecutor] = {}
+provider_executors_lock = threading.Lock()
+
+def reset_provider_executors_in_child():
+    """
+    A forked process has none of the workers, its executors are created again on use.
+    Locks a worker held at the fork would never be released, so they are created
+    again too, and the lag counters start from zero.
+    """
+    global provider_executors_lock, provider_lags_lock
+    provider_executors_lock = threading.Lock()
+    provider_executors.clear()
+    provider_lags_lock = threading.Lock()
+    provider_lags.clear()
+
+os.register_at_fork(after_in_child=reset_provider_executors_in_child)
+
+def get_provider_key(instance) -> str:
+    """Endpoint of a Web3 or contract instance, contracts of one provider share its limit"""
+    w3 = getattr(instance, "w3", instance)
+    return getattr(w3.provider, "endpoint_uri", None) or repr(w3.provider)
+
+def set_provider_limit(provider: str, max_in_flight: int):
+    with provider_executors_lock:
+        provider_max_in_flight[provider] = max_in_flight
+        executor = provider_executors.pop(provider, None)
+    # Calls already queued are still made, new calls go to a new executor
+    if executor is not None:
+        executor.shutdown()
+
+def get_provider_executor(provider: str) -> ProviderExecutor:
+    with provider_executors_lock:
+        if provider not in provider_executors:
+            provider_executors[provider] = ProviderExecutor(
+                provider, provider_max_in_flight.get(provider, DEFAULT_MAX_IN_FLIGHT)
+            )
+        return provider_executors[provider]
+
+def shutdown_provider_executors():
+    with provider_executors_lock:
+        executors = list(provider_executors.values())
+        provider_executors.clear()
+    for executor in executors:
+        executor.shutdown()
+
+def get_request_result(future: Future, provider: Optional[str] = None) -> RequestResult:
     try:
-        result = function(instance)
-        results[i] = RequestResult(result, None)
+        return RequestResult(future.result(), None, provider)
     except Exception as e:
-        results[i] = RequestResult(None, e)
+        return RequestResult(None, e, provider)
+
+def record_lagging_providers(providers: list[str]):
+    with provider_lags_lock:
+        for provider in providers:
+            provider_lags[provider] += 1
 
 def make_aggregated_call(instances, function):
-    results = [None] * len(instances)
+    """
+    Result of function on every instance that a majority of the instances agree on.
+
+    Returns as soon as a majority of identical results arrived. Calls of the other
+    providers that have not started are cancelled, the rest are left to finish and
+    ignored, and the providers are counted in provider_lags. Without a majority the
+    results of all providers decide as in return_result_or_raise.
+    """
     results_amount = defaultdict(lambda: 0)
-    
-    threads = [threading.Thread(target=make_call, args=(i, results, instance, function)) for i, instance in enumerate(instances)]
-    for thread in threads:
-        thread.start()
-    for i, thread in enumerate(threads):
-        thread.join()
-        results_amount[results[i]] += 1
+    quorum = len(instances) // 2 + 1
+
+    future_to_provider = {}
+    for instance in instances:
+        provider = get_provider_key(instance)
+        future_to_provider[get_provider_executor(provider).submit(function, instance)] = provider
+    for future in as_completed(future_to_provider):
+        result = get_request_result(future, future_to_provider[future])
+        results_amount[result] += 1
+        if results_amount[result] >= quorum:
+            lagging = [f for f in future_to_provider if not f.done()]
+            for f in lagging:
+                f.cancel()
+            record_lagging_providers([future_to_provider[f] for f in lagging])
+            if result.error is not None:
+                raise result.error
+            return result.result
     return return_result_or_raise(results_amount)
+
+def make_raw_request(w3, method, params):
+    """Result of a JSON-RPC request as the provider sent it, without web3's decoding"""
+    response = w3.provider.make_request(method, params)
+    if "error" in response:
+        raise ValueError(response["error"])
+    return response["result"]
+
+def get_block_number(instances=None) -> int:
+    """Latest block number the providers agree on, decoded once from the winning result"""
+    if instances is None:
+        instances = w3_instances
+    return int(make_aggregated_call(instances, lambda w3: make_raw_request(w3, "eth_blockNumber", [])), 16)
+
+def make_batch_request(w3, method, params_list) -> list:
+    """
+    Results of a single JSON-RPC batch request calling method with every params of
+    params_list. Providers without batch requests (web3 6) get one request per params.
+    """
+    if not hasattr(w3.provider, "make_batch_request"):
+        responses = [w3.provider.make_request(method, params) for params in params_list]
+    else:
+        responses = w3.provider.make_batch_request([(method, params) for params in params_list])
+    # A batch that fails as a whole returns a single error response
+    if not isinstance(responses, list):
+        raise ValueError(responses.get("error", responses))
+    if len(responses) != len(params_list):
+        raise ValueError(
+            f"Batch of {len(params_list)} {method} requests returned {len(responses)} responses"
+        )
+    for response in responses:
+        if "error" in response:
+            raise ValueError(response["error"])
+        if "result" not in response:
+            raise ValueError(f"{method} response without a result: {response}")
+    return [response["result"] for response in responses]
+
+def get_raw_block_headers(w3, block_numbers) -> list[dict]:
+    blocks = make_batch_request(
+        w3, "eth_getBlockByNumber", [[hex(block_number), False] for block_number in block_numbers]
+    )
+    if len(blocks) != len(block_numbers):
+        raise ValueError(f"Got {len(blocks)} blocks for {len(block_numbers)} block numbers")
+    headers = []
+    for block_number, block in zip(block_numbers, blocks):
+        if block is None:
+            raise BlockNotFound(f"Block with id: '{block_number}' not found.")
+        if int(block["number"], 16) != block_number:
+            raise ValueError(f"Got block {int(block['number'], 16)} for block {block_number}")
+        headers.append({field: block[field] for field in BLOCK_HEADER_FIELDS})
+    return headers
+
+def get_blocks(block_numbers, instances=None) -> list[AttributeDict]:
+    """
+    Headers of the blocks (number, hash, parentHash, timestamp), like w3.eth.get_block.
+
+    Every MAX_BATCH_SIZE blocks are fetched with one JSON-RPC batch request per
+    provider, and the providers vote on the whole batch as in make_aggregated_call.
+    """
+    if instances is None:
+        instances = w3_instances
+    block_numbers = list(block_numbers)
+    blocks = []
+    for i in range(0, len(block_numbers), MAX_BATCH_SIZE):
+        batch = block_numbers[i : i + MAX_BATCH_SIZE]
+        headers = make_aggregated_call(instances, lambda w3: get_raw_block_headers(w3, batch))
+        blocks += [
+            AttributeDict(
+                {
+                    "number": int(header["number"], 16),
+                    "hash": HexBytes(header["hash"]),
+                    "parentHash": HexBytes(header["parentHash"]),
+                    "timestamp": int(header["timestamp"], 16),
+                }
+            )
+            for header in headers
+        ]
+    return blocks
@@ -0,0 +1,235 @@
+import json
+import os
+import re
+import threading
+from .aggregated_w3_request import NoQuorumError, get_provider_key
+
+RPC_LIMITS_FILE = "data/rpc_limits.json"
+
+DEFAULT_CHUNK_SIZE = 10000
+MAX_CHUNK_SIZE = 1_000_000
+CHUNK_SIZE_INCREASE = 5000
+
+# A result limit grows by this share after a window close to it succeeds
+RESULT_LIMIT_INCREASE = 0.1
+
+# getLogs limit errors of providers, result size errors are checked before range
+# errors since some providers mention both
+RESULT_SIZE_ERROR_PATTERNS = (
+    r"returned more than \d+ results",
+    r"log response size exceeded",
+    r"response size (is )?(too large|exceeded)",
+    r"too many logs",
+)
+RANGE_ERROR_PATTERNS = (
+    r"block range",
+    r"range (is )?too (large|wide)",
+    r"ranges over \d+ blocks",
+    r"limited to a [\d,]+ (block )?range",
+)
+# Rate limits and timeouts say nothing about the limits of a window
+TRANSIENT_ERROR_PATTERNS = (r"\b429\b", r"too many requests", r"rate limit", r"time(d)? ?out")
+
+rpc_limits_lock = threading.Lock()
+
+
+def get_default_limits() -> dict:
+    return {
+        "chunk_size": DEFAULT_CHUNK_SIZE,
+        "max_chunk_size": MAX_CHUNK_SIZE,
+        "max_results": None,
+    }
+
+
+def get_provider_errors(error) -> list[tuple]:
+    """
+    (provider, error) of the providers' errors, for a failed quorum those of every
+    provider. The provider is None for an error of all providers.
+    """
+    if isinstance(error, NoQuorumError):
+        return error.get_provider_errors()
+    return [(None, error)]
+
+
+def _matches(patterns, provider_error) -> bool:
+    message = str(provider_error).lower()
+    return any(re.search(pattern, message) for pattern in patterns)
+
+
+def is_transient_error(provider_error) -> bool:
+    return isinstance(provider_error, TimeoutError) or _matches(
+        TRANSIENT_ERROR_PATTERNS, provider_error
+    )
+
+
+def is_provider_result_size_error(provider_error) -> bool:
+    return not is_transient_error(provider_error) and _matches(
+        RESULT_SIZE_ERROR_PATTERNS, provider_error
+    )
+
+
+def is_provider_range_error(provider_error) -> bool:
+    return (
+        not is_transient_error(provider_error)
+        and not is_provider_result_size_error(provider_error)
+        and _matches(RANGE_ERROR_PATTERNS, provider_error)
+    )
+
+
+def is_transient(error) -> bool:
+    """Whether every provider error is a rate limit or timeout, the window is retried as is"""
+    provider_errors = get_provider_errors(error)
+    return len(provider_errors) > 0 and all(
+        is_transient_error(provider_error) for _, provider_error in provider_errors
+    )
+
+
+def is_result_size_error(error) -> bool:
+    return any(
+        is_provider_result_size_error(provider_error)
+        for _, provider_error in get_provider_errors(error)
+    )
+
+
+def is_range_error(error) -> bool:
+    return any(
+        is_provider_range_error(provider_error)
+        for _, provider_error in get_provider_errors(error)
+    )
+
+
+def read_rpc_limits(limits_file) -> dict:
+    if not os.path.exists(limits_file):
+        return {}
+    with open(limits_file, "r") as f:
+        return json.load(f)
+
+
+class ChunkSizeController:
+    """
+    getLogs window size for a set of providers, adjusted AIMD-style.
+
+    A window that succeeds at the current size grows it by CHUNK_SIZE_INCREASE blocks,
+    a failed window halves it for the providers that failed other than by a rate
+    limit or timeout. getLogs limit errors
+    that name the block range lower the provider's range limit, those that name the
+    response size lower its result limit once the failed window's result count is
+    known, and successful windows close to the result limit raise it again. Rate
+    limits and timeouts change no limit. Limits are kept per provider in
+    data/rpc_limits.json, and a window is sized by the lowest limit of its
+    providers, since every window is requested from all of them.
+    """
+
+    def __init__(self, providers, limits_file: str = RPC_LIMITS_FILE):
+        self.providers = sorted(set(providers))
+        self.limits_file = limits_file
+        self.lock = threading.Lock()
+        saved_limits = read_rpc_limits(limits_file)
+        self.limits = {
+            provider: {**get_default_limits(), **saved_limits.get(provider, {})}
+            for provider in self.providers
+        }
+
+    def _get_limit(self, key):
+        values = [
+            limits[key] for limits in self.limits.values() if limits[key] is not None
+        ]
+        return min(values) if len(values) > 0 else None
+
+    def _update_limits(self, update):
+        for limits in self.limits.values():
+            update(limits)
+
+    def _update_failed_limits(self, error, update):
+        """update(limits, provider_error) for the limits of every provider that failed"""
+        for provider, provider_error in get_provider_errors(error):
+            if provider in self.limits:
+                update(self.limits[provider], provider_error)
+            else:
+                for limits in self.limits.values():
+                    update(limits, provider_error)
+
+    def get_chunk_size(self, density: float = None) -> int:
+        """Window size, for density results per block at most the result limit"""
+        with self.lock:
+            chunk_size = min(
+                self._get_limit("chunk_size"), self._get_limit("max_chunk_size")
+            )
+            max_results = self._get_limit("max_results")
+        if max_results is not None and density:
+            chunk_size = min(chunk_size, int(max_results / density))
+        return max(chunk_size, 1)
+
+    def on_success(self, window_size: int, results_amount: int = 0):
+        def update(limits):
+            if window_size >= limits["chunk_size"]:
+                limits["chunk_size"] = min(
+                    window_size + CHUNK_SIZE_INCREASE, limits["max_chunk_size"]
+                )
+            max_results = limits["max_results"]
+            # A window with few results says nothing about the result limit
+            if max_results is not None and results_amount > max_results // 2:
+                limits["max_results"] = max(max_results, results_amount) + max(
+                    int(max_results * RESULT_LIMIT_INCREASE), 1
+                )
+
+        with self.lock:
+            self._update_limits(update)
+
+    def on_failure(self, window_size: int, error):
+        def update(limits, provider_error):
+            if is_transient_error(provider_error):
+                return
+            limits["chunk_size"] = max(
+                min(limits["chunk_size"], window_size // 2), 1
+            )
+            if is_provider_range_error(provider_error):
+                limits["max_chunk_size"] = max(
+                    min(limits["max_chunk_size"], window_size - 1), 1
+                )
+
+        with self.lock:
+            self._update_failed_limits(error, update)
+
+    def on_result_limit(self, results_amount: int, error):
+        """
+        A window failed with error and turned out to have results_amount results,
+        lower the result limit of the providers whose error was about the result size.
+        """
+        # Not a result size limit if the window has no results
+        if results_amount == 0:
+            return
+
+        def update(limits, provider_error):
+            if not is_provider_result_size_error(provider_error):
+                return
+            if limits["max_results"] is None or results_amount <= limits["max_results"]:
+                limits["max_results"] = max(results_amount - 1, 1)
+
+        with self.lock:
+            self._update_failed_limits(error, update)
+
+    def save(self):
+        with rpc_limits_lock:
+            rpc_limits = read_rpc_limits(self.limits_file)
+            with self.lock:
+                for provider, limits in self.limits.items():
+                    rpc_limits[provider] = dict(limits)
+            os.makedirs(os.path.dirname(self.limits_file), exist_ok=True)
+            tmp_file = self.limits_file + ".tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(rpc_limits, f, indent=2)
+            os.replace(tmp_file, self.limits_file)
+
+
+# Sorted provider endpoints -> controller, windows of concurrent days share their limits
+chunk_size_controllers: dict[tuple, ChunkSizeController] = {}
+chunk_size_controllers_lock = threading.Lock()
+
+
+def get_chunk_size_controller(instances) -> ChunkSizeController:
+    providers = tuple(sorted({get_provider_key(instance) for instance in instances}))
+    with chunk_size_controllers_lock:
+        if providers not in chunk_size_controllers:
+            chunk_size_controllers[providers] = ChunkSizeController(providers)
+        return chunk_size_controllers[providers]
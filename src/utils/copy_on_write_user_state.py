@@ -0,0 +1,92 @@
+from collections.abc import MutableMapping
+from typing import Dict
+from .process_event_above_user_state import UserState
+
+
+class CopyOnWriteUserState(MutableMapping):
+    """
+    User state of a day on top of the state before the day, which is shared and never mutated.
+
+    Like defaultdict(UserState), user_state[address] returns a mutable state, creating
+    it for new addresses. A shared state is cloned the first time it is accessed that
+    way, so a day only copies the users its events touch. get(), values() and items()
+    return states without cloning them, they must only be read.
+    """
+
+    def __init__(self, base: Dict[str, UserState]):
+        self.base = base
+        self.changed: Dict[str, UserState] = {}
+        self.deleted = set()
+
+    def __getitem__(self, address):
+        state = self.changed.get(address)
+        if state is not None:
+            return state
+        if address in self.base and address not in self.deleted:
+            state = self.base[address].copy()
+        else:
+            state = UserState()
+            self.deleted.discard(address)
+        self.changed[address] = state
+        return state
+
+    def __setitem__(self, address, state):
+        self.deleted.discard(address)
+        self.changed[address] = state
+
+    def __delitem__(self, address):
+        if address not in self:
+            raise KeyError(address)
+        self.changed.pop(address, None)
+        if address in self.base:
+            self.deleted.add(address)
+
+    def __contains__(self, address):
+        return address in self.changed or (
+            address in self.base and address not in self.deleted
+        )
+
+    def __iter__(self):
+        # Same order as a deep copy of the base state that events were applied to
+        for address in self.base:
+            if address not in self.deleted:
+                yield address
+        for address in self.changed:
+            if address not in self.base:
+                yield address
+
+    def __len__(self):
+        new_addresses_amount = sum(
+            1 for address in self.changed if address not in self.base
+        )
+        return len(self.base) - len(self.deleted) + new_addresses_amount
+
+    def get(self, address, default=None):
+        state = self.changed.get(address)
+        if state is not None:
+            return state
+        if address in self.base and address not in self.deleted:
+            return self.base[address]
+        return default
+
+    def values(self):
+        return [self.get(address) for address in self]
+
+    def items(self):
+        return [(address, self.get(address)) for address in self]
+
+    def get_changed_addresses(self) -> list[str]:
+        """Addresses changed or deleted on top of the base state, a deleted address is never changed."""
+        return list(self.changed.keys()) + list(self.deleted)
+
+    def commit(self) -> Dict[str, UserState]:
+        """
+        Apply the changes to the base state and return it. The base state is the
+        state after the day from then on, so the state before the day is lost.
+        """
+        for address in self.deleted:
+            del self.base[address]
+        self.base.update(self.changed)
+        self.changed = {}
+        self.deleted = set()
+        return self.base
@@ -0,0 +1,119 @@
+from collections import defaultdict
+from typing import Dict
+from .event_type import EventType
+from .address_table import normalize_address
+from .day_ordinal import day_to_ordinal
+from .process_event_above_user_state import ZERO_ADDRESS, UserState, move_token
+from .read_combined_sorted_events import read_combined_sorted_events
+from .get_additional_data import (
+    get_start_block_for_day,
+    get_end_block_for_day,
+    get_day_date,
+)
+
+
+class DayDelta:
+    """
+    Net effect of a day's events, computed without the state before the day.
+
+    Balances change by the sum of the day's transfers. The lowest running sum of a
+    user's transfers is kept, since the balance must not be negative after any of them.
+    An NFT moves from the first sender of the day to the last receiver, intermediate
+    owners hold it only within the day.
+    """
+
+    def __init__(self, day_index, date, start_block, end_block):
+        self.day_index = day_index
+        self.date = date
+        self.start_block = start_block
+        self.end_block = end_block
+        # Users in the order the day's events first touch them
+        self.addresses: Dict[str, None] = {}
+        self.balance_changes: Dict[str, int] = defaultdict(int)
+        self.lowest_balance_changes: Dict[str, int] = {}
+        self.positive_update_addresses = set()
+        self.negative_update_addresses = set()
+        # token_id -> [first from address, last to address]
+        self.token_moves: Dict[int, list] = {}
+
+    def add_transfer_event(self, event):
+        value = event["args"]["value"]
+        from_addr = normalize_address(event["args"]["from"])
+        to_addr = normalize_address(event["args"]["to"])
+        if from_addr != ZERO_ADDRESS:
+            self.addresses.setdefault(from_addr)
+            self.balance_changes[from_addr] -= value
+            self.lowest_balance_changes[from_addr] = min(
+                self.lowest_balance_changes.get(from_addr, 0),
+                self.balance_changes[from_addr],
+            )
+            self.negative_update_addresses.add(from_addr)
+        if to_addr != ZERO_ADDRESS:
+            self.addresses.setdefault(to_addr)
+            self.balance_changes[to_addr] += value
+            self.positive_update_addresses.add(to_addr)
+
+    def add_nft_event(self, event):
+        token_id = event["args"]["tokenId"]
+        from_addr = normalize_address(event["args"]["from"])
+        to_addr = normalize_address(event["args"]["to"])
+        if from_addr != ZERO_ADDRESS:
+            self.addresses.setdefault(from_addr)
+        if to_addr != ZERO_ADDRESS:
+            self.addresses.setdefault(to_addr)
+
+        token_move = self.token_moves.get(token_id)
+        if token_move is None:
+            self.token_moves[token_id] = [from_addr, to_addr]
+            return
+        if token_move[1] != from_addr:
+            if from_addr == ZERO_ADDRESS:
+                raise ValueError(f"Token {token_id} already exists in address {token_move[1]}")
+            raise ValueError(f"Token {token_id} not found in from address {from_addr}")
+        token_move[1] = to_addr
+
+    def add_event(self, event):
+        if event["event_type"] == EventType.TRANSFER:
+            self.add_transfer_event(event)
+        elif event["event_type"] == EventType.NFT:
+            self.add_nft_event(event)
+        else:
+            raise ValueError(f"Invalid event type: {event['event_type']}")
+
+    def apply(self, user_state: Dict[str, UserState]) -> Dict[str, UserState]:
+        """Apply the day to the state before it, which gives the same state as replaying the day."""
+        for address in self.addresses:
+            user_state[address]
+
+        for address, balance_change in self.balance_changes.items():
+            address_state = user_state[address]
+            lowest_balance = address_state.balance + self.lowest_balance_changes.get(
+                address, 0
+            )
+            if lowest_balance < 0:
+                raise ValueError(f"Balance of {address} is negative: {lowest_balance}")
+            address_state.balance += balance_change
+
+        date_ordinal = day_to_ordinal(self.date)
+        for address in self.negative_update_addresses:
+            user_state[address].last_negative_balance_update_ordinal = date_ordinal
+        for address in self.positive_update_addresses:
+            user_state[address].last_positive_balance_update_ordinal = date_ordinal
+
+        for token_id, (from_addr, to_addr) in self.token_moves.items():
+            move_token(user_state, token_id, from_addr, to_addr)
+        return user_state
+
+
+def get_day_delta(day_index) -> DayDelta:
+    start_block = get_start_block_for_day(day_index)
+    end_block = get_end_block_for_day(day_index)
+    day_delta = DayDelta(day_index, get_day_date(day_index), start_block, end_block)
+
+    block_number_to_events = read_combined_sorted_events(day_index)
+    for block_number in sorted(block_number_to_events.keys()):
+        if block_number < start_block or block_number > end_block:
+            continue
+        for event in block_number_to_events[block_number]:
+            day_delta.add_event(event)
+    return day_delta
@@ -0,0 +1,20 @@
+from datetime import date
+from functools import lru_cache
+
+# Ordinal of "", the day of users that never had a balance update
+NO_DAY_ORDINAL = 0
+
+
+@lru_cache(maxsize=None)
+def day_to_ordinal(day: str) -> int:
+    """Day as a proleptic Gregorian ordinal, days are "YYYY-MM-DD" strings."""
+    if day == "":
+        return NO_DAY_ORDINAL
+    return date.fromisoformat(day).toordinal()
+
+
+@lru_cache(maxsize=None)
+def ordinal_to_day(ordinal: int) -> str:
+    if ordinal == NO_DAY_ORDINAL:
+        return ""
+    return date.fromordinal(ordinal).isoformat()
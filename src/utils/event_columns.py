@@ -0,0 +1,236 @@
+"""
+Binary columnar files of a day's events, an alternative to the JSON event files.
+
+A file holds the events of both contracts of a day, sorted by (block, transaction
+index, log index), as fixed-width little-endian columns after a 24 byte header:
+
+    magic (8 bytes), events amount n (uint64), addresses amount m (uint64)
+    block number       uint64[n]
+    value or tokenId   32 bytes[n], uint256
+    transaction index  uint32[n]
+    log index          uint32[n]
+    from id            uint32[n]
+    to id              uint32[n]
+    event type         uint8[n], EventType value
+    addresses          20 bytes[m], ids index into them
+
+Every column starts aligned to its width, so a column can be read in place with
+memoryview.cast, array or numpy.frombuffer / numpy.memmap at get_column_offsets().
+Transaction hashes are not stored.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+from collections import defaultdict
+from typing import Dict, List
+from .address_table import normalize_address
+from .event_type import EventType
+
+EVENT_COLUMNS_DIR = "data/event_columns"
+
+MAGIC = b"LTVEVC1\0"
+HEADER = struct.Struct("<8sQQ")
+VALUE_BYTES = 32
+ADDRESS_BYTES = 20
+
+EVENT_FOLDERS = {"nft": EventType.NFT, "pilot_vault": EventType.TRANSFER}
+
+# (column, item size, memoryview format), in file order
+COLUMNS = (
+    ("block_numbers", 8, "Q"),
+    ("values", VALUE_BYTES, None),
+    ("transaction_indexes", 4, "I"),
+    ("log_indexes", 4, "I"),
+    ("from_ids", 4, "I"),
+    ("to_ids", 4, "I"),
+    ("event_types", 1, "B"),
+)
+
+
+def get_event_columns_file(day_index) -> str:
+    return f"{EVENT_COLUMNS_DIR}/{day_index}.bin"
+
+
+def get_events_file(folder, day_index) -> str:
+    return f"data/events/{folder}/{day_index}.json"
+
+
+def get_column_offsets(events_amount: int) -> Dict[str, int]:
+    """Byte offset of every column and of the addresses in a file of events_amount events"""
+    offsets = {}
+    offset = HEADER.size
+    for name, item_size, _ in COLUMNS:
+        offsets[name] = offset
+        offset += item_size * events_amount
+    offsets["addresses"] = offset
+    return offsets
+
+
+class EventColumns:
+    """
+    Columns of a day's events as memoryviews over the file's buffer, without copies.
+
+    values holds the raw 32 byte values, get_value() and get_event() decode one event.
+    """
+
+    def __init__(self, buffer):
+        magic, events_amount, addresses_amount = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not an event columns file, magic {magic!r}")
+        self.events_amount = events_amount
+        view = memoryview(buffer)
+        offsets = get_column_offsets(events_amount)
+        for name, item_size, view_format in COLUMNS:
+            column = view[offsets[name] : offsets[name] + item_size * events_amount]
+            setattr(self, name, column.cast(view_format) if view_format else column)
+        raw_addresses = view[
+            offsets["addresses"] : offsets["addresses"] + ADDRESS_BYTES * addresses_amount
+        ]
+        self.addresses: List[str] = [
+            normalize_address("0x" + raw_addresses[i : i + ADDRESS_BYTES].hex())
+            for i in range(0, len(raw_addresses), ADDRESS_BYTES)
+        ]
+
+    def __len__(self):
+        return self.events_amount
+
+    def get_value(self, i) -> int:
+        return int.from_bytes(self.values[i * VALUE_BYTES : (i + 1) * VALUE_BYTES], "little")
+
+    def get_event(self, i) -> dict:
+        """Event i as read from the JSON event files, without transactionHash"""
+        event_type = EventType(self.event_types[i])
+        value_key = "tokenId" if event_type == EventType.NFT else "value"
+        return {
+            "blockNumber": self.block_numbers[i],
+            "logIndex": self.log_indexes[i],
+            "args": {
+                "from": self.addresses[self.from_ids[i]],
+                "to": self.addresses[self.to_ids[i]],
+                value_key: self.get_value(i),
+            },
+            "transactionIndex": self.transaction_indexes[i],
+            "event_type": event_type,
+        }
+
+    def find_event(self, block_number, transaction_index, log_index) -> int:
+        """Index of the event at the position, by binary search over the block numbers"""
+        i = bisect.bisect_left(self.block_numbers, block_number)
+        while i < self.events_amount and self.block_numbers[i] == block_number:
+            if (
+                self.transaction_indexes[i] == transaction_index
+                and self.log_indexes[i] == log_index
+            ):
+                return i
+            i += 1
+        raise KeyError(
+            f"No event at block {block_number}, transaction {transaction_index}, log {log_index}"
+        )
+
+
+def encode_event_columns(events: List[dict]) -> bytes:
+    """File content of events with an event_type each, in the order of the file"""
+    events = sorted(
+        events,
+        key=lambda x: (x["blockNumber"], x["transactionIndex"], x["logIndex"]),
+    )
+    address_to_id = {}
+    for event in events:
+        for key in ("from", "to"):
+            address_to_id.setdefault(normalize_address(event["args"][key]), len(address_to_id))
+
+    columns = {name: bytearray() for name, _, _ in COLUMNS}
+    for event in events:
+        args = event["args"]
+        value = args["tokenId"] if event["event_type"] == EventType.NFT else args["value"]
+        columns["block_numbers"] += event["blockNumber"].to_bytes(8, "little")
+        columns["values"] += value.to_bytes(VALUE_BYTES, "little")
+        columns["transaction_indexes"] += event["transactionIndex"].to_bytes(4, "little")
+        columns["log_indexes"] += event["logIndex"].to_bytes(4, "little")
+        columns["from_ids"] += address_to_id[normalize_address(args["from"])].to_bytes(4, "little")
+        columns["to_ids"] += address_to_id[normalize_address(args["to"])].to_bytes(4, "little")
+        columns["event_types"].append(event["event_type"].value)
+
+    return b"".join(
+        [
+            HEADER.pack(MAGIC, len(events), len(address_to_id)),
+            *(columns[name] for name, _, _ in COLUMNS),
+            *(bytes.fromhex(address[2:]) for address in address_to_id),
+        ]
+    )
+
+
+def open_event_columns(path) -> EventColumns:
+    """Columns of a file, memory-mapped read only"""
+    with open(path, "rb") as f:
+        return EventColumns(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def is_day_columns_current(day_index) -> bool:
+    """Whether the day's columns file exists and is not older than its JSON event files"""
+    path = get_event_columns_file(day_index)
+    if not os.path.exists(path):
+        return False
+    mtime_ns = os.stat(path).st_mtime_ns
+    for folder in EVENT_FOLDERS:
+        events_file = get_events_file(folder, day_index)
+        if os.path.exists(events_file) and os.stat(events_file).st_mtime_ns > mtime_ns:
+            return False
+    return True
+
+
+def write_day_columns(day_index):
+    """Write the day's columns file from its JSON event files"""
+    events = []
+    for folder, event_type in EVENT_FOLDERS.items():
+        with open(get_events_file(folder, day_index), "r") as f:
+            for event in json.load(f)["events"]:
+                event["event_type"] = event_type
+                events.append(event)
+
+    path = get_event_columns_file(day_index)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encode_event_columns(events))
+    os.replace(tmp_path, path)
+
+
+def read_day_columns_as_block_number_to_array(day_index) -> Dict[int, List[dict]]:
+    """Events of the day by block from its columns file, like read_combined_sorted_events"""
+    columns = open_event_columns(get_event_columns_file(day_index))
+    addresses = columns.addresses
+    values = columns.values
+    value_keys = {
+        EventType.TRANSFER.value: (EventType.TRANSFER, "value"),
+        EventType.NFT.value: (EventType.NFT, "tokenId"),
+    }
+    block_number_to_events = defaultdict(list)
+    # Whole columns are converted at once, indexing memoryviews per event is slower
+    for i, (block_number, transaction_index, log_index, from_id, to_id, event_type) in enumerate(
+        zip(
+            columns.block_numbers.tolist(),
+            columns.transaction_indexes.tolist(),
+            columns.log_indexes.tolist(),
+            columns.from_ids.tolist(),
+            columns.to_ids.tolist(),
+            columns.event_types.tolist(),
+        )
+    ):
+        event_type, value_key = value_keys[event_type]
+        block_number_to_events[block_number].append(
+            {
+                "blockNumber": block_number,
+                "logIndex": log_index,
+                "args": {
+                    "from": addresses[from_id],
+                    "to": addresses[to_id],
+                    value_key: int.from_bytes(values[i * VALUE_BYTES : (i + 1) * VALUE_BYTES], "little"),
+                },
+                "transactionIndex": transaction_index,
+                "event_type": event_type,
+            }
+        )
+    return block_number_to_events
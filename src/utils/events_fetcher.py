@@ -0,0 +1,491 @@
+import glob
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from .aggregated_w3_request import (
+    DEFAULT_MAX_IN_FLIGHT,
+    NoQuorumError,
+    RequestResult,
+    get_provider_key,
+    make_aggregated_call,
+    provider_max_in_flight,
+    set_provider_limit,
+)
+from .chunk_size_controller import (
+    ChunkSizeController,
+    get_chunk_size_controller,
+    is_result_size_error,
+    is_transient,
+)
+from .events_journal import EventsJournal, get_events_journal_file, merge_ranges
+from .transfer_log_decoder import TRANSFER_TOPIC, decode_transfer_log
+
+# A batch of consecutive days spans about this many windows of the current chunk size,
+# so windows are not cut at every day boundary
+BATCH_WINDOWS = 4
+
+MAX_BLOCK_ATTEMPTS = 3
+BLOCK_RETRY_DELAY = 1
+# Rate limited or timed out windows are retried whole, waiting twice as long each time
+MAX_TRANSIENT_ATTEMPTS = 6
+TRANSIENT_RETRY_DELAY = 1
+
+
+class EventsSource:
+    """A contract whose Transfer events are written to data/events/{name}/{i}.json"""
+
+    def __init__(
+        self,
+        name,
+        contract_address,
+        deployment_block,
+        w3_instances,
+        event_abi,
+        save_events,
+    ):
+        self.name = name
+        self.contract_address = contract_address
+        self.deployment_block = deployment_block
+        self.w3_instances = w3_instances
+        # save_events(events, contract_address, start_block, end_block, output_file)
+        self.save_events = save_events
+        self.output_dir = f"data/events/{name}"
+        self.journal_file = get_events_journal_file(name)
+        self.topics_amount = 1 + sum(
+            1 for event_input in event_abi[0]["inputs"] if event_input["indexed"]
+        )
+
+
+def get_day_block_files():
+    """Get all day block files sorted by index"""
+    days_blocks_dir = "data/days_blocks"
+    if not os.path.exists(days_blocks_dir):
+        raise ValueError(f"Directory {days_blocks_dir} not found")
+
+    # Get all files matching pattern {index}_*.json
+    pattern = os.path.join(days_blocks_dir, "*_*.json")
+    files = glob.glob(pattern)
+
+    # Extract index and sort
+    file_data = []
+    for filepath in files:
+        filename = os.path.basename(filepath)
+        match = re.match(r"^(\d+)_", filename)
+        if match:
+            index = int(match.group(1))
+            file_data.append((index, filepath))
+
+    # Sort by index
+    file_data.sort(key=lambda x: x[0])
+
+    return file_data
+
+
+def get_event_ranges(deployment_block, day_files):
+    """(day index, first block, last block) of every day, day 0 starts at deployment_block"""
+    ranges = []
+    first_block = deployment_block
+    for index, filepath in day_files:
+        with open(filepath, "r") as f:
+            day_data = json.load(f)
+        ranges.append((index, first_block, day_data["last_block_of_day"]["number"]))
+        first_block = day_data["first_block_of_next_day"]["number"]
+    return ranges
+
+
+def get_raw_logs(addresses):
+    """
+    get_logs(w3, from_block, to_block) for the raw Transfer logs of the addresses.
+
+    The JSON-RPC request is made on the provider, so the result is not formatted
+    by web3 and logs are compared and decoded as hex strings.
+    """
+
+    def get_logs(w3, from_block, to_block):
+        response = w3.provider.make_request(
+            "eth_getLogs",
+            [
+                {
+                    "address": addresses,
+                    "fromBlock": hex(from_block),
+                    "toBlock": hex(to_block),
+                    "topics": [TRANSFER_TOPIC],
+                }
+            ],
+        )
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response["result"]
+
+    return get_logs
+
+
+def get_log_position(log):
+    return int(log["blockNumber"], 16), int(log["logIndex"], 16)
+
+
+def get_agreed_logs(error: NoQuorumError):
+    """
+    Logs of the blocks a majority of the providers agree on, and the block ranges
+    they do not agree on, from the raw logs of a failed quorum.
+
+    Providers that returned an error count towards the majority but agree on no
+    block. Blocks without logs in any response are agreed on. None if too few
+    providers returned logs for a majority.
+    """
+    providers_amount = sum(error.result_to_amount.values())
+    quorum = providers_amount // 2 + 1
+    result_blocks = []
+    for result, amount in error.result_to_amount.items():
+        if result.error is not None:
+            continue
+        block_to_logs = defaultdict(list)
+        for log in result.result:
+            block_to_logs[int(log["blockNumber"], 16)].append(log)
+        result_blocks.append((block_to_logs, amount))
+    if sum(amount for _, amount in result_blocks) < quorum:
+        return None
+
+    agreed_logs, disagreed_ranges = [], []
+    for block in sorted(set().union(*(block_to_logs.keys() for block_to_logs, _ in result_blocks))):
+        votes = defaultdict(int)
+        for block_to_logs, amount in result_blocks:
+            votes[RequestResult(block_to_logs.get(block, []), None)] += amount
+        winner = max(votes, key=votes.get)
+        if votes[winner] >= quorum:
+            agreed_logs.extend(winner.result)
+        else:
+            disagreed_ranges.append((block, block))
+    return agreed_logs, merge_ranges(disagreed_ranges)
+
+
+def read_disagreed_window(
+    instances,
+    controller: ChunkSizeController,
+    get_logs,
+    from_block,
+    to_block,
+    agreed_logs,
+    disagreed_ranges,
+    on_window=None,
+):
+    """Logs of a window whose providers disagreed, fetching only the blocks they disagreed on"""
+    print(
+        f"    Providers disagree on {len(disagreed_ranges)} ranges of blocks "
+        f"{from_block} to {to_block}, fetching only those"
+    )
+    logs = list(agreed_logs)
+    current_block = from_block
+    for disagreed_from_block, disagreed_to_block in disagreed_ranges + [(to_block + 1, None)]:
+        # The agreed blocks before the disagreed range are complete
+        if on_window is not None and current_block < disagreed_from_block:
+            on_window(
+                current_block,
+                disagreed_from_block - 1,
+                [
+                    log
+                    for log in agreed_logs
+                    if current_block <= int(log["blockNumber"], 16) < disagreed_from_block
+                ],
+            )
+        if disagreed_to_block is None:
+            break
+        logs += read_window(
+            instances,
+            controller,
+            get_logs,
+            disagreed_from_block,
+            disagreed_to_block,
+            on_window,
+        )
+        current_block = disagreed_to_block + 1
+    return sorted(logs, key=get_log_position)
+
+
+def read_window(
+    instances,
+    controller: ChunkSizeController,
+    get_logs,
+    from_block,
+    to_block,
+    on_window=None,
+    attempt=1,
+):
+    """
+    Logs of the window, a failed window is split in two and only its halves are fetched.
+
+    A window failing only with rate limits or timeouts is fetched again whole after a
+    backoff, smaller windows would only make more requests. When the providers disagree, the blocks a majority agrees on are kept and only
+    the blocks they disagree on are fetched again. on_window(from_block, to_block,
+    logs) is called with every window that succeeds.
+    """
+    window_size = to_block - from_block + 1
+    try:
+        print(f"    Fetching logs from block {from_block} to {to_block}...")
+        logs = make_aggregated_call(
+            instances, lambda instance: get_logs(instance, from_block, to_block)
+        )
+        print(f"    Found {len(logs)} events in this chunk")
+    except Exception as e:
+        print(f"    Error fetching logs from block {from_block} to {to_block}: {e}")
+        agreement = get_agreed_logs(e) if isinstance(e, NoQuorumError) else None
+        if agreement is not None:
+            agreed_logs, disagreed_ranges = agreement
+            if disagreed_ranges != [(from_block, to_block)]:
+                return read_disagreed_window(
+                    instances,
+                    controller,
+                    get_logs,
+                    from_block,
+                    to_block,
+                    agreed_logs,
+                    disagreed_ranges,
+                    on_window,
+                )
+        if is_transient(e):
+            if attempt >= MAX_TRANSIENT_ATTEMPTS:
+                raise
+            time.sleep(TRANSIENT_RETRY_DELAY * 2 ** (attempt - 1))
+            return read_window(
+                instances,
+                controller,
+                get_logs,
+                from_block,
+                to_block,
+                on_window,
+                attempt + 1,
+            )
+        controller.on_failure(window_size, e)
+        if window_size == 1:
+            if attempt >= MAX_BLOCK_ATTEMPTS:
+                raise
+            time.sleep(BLOCK_RETRY_DELAY * attempt)
+            return read_window(
+                instances,
+                controller,
+                get_logs,
+                from_block,
+                to_block,
+                on_window,
+                attempt + 1,
+            )
+
+        middle_block = from_block + window_size // 2 - 1
+        logs = read_window(
+            instances, controller, get_logs, from_block, middle_block, on_window
+        )
+        logs += read_window(
+            instances, controller, get_logs, middle_block + 1, to_block, on_window
+        )
+        if is_result_size_error(e):
+            controller.on_result_limit(len(logs), e)
+        return logs
+
+    controller.on_success(window_size, len(logs))
+    if on_window is not None:
+        on_window(from_block, to_block, logs)
+    return logs
+
+
+def read_logs_chunked(instances, get_logs, start_block, end_block, on_window=None):
+    """Read logs in windows sized by the chunk size controller of the providers"""
+    print(f"  Fetching events from block {start_block} to {end_block}...")
+    controller = get_chunk_size_controller(instances)
+    all_logs = []
+    # Events per block of the last window, to keep windows under the result limit
+    density = None
+    current_block = start_block
+    try:
+        while current_block <= end_block:
+            chunk_end = min(
+                current_block + controller.get_chunk_size(density) - 1, end_block
+            )
+            logs = read_window(
+                instances, controller, get_logs, current_block, chunk_end, on_window
+            )
+            all_logs.extend(logs)
+            density = len(logs) / (chunk_end - current_block + 1)
+            current_block = chunk_end + 1
+    finally:
+        controller.save()
+    return all_logs
+
+
+def split_logs_by_source(sources, logs) -> dict[str, list]:
+    """Decoded events of every source from raw logs, told apart by address and topic count"""
+    sources_by_address = {source.contract_address.lower(): source for source in sources}
+    source_events = {source.name: [] for source in sources}
+    for log in logs:
+        source = sources_by_address.get(log["address"].lower())
+        if source is None or len(log["topics"]) != source.topics_amount:
+            raise ValueError(
+                f"Unexpected Transfer log of {log['address']} with {len(log['topics'])} topics "
+                f"in block {int(log['blockNumber'], 16)}"
+            )
+        source_events[source.name].append(decode_transfer_log(log))
+    return source_events
+
+
+def get_batches(day_jobs, chunk_size) -> list[list]:
+    """
+    Split the days to fetch into batches of consecutive days.
+
+    day_jobs maps a day index to the (source, start_block, end_block, output_file)
+    of the sources missing that day. A batch ends at a gap in the days or once it
+    spans BATCH_WINDOWS windows of chunk_size blocks.
+    """
+    batches = []
+    batch, batch_start_block = [], None
+    for range_index in sorted(day_jobs.keys()):
+        start_block = min(job[1] for job in day_jobs[range_index])
+        end_block = max(job[2] for job in day_jobs[range_index])
+        if batch and (
+            batch[-1][0] != range_index - 1
+            or end_block - batch_start_block + 1 > BATCH_WINDOWS * chunk_size
+        ):
+            batches.append(batch)
+            batch = []
+        if not batch:
+            batch_start_block = start_block
+        batch.append((range_index, day_jobs[range_index]))
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def get_journal_writer(sources, journals):
+    """on_window for read_logs_chunked adding the window's events of every source to its journal"""
+
+    def on_window(from_block, to_block, logs):
+        for name, events in split_logs_by_source(sources, logs).items():
+            journals[name].add_window(from_block, to_block, events)
+
+    return on_window
+
+
+def fetch_and_save_batch(batch, combined, journals):
+    """
+    Fetch a batch of consecutive days and save every day of every source in it.
+
+    Windows span several days and the events are bucketed into days by the day
+    boundaries. With combined, all sources share one request per window. Only the
+    blocks missing from the sources' journals are fetched, and a day file is
+    written once the journal covers all its blocks.
+    """
+    jobs = [job for _, jobs_of_day in batch for job in jobs_of_day]
+    sources = list({id(source): source for source, _, _, _ in jobs}.values())
+    print(
+        f"\nFetching days {batch[0][0]} to {batch[-1][0]} of "
+        f"{', '.join(source.name for source in sources)}"
+    )
+
+    request_groups = [sources] if combined else [[source] for source in sources]
+    for group in request_groups:
+        group_jobs = [job for job in jobs if any(job[0] is source for source in group)]
+        start_block = min(job[1] for job in group_jobs)
+        end_block = max(job[2] for job in group_jobs)
+        missing_ranges = merge_ranges(
+            missing_range
+            for source in group
+            for missing_range in journals[source.name].get_missing_ranges(
+                start_block, end_block
+            )
+        )
+        for from_block, to_block in missing_ranges:
+            read_logs_chunked(
+                group[0].w3_instances,
+                get_raw_logs([source.contract_address for source in group]),
+                from_block,
+                to_block,
+                get_journal_writer(group, journals),
+            )
+
+    for source, start_block, end_block, output_file in jobs:
+        source.save_events(
+            journals[source.name].get_events(start_block, end_block),
+            source.contract_address,
+            start_block,
+            end_block,
+            output_file,
+        )
+    for source, start_block, end_block, _ in jobs:
+        journals[source.name].discard(start_block, end_block)
+
+
+def set_default_provider_limits(sources, max_in_flight):
+    """Limit providers of the sources without their own limit to max_in_flight, return the highest limit"""
+    providers = {
+        get_provider_key(w3) for source in sources for w3 in source.w3_instances
+    }
+    for provider in providers:
+        if provider not in provider_max_in_flight:
+            set_provider_limit(provider, max_in_flight)
+    return max(provider_max_in_flight[provider] for provider in providers)
+
+
+def fetch_events(
+    sources, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, combined: bool = False
+):
+    """
+    Fetch and save the events of every day of every source that has no file yet.
+
+    Batches of consecutive days are fetched concurrently, with windows spanning
+    several days. Each provider has at most its limit in aggregated_w3_request
+    (max_in_flight if not set) of getLogs requests in flight, so enough windows are
+    kept in flight for the provider with the highest limit. With combined, the
+    sources share a single request per window instead of one each. Fetched windows
+    are journaled, so a run that stops resumes from the blocks it had not fetched.
+    """
+    day_files = get_day_block_files()
+    print(f"Found {len(day_files)} day block files")
+    if not day_files:
+        print("No day block files found. Exiting.")
+        return
+
+    jobs = []
+    for source in sources:
+        os.makedirs(source.output_dir, exist_ok=True)
+        for range_index, start_block, end_block in get_event_ranges(
+            source.deployment_block, day_files
+        ):
+            output_file = os.path.join(source.output_dir, f"{range_index}.json")
+            # Skip if file already exists
+            if os.path.exists(output_file):
+                continue
+            jobs.append((range_index, source, start_block, end_block, output_file))
+    # Days of all sources progress together
+    jobs.sort(key=lambda job: job[0])
+    print(
+        f"Fetching {len(jobs)} ranges of {', '.join(source.name for source in sources)}, "
+        f"{len(day_files) * len(sources) - len(jobs)} already exist"
+    )
+
+    day_jobs = defaultdict(list)
+    for range_index, *job in jobs:
+        day_jobs[range_index].append(tuple(job))
+    instances = [w3 for source in sources for w3 in source.w3_instances]
+    batches = get_batches(
+        day_jobs, get_chunk_size_controller(instances).get_chunk_size()
+    )
+    print(f"Fetching in {len(batches)} batches of consecutive days")
+
+    journals = {source.name: EventsJournal(source.journal_file) for source in sources}
+    max_windows = set_default_provider_limits(sources, max_in_flight)
+    executor = ThreadPoolExecutor(max_workers=max_windows)
+    try:
+        futures = [
+            executor.submit(fetch_and_save_batch, batch, combined, journals)
+            for batch in batches
+        ]
+        for future in futures:
+            future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+    # Every day is written, so the journals are not needed to resume
+    for journal in journals.values():
+        journal.remove()
+
+    print(f"\nCompleted! Processed {len(jobs)} ranges.")
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+
+EVENTS_JOURNAL_DIR = "data/events_journal"
+
+
+def get_events_journal_file(name) -> str:
+    return f"{EVENTS_JOURNAL_DIR}/{name}.jsonl"
+
+
+def merge_ranges(ranges) -> list[tuple[int, int]]:
+    """Sorted, non overlapping block ranges covering the same blocks as ranges"""
+    merged = []
+    for from_block, to_block in sorted(ranges):
+        if merged and from_block <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], to_block))
+        else:
+            merged.append((from_block, to_block))
+    return merged
+
+
+class EventsJournal:
+    """
+    Completed getLogs windows of a contract and their events, one JSON line per window.
+
+    Windows are appended as soon as they are fetched, so a backfill that stops
+    halfway through a day resumes from the blocks that are still missing. Day files
+    are assembled from the journal once all their blocks are covered, and the
+    journal is removed when every day is written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.windows: list[tuple[int, int]] = []
+        self.events: list[dict] = []
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r") as f:
+            lines = f.read().splitlines()
+        for line_index, line in enumerate(lines):
+            try:
+                window = json.loads(line)
+            except json.JSONDecodeError:
+                # A window cut short by a crash is the last line, it is fetched again
+                if line_index == len(lines) - 1:
+                    break
+                raise
+            self.windows.append((window["fromBlock"], window["toBlock"]))
+            self.events.extend(window["events"])
+        print(f"  Resuming {len(self.windows)} fetched windows from {self.path}")
+
+    def add_window(self, from_block, to_block, events):
+        line = json.dumps({"fromBlock": from_block, "toBlock": to_block, "events": events})
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.windows.append((from_block, to_block))
+            self.events.extend(events)
+
+    def get_missing_ranges(self, start_block, end_block) -> list[tuple[int, int]]:
+        """Block ranges of start_block to end_block not covered by any window"""
+        missing = []
+        current_block = start_block
+        with self.lock:
+            windows = merge_ranges(self.windows)
+        for from_block, to_block in windows:
+            if to_block < current_block:
+                continue
+            if from_block > end_block:
+                break
+            if from_block > current_block:
+                missing.append((current_block, from_block - 1))
+            current_block = to_block + 1
+        if current_block <= end_block:
+            missing.append((current_block, end_block))
+        return missing
+
+    def get_events(self, start_block, end_block) -> list[dict]:
+        """Events of the blocks, sorted, with events of overlapping windows once"""
+        with self.lock:
+            events = {
+                (event["blockNumber"], event["transactionIndex"], event["logIndex"]): event
+                for event in self.events
+                if start_block <= event["blockNumber"] <= end_block
+            }
+        return [events[position] for position in sorted(events.keys())]
+
+    def discard(self, start_block, end_block):
+        """Drop the events of saved blocks from memory, the windows stay in the file"""
+        with self.lock:
+            self.events = [
+                event
+                for event in self.events
+                if not start_block <= event["blockNumber"] <= end_block
+            ]
+
+    def remove(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.windows = []
+            self.events = []
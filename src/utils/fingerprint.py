@@ -0,0 +1,30 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _hash_file(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """sha256 of the file content, or an empty string for a missing file"""
+    if not os.path.exists(path):
+        return ""
+    stat = os.stat(path)
+    return _hash_file(path, stat.st_mtime_ns, stat.st_size)
+
+
+def get_fingerprint(input_files: list[str], parameters: dict) -> str:
+    """Fingerprint of a computation from its input files and parameters"""
+    digest = hashlib.sha256()
+    for path in input_files:
+        digest.update(f"{path}:{hash_file(path)}\n".encode())
+    digest.update(json.dumps(parameters, sort_keys=True).encode())
+    return digest.hexdigest()
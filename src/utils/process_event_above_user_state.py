@@ -1,47 +1,200 @@
+import bisect
+from collections.abc import MutableSet
 from typing import Dict
 from .event_type import EventType
+from .address_table import normalize_address
+from .day_ordinal import NO_DAY_ORDINAL, day_to_ordinal, ordinal_to_day
 
 ZERO_ADDRESS = "0x" + "0" * 40
 
 
+# Token ids up to this are bits of a user's NFT mask, higher ids are kept in a sorted
+# tuple, so a single large token id does not make the mask a huge int
+MAX_MASK_TOKEN_ID = 4095
+
+
+class NftIds(MutableSet):
+    """Set of a user's NFT ids, stored as a bitmask and a tuple of large ids in the user's state."""
+
+    __slots__ = ("state",)
+
+    def __init__(self, state: "UserState"):
+        self.state = state
+
+    def __contains__(self, token_id):
+        return self.state.has_nft_id(token_id)
+
+    def __iter__(self):
+        mask = self.state.nft_mask
+        while mask:
+            lowest_bit = mask & -mask
+            yield lowest_bit.bit_length() - 1
+            mask ^= lowest_bit
+        yield from self.state.large_nft_ids
+
+    def __len__(self):
+        return self.state.nft_mask.bit_count() + len(self.state.large_nft_ids)
+
+    def add(self, token_id):
+        if token_id not in self:
+            self.state.add_nft_id(token_id)
+
+    def discard(self, token_id):
+        if token_id in self:
+            self.state.remove_nft_id(token_id)
+
+    def __repr__(self):
+        return repr(set(self))
+
+
 class UserState:
+    """
+    Balance, NFT ids and balance update days of a user.
+
+    NFT ids up to MAX_MASK_TOKEN_ID are kept as a bitmask, larger ones as a sorted
+    tuple, and days as ordinals. nft_ids and the last_*_balance_update_day
+    properties give the set and "YYYY-MM-DD" views.
+    """
+
+    __slots__ = (
+        "balance",
+        "nft_mask",
+        "large_nft_ids",
+        "last_positive_balance_update_ordinal",
+        "last_negative_balance_update_ordinal",
+    )
+
     def __init__(self, balance: int = 0, nft_ids: set[int] = None):
         self.balance = balance
-        self.nft_ids = nft_ids if nft_ids is not None else set()
-        self.last_positive_balance_update_day = ""
-        self.last_negative_balance_update_day = ""
+        self.nft_mask = 0
+        self.large_nft_ids: tuple[int, ...] = ()
+        if nft_ids is not None:
+            self.nft_ids = nft_ids
+        self.last_positive_balance_update_ordinal = NO_DAY_ORDINAL
+        self.last_negative_balance_update_ordinal = NO_DAY_ORDINAL
+
+    @property
+    def nft_ids(self) -> NftIds:
+        return NftIds(self)
+
+    @nft_ids.setter
+    def nft_ids(self, nft_ids):
+        nft_ids = set(nft_ids)
+        for token_id in nft_ids:
+            if token_id < 0:
+                raise ValueError(f"Invalid token id: {token_id}")
+        self.nft_mask = 0
+        for token_id in nft_ids:
+            if token_id <= MAX_MASK_TOKEN_ID:
+                self.nft_mask |= 1 << token_id
+        self.large_nft_ids = tuple(
+            sorted(token_id for token_id in nft_ids if token_id > MAX_MASK_TOKEN_ID)
+        )
+
+    @property
+    def has_nft(self) -> bool:
+        return self.nft_mask != 0 or len(self.large_nft_ids) > 0
+
+    def has_nft_id(self, token_id) -> bool:
+        if token_id < 0:
+            return False
+        if token_id <= MAX_MASK_TOKEN_ID:
+            return (self.nft_mask >> token_id) & 1 == 1
+        i = bisect.bisect_left(self.large_nft_ids, token_id)
+        return i < len(self.large_nft_ids) and self.large_nft_ids[i] == token_id
+
+    def add_nft_id(self, token_id):
+        """Add a token id the user does not have"""
+        if token_id <= MAX_MASK_TOKEN_ID:
+            self.nft_mask |= 1 << token_id
+        else:
+            large_nft_ids = list(self.large_nft_ids)
+            bisect.insort(large_nft_ids, token_id)
+            self.large_nft_ids = tuple(large_nft_ids)
+
+    def remove_nft_id(self, token_id):
+        """Remove a token id the user has"""
+        if token_id <= MAX_MASK_TOKEN_ID:
+            self.nft_mask ^= 1 << token_id
+        else:
+            self.large_nft_ids = tuple(
+                large_id for large_id in self.large_nft_ids if large_id != token_id
+            )
+
+    @property
+    def last_positive_balance_update_day(self) -> str:
+        return ordinal_to_day(self.last_positive_balance_update_ordinal)
+
+    @last_positive_balance_update_day.setter
+    def last_positive_balance_update_day(self, day: str):
+        self.last_positive_balance_update_ordinal = day_to_ordinal(day)
+
+    @property
+    def last_negative_balance_update_day(self) -> str:
+        return ordinal_to_day(self.last_negative_balance_update_ordinal)
+
+    @last_negative_balance_update_day.setter
+    def last_negative_balance_update_day(self, day: str):
+        self.last_negative_balance_update_ordinal = day_to_ordinal(day)
+
+    def copy(self) -> "UserState":
+        state = UserState(self.balance)
+        state.nft_mask = self.nft_mask
+        state.large_nft_ids = self.large_nft_ids
+        state.last_positive_balance_update_ordinal = self.last_positive_balance_update_ordinal
+        state.last_negative_balance_update_ordinal = self.last_negative_balance_update_ordinal
+        return state
 
 
 def process_transfer_event(event, user_state, today) -> UserState:
     value = event["args"]["value"]
-    from_addr = event["args"]["from"].lower()
-    to_addr = event["args"]["to"].lower()
+    from_addr = normalize_address(event["args"]["from"])
+    to_addr = normalize_address(event["args"]["to"])
+    today_ordinal = day_to_ordinal(today)
     if from_addr != ZERO_ADDRESS:
-        user_state[from_addr].balance -= value
-        if user_state[from_addr].balance < 0:
-            raise ValueError(f"Balance of {from_addr} is negative: {user_state[from_addr].balance}")
-        user_state[from_addr].last_negative_balance_update_day = today
+        from_state = user_state[from_addr]
+        from_state.balance -= value
+        if from_state.balance < 0:
+            raise ValueError(f"Balance of {from_addr} is negative: {from_state.balance}")
+        from_state.last_negative_balance_update_ordinal = today_ordinal
     if to_addr != ZERO_ADDRESS:
-        user_state[to_addr].balance += value
-        user_state[to_addr].last_positive_balance_update_day = today
+        to_state = user_state[to_addr]
+        to_state.balance += value
+        to_state.last_positive_balance_update_ordinal = today_ordinal
     return user_state
 
 
-def process_nft_event(event, user_state) -> UserState:
-    token_id = event["args"]["tokenId"]
-    from_addr = event["args"]["from"].lower()
-    to_addr = event["args"]["to"].lower()
+def move_token(user_state, token_id, from_addr, to_addr):
     if from_addr != ZERO_ADDRESS:
-        if token_id not in user_state[from_addr].nft_ids:
+        from_state = user_state[from_addr]
+        if not from_state.has_nft_id(token_id):
             raise ValueError(f"Token {token_id} not found in from address {from_addr}")
-        user_state[from_addr].nft_ids.discard(token_id)
+        from_state.remove_nft_id(token_id)
     if to_addr != ZERO_ADDRESS:
-        if token_id in user_state[to_addr].nft_ids:
+        to_state = user_state[to_addr]
+        if to_state.has_nft_id(token_id):
             raise ValueError(f"Token {token_id} already exists in to address {to_addr}")
-        user_state[to_addr].nft_ids.add(token_id)
+        to_state.add_nft_id(token_id)
+
+
+def process_nft_event(event, user_state) -> UserState:
+    token_id = event["args"]["tokenId"]
+    from_addr = normalize_address(event["args"]["from"])
+    to_addr = normalize_address(event["args"]["to"])
+    move_token(user_state, token_id, from_addr, to_addr)
     return user_state
 
 
+def get_event_addresses(event) -> list[str]:
+    """Addresses whose state is changed by the event, zero address excluded."""
+    addresses = []
+    for key in ("from", "to"):
+        address = normalize_address(event["args"][key])
+        if address != ZERO_ADDRESS and address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
 def process_event_above_user_state(event, user_state, today) -> UserState:
     if event["event_type"] == EventType.TRANSFER:
         return process_transfer_event(event, user_state, today)
@@ -1,5 +1,6 @@
 from .read_transfer_events_as_block_number_to_array import read_transfer_events_as_block_number_to_array
 from .read_nft_events_as_block_number_to_array import read_nft_events_as_block_number_to_array
+from .event_columns import is_day_columns_current, read_day_columns_as_block_number_to_array
 from collections import defaultdict
 
 def combine_and_sort_events(block_number_to_transfer_events, block_number_to_nft_events):
@@ -18,6 +19,8 @@ def combine_and_sort_events(block_number_to_transfer_events, block_number_to_nft
 
 
 def read_combined_sorted_events(day_index):
+    if is_day_columns_current(day_index):
+        return read_day_columns_as_block_number_to_array(day_index)
     transfer_events_file = f"data/events/pilot_vault/{day_index}.json"
     nft_events_file = f"data/events/nft/{day_index}.json"
     block_number_to_transfer_events = read_transfer_events_as_block_number_to_array(
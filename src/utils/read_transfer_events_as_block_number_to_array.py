@@ -2,6 +2,7 @@ from collections import defaultdict
 from typing import Dict, List
 import json
 from .event_type import EventType
+from .address_table import normalize_address
 
 
 def read_transfer_events_as_block_number_to_array(file_path) -> Dict[int, List[dict]]:
@@ -11,6 +12,8 @@ def read_transfer_events_as_block_number_to_array(file_path) -> Dict[int, List[d
 
     for event in events["events"]:
         event["event_type"] = EventType.TRANSFER
+        event["args"]["from"] = normalize_address(event["args"]["from"])
+        event["args"]["to"] = normalize_address(event["args"]["to"])
         block_number_to_events[event["blockNumber"]].append(event)
 
     for block_number, events in block_number_to_events.items():
@@ -0,0 +1,101 @@
+import hashlib
+import json
+from typing import Dict, Iterable
+from .process_event_above_user_state import UserState
+from .day_ordinal import NO_DAY_ORDINAL
+
+# Digests are sums of per-user hashes, so they do not depend on user order
+# and can be updated for changed users only
+DIGEST_MODULUS = 2**256
+
+
+def is_empty_user_state(state: UserState) -> bool:
+    """Users with an empty state are not written to state files."""
+    return (
+        state.balance == 0
+        and state.last_positive_balance_update_ordinal == NO_DAY_ORDINAL
+        and state.last_negative_balance_update_ordinal == NO_DAY_ORDINAL
+        and not state.has_nft
+    )
+
+
+def get_user_state_record(state: UserState) -> dict:
+    return {
+        "balance": state.balance,
+        "nft_ids": list(state.nft_ids),
+        "last_positive_balance_update_day": state.last_positive_balance_update_day,
+        "last_negative_balance_update_day": state.last_negative_balance_update_day,
+    }
+
+
+def get_user_state_hash(address: str, state: UserState) -> int:
+    """Hash of a user's record, 0 for a missing or empty state."""
+    if state is None or is_empty_user_state(state):
+        return 0
+    record = [address.lower(), get_user_state_record(state)]
+    return int.from_bytes(
+        hashlib.sha256(json.dumps(record, sort_keys=True).encode()).digest()
+    )
+
+
+def get_users_state_hash(
+    user_state: Dict[str, UserState], addresses: Iterable[str]
+) -> int:
+    """Sum of the hashes of the given users, without adding them to a defaultdict."""
+    return sum(
+        get_user_state_hash(address, user_state.get(address)) for address in addresses
+    )
+
+
+def get_state_digest(user_state: Dict[str, UserState]) -> str:
+    return format_state_digest(get_users_state_hash(user_state, user_state.keys()))
+
+
+def format_state_digest(value: int) -> str:
+    return format(value % DIGEST_MODULUS, "064x")
+
+
+def update_state_digest(digest: str, removed_hash: int, added_hash: int) -> str:
+    """Digest after users hashing to removed_hash are replaced by users hashing to added_hash."""
+    return format_state_digest(int(digest, 16) - removed_hash + added_hash)
+
+
+def get_state_diff(
+    result_user_state: Dict[str, UserState], expected_user_state: Dict[str, UserState]
+) -> Dict[str, dict]:
+    """
+    Every field that differs between the two states, by address:
+    {address: {field: (result_value, expected_value)}}
+    """
+    empty_record = get_user_state_record(UserState())
+    result_records = {
+        address.lower(): get_user_state_record(state)
+        for address, state in result_user_state.items()
+        if not is_empty_user_state(state)
+    }
+    expected_records = {
+        address.lower(): get_user_state_record(state)
+        for address, state in expected_user_state.items()
+        if not is_empty_user_state(state)
+    }
+
+    diff = {}
+    for address in result_records.keys() | expected_records.keys():
+        result_record = result_records.get(address, empty_record)
+        expected_record = expected_records.get(address, empty_record)
+        if result_record == expected_record:
+            continue
+        diff[address] = {
+            field: (result_record[field], expected_record[field])
+            for field in empty_record.keys()
+            if result_record[field] != expected_record[field]
+        }
+    return dict(sorted(diff.items()))
+
+
+def format_state_diff(diff: Dict[str, dict]) -> str:
+    lines = []
+    for address, fields in diff.items():
+        for field, (result_value, expected_value) in fields.items():
+            lines.append(f"  {address} {field}: {result_value} != {expected_value}")
+    return "\n".join(lines)
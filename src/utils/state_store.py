@@ -0,0 +1,322 @@
+import json
+import os
+from typing import Dict, Iterable, Iterator, List
+from .process_event_above_user_state import UserState
+from .state_digest import (
+    get_state_digest,
+    get_users_state_hash,
+    update_state_digest,
+)
+
+STATE_STORE_DIR = "data/state_store"
+DEFAULT_CHECKPOINT_INTERVAL = 7
+
+STATE_KEYS = ("start_state", "end_state")
+DAY_INFO_KEYS = ("start_block", "end_block", "date", "day_index")
+
+
+def get_state_file(day_index) -> str:
+    return f"data/states/{day_index}.json"
+
+
+def get_balance_record(state: UserState):
+    """Pilot vault entry of a user in state files, None if the user is not written."""
+    if (
+        state is None
+        or state.balance == 0
+        and state.last_negative_balance_update_day == ""
+        and state.last_positive_balance_update_day == ""
+    ):
+        return None
+    return {
+        "balance": state.balance,
+        "last_positive_balance_update_day": state.last_positive_balance_update_day,
+        "last_negative_balance_update_day": state.last_negative_balance_update_day,
+    }
+
+
+def get_nft_ids_record(state: UserState) -> List[int]:
+    if state is None:
+        return []
+    return list(state.nft_ids)
+
+
+def get_balances_data(user_state: Dict[str, UserState]) -> Dict[str, dict]:
+    balances = {}
+    for address, state in user_state.items():
+        record = get_balance_record(state)
+        if record is not None:
+            balances[address.lower()] = record
+    return balances
+
+
+def get_nft_ids_data(user_state: Dict[str, UserState]) -> Dict[str, List[int]]:
+    return {
+        address.lower(): list(state.nft_ids)
+        for address, state in user_state.items()
+        if state.has_nft
+    }
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def _read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class StateStore:
+    """
+    Day states as a full checkpoint every checkpoint_interval days and a delta per day.
+
+    A checkpoint holds the start state of its day, a delta holds the day's info, state
+    digests and the end state records of the users the day changed. The state at the
+    start or end of a day is materialized from the closest checkpoint before it.
+    Checkpoints also keep the order users were first seen in, so materialized states
+    list users in the same order as full state files.
+    """
+
+    def __init__(
+        self,
+        root: str = STATE_STORE_DIR,
+        checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    ):
+        if checkpoint_interval < 1:
+            raise ValueError(f"Invalid checkpoint interval: {checkpoint_interval}")
+        self.root = str(root)
+        self.checkpoint_interval = checkpoint_interval
+        self._last_written_day = None
+        self._last_end_digest = None
+
+    def get_checkpoint_path(self, day_index) -> str:
+        return os.path.join(self.root, "checkpoints", f"{day_index}.json")
+
+    def get_delta_path(self, day_index) -> str:
+        return os.path.join(self.root, "deltas", f"{day_index}.json")
+
+    def has_day(self, day_index) -> bool:
+        return os.path.exists(self.get_delta_path(day_index))
+
+    def get_days(self) -> List[int]:
+        deltas_dir = os.path.join(self.root, "deltas")
+        if not os.path.isdir(deltas_dir):
+            return []
+        return sorted(
+            int(name.removesuffix(".json"))
+            for name in os.listdir(deltas_dir)
+            if name.endswith(".json")
+        )
+
+    def get_checkpoint_day(self, day_index) -> int:
+        for checkpoint_day in range(day_index, -1, -1):
+            if os.path.exists(self.get_checkpoint_path(checkpoint_day)):
+                return checkpoint_day
+        raise FileNotFoundError(f"No state checkpoint at or before day {day_index}")
+
+    def get_input_files(self, day_index) -> List[str]:
+        """Files the states of a day are materialized from."""
+        checkpoint_day = self.get_checkpoint_day(day_index)
+        return [self.get_checkpoint_path(checkpoint_day)] + [
+            self.get_delta_path(delta_day)
+            for delta_day in range(checkpoint_day, day_index + 1)
+        ]
+
+    def write_day(
+        self,
+        day_index,
+        date,
+        start_block,
+        end_block,
+        user_state_before_start_block: Dict[str, UserState],
+        user_state_after_end_block: Dict[str, UserState],
+        changed_addresses: Iterable[str] = None,
+    ):
+        """
+        Write the day's delta, and a checkpoint on checkpoint days. changed_addresses
+        must contain every user the day changed, all users are compared if not given.
+        """
+        before = user_state_before_start_block
+        after = user_state_after_end_block
+        if changed_addresses is None:
+            changed_addresses = list(after.keys()) + [
+                address for address in before.keys() if address not in after
+            ]
+        else:
+            changed_addresses = list(changed_addresses)
+
+        if day_index % self.checkpoint_interval == 0:
+            _write_json(
+                self.get_checkpoint_path(day_index),
+                {
+                    "day_index": day_index,
+                    "addresses": [address.lower() for address in before.keys()],
+                    "nft": get_nft_ids_data(before),
+                    "pilot_vault": get_balances_data(before),
+                },
+            )
+        elif os.path.exists(self.get_checkpoint_path(day_index)):
+            # Left from a run with another interval, it would be used instead of the right one
+            os.remove(self.get_checkpoint_path(day_index))
+
+        if self._last_written_day == day_index - 1:
+            start_digest = self._last_end_digest
+        else:
+            start_digest = get_state_digest(before)
+        end_digest = update_state_digest(
+            start_digest,
+            get_users_state_hash(before, changed_addresses),
+            get_users_state_hash(after, changed_addresses),
+        )
+
+        nft_changes = {}
+        balance_changes = {}
+        for address in changed_addresses:
+            state_before = before.get(address)
+            state_after = after.get(address)
+            nft_ids = get_nft_ids_record(state_after)
+            if nft_ids != get_nft_ids_record(state_before):
+                nft_changes[address.lower()] = nft_ids
+            balance_record = get_balance_record(state_after)
+            if balance_record != get_balance_record(state_before):
+                balance_changes[address.lower()] = balance_record
+
+        _write_json(
+            self.get_delta_path(day_index),
+            {
+                "start_block": start_block,
+                "end_block": end_block,
+                "date": date,
+                "day_index": day_index,
+                "digest": {"start_state": start_digest, "end_state": end_digest},
+                "new_addresses": [
+                    address.lower() for address in changed_addresses if address not in before
+                ],
+                "nft": nft_changes,
+                "pilot_vault": balance_changes,
+            },
+        )
+        self._last_written_day = day_index
+        self._last_end_digest = end_digest
+
+    def get_day_info(self, day_index) -> dict:
+        delta = _read_json(self.get_delta_path(day_index))
+        return {key: delta[key] for key in DAY_INFO_KEYS + ("digest",)}
+
+    def load_state_data(self, day_index, state_keys: Iterable[str] = STATE_KEYS) -> dict:
+        """The day in the format of data/states/{i}.json, with only state_keys materialized."""
+        state_keys = list(state_keys)
+        if len(state_keys) == 0:
+            return self._get_state_data(self.get_day_info(day_index), {})
+
+        checkpoint_day = self.get_checkpoint_day(day_index)
+        state = _read_checkpoint(self.get_checkpoint_path(checkpoint_day))
+        states = {}
+        for delta_day in range(checkpoint_day, day_index + 1):
+            if delta_day == day_index and "start_state" in state_keys:
+                states["start_state"] = _materialize(state)
+            delta = _read_json(self.get_delta_path(delta_day))
+            _apply_delta(state, delta)
+        if "end_state" in state_keys:
+            states["end_state"] = _materialize(state)
+        return self._get_state_data(delta, states)
+
+    def iter_state_data(self) -> Iterator[dict]:
+        """Every stored day in order, reading each checkpoint and delta at most once."""
+        state = None
+        for day_index in self.get_days():
+            if os.path.exists(self.get_checkpoint_path(day_index)):
+                state = _read_checkpoint(self.get_checkpoint_path(day_index))
+            elif state is None:
+                state = _read_checkpoint(
+                    self.get_checkpoint_path(self.get_checkpoint_day(day_index))
+                )
+                for delta_day in range(self.get_checkpoint_day(day_index), day_index):
+                    _apply_delta(state, _read_json(self.get_delta_path(delta_day)))
+            start_state = _materialize(state)
+            delta = _read_json(self.get_delta_path(day_index))
+            _apply_delta(state, delta)
+            yield self._get_state_data(
+                delta, {"start_state": start_state, "end_state": _materialize(state)}
+            )
+
+    def _get_state_data(self, delta, states) -> dict:
+        state_data = {key: delta[key] for key in DAY_INFO_KEYS}
+        state_data["nft"] = {key: state["nft"] for key, state in states.items()}
+        state_data["pilot_vault"] = {
+            key: state["pilot_vault"] for key, state in states.items()
+        }
+        state_data["digest"] = delta["digest"]
+        return state_data
+
+
+def _read_checkpoint(path):
+    checkpoint = _read_json(path)
+    return {
+        "addresses": checkpoint["addresses"],
+        "nft": checkpoint["nft"],
+        "pilot_vault": checkpoint["pilot_vault"],
+    }
+
+
+def _apply_delta(state, delta):
+    state["addresses"].extend(delta["new_addresses"])
+    for address, nft_ids in delta["nft"].items():
+        if len(nft_ids) > 0:
+            state["nft"][address] = nft_ids
+        else:
+            state["nft"].pop(address, None)
+    for address, balance_record in delta["pilot_vault"].items():
+        if balance_record is not None:
+            state["pilot_vault"][address] = balance_record
+        else:
+            state["pilot_vault"].pop(address, None)
+
+
+def _materialize(state) -> dict:
+    """Records of the state, in the order users were first seen."""
+    nft = state["nft"]
+    pilot_vault = state["pilot_vault"]
+    return {
+        "nft": {
+            address: nft[address] for address in state["addresses"] if address in nft
+        },
+        "pilot_vault": {
+            address: pilot_vault[address]
+            for address in state["addresses"]
+            if address in pilot_vault
+        },
+    }
+
+
+def load_state_data(day_index, state_keys: Iterable[str] = STATE_KEYS) -> dict:
+    """
+    The day's state file data. The full state file is used if there is one,
+    otherwise only state_keys are materialized from the state store.
+    """
+    state_file = get_state_file(day_index)
+    if os.path.exists(state_file):
+        return _read_json(state_file)
+    state_store = StateStore()
+    if not state_store.has_day(day_index):
+        raise FileNotFoundError(
+            f"No state of day {day_index}: neither {state_file} nor "
+            f"{state_store.get_delta_path(day_index)} in the state store exists"
+        )
+    try:
+        return state_store.load_state_data(day_index, state_keys)
+    except FileNotFoundError as error:
+        raise FileNotFoundError(
+            f"No state of day {day_index}: {state_file} does not exist and the "
+            f"state store in {state_store.root} is incomplete: {error}"
+        ) from error
+
+
+def get_state_input_files(day_index) -> List[str]:
+    state_file = get_state_file(day_index)
+    if os.path.exists(state_file) or not StateStore().has_day(day_index):
+        return [state_file]
+    return StateStore().get_input_files(day_index)
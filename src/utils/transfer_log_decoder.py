@@ -0,0 +1,40 @@
+from web3 import Web3
+
+# topic0 of Transfer, the same for ERC-20 and ERC-721 since indexed parameters do not change it
+TRANSFER_TOPIC = "0x" + Web3.keccak(text="Transfer(address,address,uint256)").hex()
+
+# Topics of an ERC-20 Transfer (value in data) and an ERC-721 Transfer (tokenId indexed)
+ERC20_TRANSFER_TOPICS = 3
+ERC721_TRANSFER_TOPICS = 4
+
+
+def decode_topic_address(topic: str) -> str:
+    """Lowercase address of a 32 byte hex topic"""
+    return "0x" + topic[-40:].lower()
+
+
+def decode_transfer_log(log: dict) -> dict:
+    """
+    Event in the format of data/events from a raw eth_getLogs Transfer log.
+
+    The log is the JSON-RPC result with hex strings, so fields are sliced and parsed
+    without ABI decoding. Addresses are lowercased here once.
+    """
+    topics = log["topics"]
+    if len(topics) not in (ERC20_TRANSFER_TOPICS, ERC721_TRANSFER_TOPICS):
+        raise ValueError(f"Transfer log with {len(topics)} topics")
+    args = {
+        "from": decode_topic_address(topics[1]),
+        "to": decode_topic_address(topics[2]),
+    }
+    if len(topics) == ERC721_TRANSFER_TOPICS:
+        args["tokenId"] = int(topics[3], 16)
+    else:
+        args["value"] = int(log["data"], 16)
+    return {
+        "blockNumber": int(log["blockNumber"], 16),
+        "transactionHash": log["transactionHash"][2:],
+        "logIndex": int(log["logIndex"], 16),
+        "args": args,
+        "transactionIndex": int(log["transactionIndex"], 16),
+    }
@@ -0,0 +1,136 @@
+"""
+Exact points arithmetic over columnar arrays.
+
+Wei-scale balances multiplied by points rates and block spans do not fit into
+int64, so every value is split into LIMB_BITS-wide limbs stored in an int64
+matrix (one row per user). Limb products and carries stay far below 2**63,
+which keeps the whole computation exact while still running as array operations.
+"""
+import importlib.util
+
+# numpy, imported by require_numpy() when the vectorized mode is selected
+np = None
+
+# A whole number of bytes, limbs are cut out of the values' little-endian bytes
+LIMB_BITS = 24
+LIMB_BYTES = LIMB_BITS // 8
+assert LIMB_BITS % 8 == 0
+LIMB_MASK = (1 << LIMB_BITS) - 1
+# limb * factor must stay below 2**63 together with the incoming carry
+MAX_FACTOR_BITS = 62 - LIMB_BITS
+
+
+def is_available() -> bool:
+    return importlib.util.find_spec("numpy") is not None
+
+
+def require_numpy():
+    """Import numpy on first use, so the other accrual modes never load it"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(
+                "numpy is required for vectorized points, install it with: pip install numpy"
+            ) from None
+        np = numpy
+    return np
+
+
+def get_limbs_amount(max_bits: int) -> int:
+    # One spare limb so the top limb never overflows while normalizing
+    return max_bits // LIMB_BITS + 2
+
+
+def ints_to_limbs(values: list[int], limbs_amount: int):
+    """Split non-negative ints into a (len(values), limbs_amount) int64 matrix, least significant limb first"""
+    require_numpy()
+    width = limbs_amount * LIMB_BYTES
+    # One int.to_bytes per user is the only Python-level step, the limbs are cut out
+    # of the bytes as arrays. Shifting an object array per limb is slower, since every
+    # shift and mask creates a Python int per user.
+    raw = b"".join(value.to_bytes(width, "little") for value in values)
+    octets = (
+        np.frombuffer(raw, dtype=np.uint8)
+        .reshape(len(values), limbs_amount, LIMB_BYTES)
+        .astype(np.int64)
+    )
+    limbs = octets[:, :, 0]
+    for i in range(1, LIMB_BYTES):
+        limbs = limbs | (octets[:, :, i] << (8 * i))
+    return limbs
+
+
+def normalize_limbs(limbs):
+    """Propagate carries and borrows so every limb but the top one is in [0, 2**LIMB_BITS)"""
+    limbs = limbs.copy()
+    for k in range(limbs.shape[1] - 1):
+        # Arithmetic shift floors negative limbs, turning them into borrows
+        carry = limbs[:, k] >> LIMB_BITS
+        limbs[:, k] &= LIMB_MASK
+        limbs[:, k + 1] += carry
+    return limbs
+
+
+def limbs_to_ints(limbs) -> list[int]:
+    """Convert normalized, non-negative limbs back into Python ints"""
+    require_numpy()
+    rows, limbs_amount = limbs.shape
+    octets = np.stack(
+        [(limbs >> shift) & 0xFF for shift in range(0, LIMB_BITS, 8)], axis=2
+    ).astype(np.uint8)
+    raw = octets.tobytes()
+    width = limbs_amount * LIMB_BYTES
+    # The results are Python ints, so one int.from_bytes per user is the least
+    # that is needed, summing shifted limbs as object arrays makes one per limb
+    return [
+        int.from_bytes(raw[i * width : (i + 1) * width], "little") for i in range(rows)
+    ]
+
+
+def compute_weighted_balances(
+    balances: list[int], excluded_balances: list[int], factors
+) -> list[int]:
+    """
+    Return max(0, balance - excluded_balance) * factor for every row, exactly.
+
+    factors is an int64 array, e.g. points per token times the amount of blocks.
+    """
+    require_numpy()
+    if len(balances) == 0:
+        return []
+    factors = np.asarray(factors, dtype=np.int64)
+    factor_bits = int(factors.max()).bit_length()
+    if factor_bits > MAX_FACTOR_BITS:
+        raise ValueError(f"Factor {int(factors.max())} is too large for exact limbs")
+
+    balance_bits = max(max(balances), max(excluded_balances)).bit_length()
+    limbs_amount = get_limbs_amount(balance_bits + factor_bits)
+
+    difference = normalize_limbs(
+        ints_to_limbs(balances, limbs_amount)
+        - ints_to_limbs(excluded_balances, limbs_amount)
+    )
+    # A negative top limb means the snapshot balance exceeds the current one
+    difference[difference[:, -1] < 0] = 0
+
+    return limbs_to_ints(normalize_limbs(difference * factors[:, None]))
+
+
+def compute_points_for_blocks(
+    balances: list[int],
+    excluded_balances: list[int],
+    has_nft: list[bool],
+    points_per_token: int,
+    points_per_token_for_nft: int,
+    blocks_amount: int,
+) -> list[int]:
+    """Points earned by every user holding the same state for blocks_amount blocks"""
+    require_numpy()
+    rates = np.where(
+        np.asarray(has_nft, dtype=bool), points_per_token_for_nft, points_per_token
+    ).astype(np.int64)
+    return compute_weighted_balances(
+        balances, excluded_balances, rates * blocks_amount
+    )
@@ -0,0 +1,14 @@
+from src.utils.address_table import normalize_address
+
+
+class TestAddressTable:
+    def test_normalize(self):
+        """Test that addresses are lowercased and share one string object"""
+        a = normalize_address("0xABCDEFABCDEFABCDEFABCDEFABCDEFABCDEFABCD")
+        b = normalize_address("".join(["0xabcdefabcdef", "abcdefabcdefabcdefabcdefabcd"]))
+        assert a == "0xabcdefabcdefabcdefabcdefabcdefabcdefabcd"
+        assert a is b
+
+    def test_cache_is_bounded(self):
+        """Test that the cache of normalized addresses has a maximum size"""
+        assert normalize_address.cache_info().maxsize is not None
@@ -0,0 +1,142 @@
+import os
+import signal
+import sys
+import threading
+import time
+
+import pytest
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+from src.utils import aggregated_w3_request
+from src.utils.aggregated_w3_request import (
+    NoQuorumError,
+    RequestResult,
+    get_block_number,
+    make_aggregated_call,
+    set_provider_limit,
+)
+from test.utils.fake_rpc import FakeProvider, FakeW3
+
+
+@pytest.fixture(autouse=True)
+def reset_provider_limits():
+    yield
+    aggregated_w3_request.provider_max_in_flight.clear()
+    aggregated_w3_request.provider_lags.clear()
+    aggregated_w3_request.shutdown_provider_executors()
+
+
+def _instances(amount=3, delay=0.0):
+    return [FakeW3(FakeProvider(f"https://rpc{i}.test", delay=delay)) for i in range(amount)]
+
+
+def _get_empty_logs(w3):
+    return w3.provider.make_request("eth_getLogs", [{"address": [], "fromBlock": "0x0", "toBlock": "0x0"}])["result"]
+
+
+class TestAggregatedW3Request:
+    def test_same_results(self):
+        """Test that a result or error returned by every provider is returned or raised, different results raise"""
+        instances = _instances()
+        assert make_aggregated_call(instances, lambda w3: {"result": [1, 2]}) == {"result": [1, 2]}
+
+        error = TimeoutError("read timed out")
+
+        def fail(w3):
+            raise error
+
+        with pytest.raises(TimeoutError):
+            make_aggregated_call(instances, fail)
+        with pytest.raises(NoQuorumError):
+            make_aggregated_call(instances, lambda w3: instances.index(w3))
+
+    def test_worker_threads_are_reused(self):
+        """Test that calls run on the same long-lived threads, one set per provider"""
+        instances = _instances()
+        threads = {id(w3): set() for w3 in instances}
+
+        def record_thread(w3):
+            threads[id(w3)].add(threading.get_ident())
+            return 0
+
+        for _ in range(50):
+            make_aggregated_call(instances, record_thread)
+        for w3 in instances:
+            assert 1 <= len(threads[id(w3)]) <= aggregated_w3_request.DEFAULT_MAX_IN_FLIGHT
+        assert threading.get_ident() not in set().union(*threads.values())
+
+    def test_in_flight_limit(self):
+        """Test that concurrent callers never have more calls in flight to a provider than its limit"""
+        instances = _instances(delay=0.01)
+        set_provider_limit(instances[0].provider.endpoint_uri, 2)
+
+        def call():
+            for _ in range(5):
+                make_aggregated_call(instances, _get_empty_logs)
+
+        callers = [threading.Thread(target=call) for _ in range(6)]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+        assert instances[0].provider.max_in_flight == 2
+        assert instances[1].provider.max_in_flight == aggregated_w3_request.DEFAULT_MAX_IN_FLIGHT
+
+    def test_returns_on_quorum(self):
+        """Test that a call returns once a majority agrees, without waiting for the slow provider"""
+        instances = _instances()
+        slow_provider = instances[2].provider
+        slow_provider.delay = 0.5
+        set_provider_limit(slow_provider.endpoint_uri, 1)
+
+        start = time.perf_counter()
+        for _ in range(3):
+            assert make_aggregated_call(instances, _get_empty_logs) == []
+        assert time.perf_counter() - start < 0.5
+        assert aggregated_w3_request.provider_lags == {slow_provider.endpoint_uri: 3}
+        # The calls queued behind the first one never started
+        time.sleep(0.6)
+        assert len(slow_provider.requests) == 1
+
+    def test_results_compared_by_digest(self):
+        """Test that results with the same content are equal whatever their dict order or mapping type"""
+        log = {"address": "0x" + "1" * 40, "topics": [HexBytes("0x" + "ab" * 32)], "blockNumber": 1}
+        same_log = AttributeDict({"blockNumber": 1, "topics": [HexBytes("0x" + "ab" * 32)], "address": "0x" + "1" * 40})
+        assert RequestResult([log], None) == RequestResult([same_log], None)
+        assert len({RequestResult([log], None), RequestResult([same_log], None)}) == 1
+        assert RequestResult([log], None) != RequestResult([{**log, "blockNumber": 2}], None)
+        assert RequestResult(1, None) != RequestResult("1", None)
+
+    def test_block_number_voted_on_raw_results(self):
+        """Test that providers vote on the raw eth_blockNumber results, decoded once for the winner"""
+        instances = [FakeW3(FakeProvider(f"https://rpc{i}.test", latest_block=23_000_000)) for i in range(3)]
+        instances[2].provider.latest_block = 23_000_001
+        assert get_block_number(instances) == 23_000_000
+        for w3 in instances:
+            assert all(request == ("eth_blockNumber", []) for request in w3.provider.requests)
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+    @pytest.mark.filterwarnings("ignore:This process .* is multi-threaded:DeprecationWarning")
+    def test_forked_process_gets_new_executors_and_lag_counters(self):
+        """Test that a child forked while a lock is held makes calls with new workers, locks and lag counters"""
+        instances = _instances()
+        make_aggregated_call(instances, _get_empty_logs)
+        aggregated_w3_request.provider_lags["https://rpc0.test"] = 5
+        with aggregated_w3_request.provider_lags_lock, aggregated_w3_request.provider_executors_lock:
+            pid = os.fork()
+            if pid == 0:
+                exit_code = 1
+                # A deadlocked child is killed instead of hanging the test
+                signal.alarm(10)
+                try:
+                    if len(aggregated_w3_request.provider_lags) == 0:
+                        make_aggregated_call(instances, _get_empty_logs)
+                        aggregated_w3_request.record_lagging_providers(["https://rpc0.test"])
+                        if aggregated_w3_request.provider_lags["https://rpc0.test"] <= 2:
+                            exit_code = 0
+                finally:
+                    sys.stdout.flush()
+                    os._exit(exit_code)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,16 @@
+import pytest
+
+from src.benchmark import run_stage
+from src.synthetic_chain import SyntheticChainConfig, generate_synthetic_chain
+
+
+class TestBenchmark:
+    def test_failed_stage_raises(self, tmp_path):
+        """Test that a stage raising in its process fails the benchmark instead of hanging it"""
+        generate_synthetic_chain(
+            tmp_path,
+            SyntheticChainConfig(days=2, users=5, events_per_day=5, blocks_per_day=50, nft_event_ratio=0.3),
+        )
+        # Points need the daily states, which were not computed
+        with pytest.raises(RuntimeError, match="FileNotFoundError"):
+            run_stage("daily_points", str(tmp_path), {"accrual_mode": "interval", "workers": 1})
@@ -0,0 +1,156 @@
+from collections import defaultdict
+
+import pytest
+
+from src.utils import events_fetcher
+from src.utils.aggregated_w3_request import NoQuorumError, RequestResult
+from src.utils.chunk_size_controller import (
+    CHUNK_SIZE_INCREASE,
+    DEFAULT_CHUNK_SIZE,
+    MAX_CHUNK_SIZE,
+    ChunkSizeController,
+    is_range_error,
+    is_result_size_error,
+)
+
+PROVIDERS = ["https://a.test", "https://b.test"]
+
+
+def _no_quorum_error(*messages, providers=None):
+    result_to_amount = defaultdict(int)
+    for message, provider in zip(messages, providers or [None] * len(messages)):
+        result_to_amount[RequestResult(None, ValueError(message), provider)] += 1
+    return NoQuorumError(result_to_amount)
+
+
+class TestChunkSizeController:
+    def test_additive_increase_multiplicative_decrease(self, tmp_path):
+        """Test that full windows grow the chunk size by a fixed step and failures halve the failed window"""
+        controller = ChunkSizeController(PROVIDERS, str(tmp_path / "rpc_limits.json"))
+        assert controller.get_chunk_size() == DEFAULT_CHUNK_SIZE
+        controller.on_success(DEFAULT_CHUNK_SIZE)
+        assert controller.get_chunk_size() == DEFAULT_CHUNK_SIZE + CHUNK_SIZE_INCREASE
+        # A window cut short by the end of a range does not test the chunk size
+        controller.on_success(100)
+        assert controller.get_chunk_size() == DEFAULT_CHUNK_SIZE + CHUNK_SIZE_INCREASE
+        controller.on_failure(8000, ValueError("internal error"))
+        assert controller.get_chunk_size() == 4000
+
+    def test_range_and_result_limits(self, tmp_path):
+        """Test that range errors cap the chunk size and result size errors cap the results per window"""
+        controller = ChunkSizeController(PROVIDERS, str(tmp_path / "rpc_limits.json"))
+        controller.on_failure(5000, ValueError("block range is too wide"))
+        for _ in range(5):
+            controller.on_success(controller.get_chunk_size())
+        assert controller.get_chunk_size() == 4999
+
+        controller.on_result_limit(1000, ValueError("query returned more than 999 results"))
+        assert controller.get_chunk_size(density=1) == 999
+        assert controller.get_chunk_size(density=0.1) == 4999
+
+    def test_limits_are_saved_per_provider(self, tmp_path):
+        """Test that limits are read back by a new controller and a window uses the lowest limit of its providers"""
+        limits_file = str(tmp_path / "rpc_limits.json")
+        controller = ChunkSizeController(PROVIDERS[:1], limits_file)
+        controller.on_failure(2000, ValueError("exceed maximum block range"))
+        controller.save()
+
+        assert ChunkSizeController(PROVIDERS[1:], limits_file).get_chunk_size() == DEFAULT_CHUNK_SIZE
+        assert ChunkSizeController(PROVIDERS, limits_file).get_chunk_size() == 1000
+
+    def test_error_classification(self):
+        """Test that failed quorums are classified by the providers' errors"""
+        assert is_range_error(_no_quorum_error("block range too large", "block range too large"))
+        assert not is_result_size_error(_no_quorum_error("block range too large", "timeout"))
+        assert is_result_size_error(_no_quorum_error("query returned more than 10000 results", "timeout"))
+        assert is_result_size_error(
+            ValueError("Log response size exceeded. Use a 2K block range or a cap of 10K logs")
+        )
+        assert not is_range_error(ValueError("Log response size exceeded. Use a 2K block range"))
+
+    def test_rate_limits_keep_limits(self, tmp_path):
+        """Test that rate limits, timeouts and windows without results do not lower the range or result limits"""
+        controller = ChunkSizeController(PROVIDERS, str(tmp_path / "rpc_limits.json"))
+        for error in [
+            ValueError("429 Client Error: Too Many Requests for url"),
+            ValueError({"code": -32005, "message": "rate limit exceeded, too many results requested"}),
+            TimeoutError("read timed out"),
+        ]:
+            assert not is_range_error(error) and not is_result_size_error(error)
+            controller.on_failure(1000, error)
+            controller.on_result_limit(500, error)
+        controller.on_result_limit(0, ValueError("query returned more than 10000 results"))
+        assert controller.limits[PROVIDERS[0]]["max_results"] is None
+        assert controller.limits[PROVIDERS[0]]["max_chunk_size"] == MAX_CHUNK_SIZE
+
+    def test_limits_of_failed_provider_only(self, tmp_path):
+        """Test that a limit error lowers the limits of the provider that raised it only"""
+        controller = ChunkSizeController(PROVIDERS, str(tmp_path / "rpc_limits.json"))
+        error = _no_quorum_error("query returned more than 99 results", "read timed out", providers=PROVIDERS)
+        controller.on_failure(400, error)
+        controller.on_result_limit(100, error)
+        assert controller.limits[PROVIDERS[0]]["max_results"] == 99
+        assert controller.limits[PROVIDERS[1]]["max_results"] is None
+
+        error = _no_quorum_error("block range is too wide", "read timed out", providers=PROVIDERS[::-1])
+        controller.on_failure(300, error)
+        assert controller.limits[PROVIDERS[0]]["max_chunk_size"] == MAX_CHUNK_SIZE
+        assert controller.limits[PROVIDERS[1]]["max_chunk_size"] == 299
+
+    def test_result_limit_grows_back(self, tmp_path):
+        """Test that windows succeeding close to the result limit raise it again, windows with few results do not"""
+        controller = ChunkSizeController(PROVIDERS, str(tmp_path / "rpc_limits.json"))
+        controller.on_result_limit(100, ValueError("query returned more than 99 results"))
+        controller.on_success(10, 0)
+        assert controller.limits[PROVIDERS[0]]["max_results"] == 99
+        controller.on_success(10, 90)
+        assert controller.limits[PROVIDERS[0]]["max_results"] == 99 + 9
+
+    def test_single_block_failure_is_raised(self, tmp_path, monkeypatch):
+        """Test that a block that keeps failing is retried and then raised instead of exiting"""
+        monkeypatch.setattr(events_fetcher, "BLOCK_RETRY_DELAY", 0)
+        controller = ChunkSizeController(PROVIDERS, str(tmp_path / "rpc_limits.json"))
+        calls = []
+
+        def fail(instances, function):
+            calls.append(1)
+            raise ValueError("header not found")
+
+        monkeypatch.setattr(events_fetcher, "make_aggregated_call", fail)
+        with pytest.raises(ValueError):
+            events_fetcher.read_window([], controller, events_fetcher.get_raw_logs([]), 10, 10)
+        assert len(calls) == events_fetcher.MAX_BLOCK_ATTEMPTS
+
+    def test_rate_limited_window_is_retried_whole(self, tmp_path, monkeypatch):
+        """Test that a window rate limited by every provider is fetched again as is, without changing the limits"""
+        monkeypatch.setattr(events_fetcher, "TRANSIENT_RETRY_DELAY", 0)
+        controller = ChunkSizeController(PROVIDERS, str(tmp_path / "rpc_limits.json"))
+        windows = []
+
+        def get_logs(instance, from_block, to_block):
+            windows.append((from_block, to_block))
+            if len(windows) == 1:
+                raise _no_quorum_error("429 Client Error: Too Many Requests for url", "read timed out", providers=PROVIDERS)
+            return []
+
+        monkeypatch.setattr(events_fetcher, "make_aggregated_call", lambda instances, function: function(None))
+        assert events_fetcher.read_window([], controller, get_logs, 1, 1000) == []
+        assert windows == [(1, 1000), (1, 1000)]
+        assert controller.get_chunk_size() == DEFAULT_CHUNK_SIZE
+        assert all(limits["max_chunk_size"] == MAX_CHUNK_SIZE for limits in controller.limits.values())
+
+    def test_rate_limited_window_is_raised(self, tmp_path, monkeypatch):
+        """Test that a window that stays rate limited is raised after the transient attempts"""
+        monkeypatch.setattr(events_fetcher, "TRANSIENT_RETRY_DELAY", 0)
+        controller = ChunkSizeController(PROVIDERS, str(tmp_path / "rpc_limits.json"))
+        calls = []
+
+        def fail(instances, function):
+            calls.append(1)
+            raise ValueError("429 Client Error: Too Many Requests for url")
+
+        monkeypatch.setattr(events_fetcher, "make_aggregated_call", fail)
+        with pytest.raises(ValueError):
+            events_fetcher.read_window([], controller, events_fetcher.get_raw_logs([]), 1, 1000)
+        assert len(calls) == events_fetcher.MAX_TRANSIENT_ATTEMPTS
+        assert controller.get_chunk_size() == DEFAULT_CHUNK_SIZE
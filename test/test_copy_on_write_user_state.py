@@ -0,0 +1,88 @@
+import copy
+from collections import defaultdict
+
+from src.utils.copy_on_write_user_state import CopyOnWriteUserState
+from src.utils.event_type import EventType
+from src.utils.process_event_above_user_state import (
+    UserState,
+    process_event_above_user_state,
+)
+
+ZERO_ADDRESS = "0x" + "0" * 40
+
+
+def _transfer(from_addr, to_addr, value):
+    return {
+        "event_type": EventType.TRANSFER,
+        "args": {"from": from_addr, "to": to_addr, "value": value},
+    }
+
+
+def _nft_transfer(from_addr, to_addr, token_id):
+    return {
+        "event_type": EventType.NFT,
+        "args": {"from": from_addr, "to": to_addr, "tokenId": token_id},
+    }
+
+
+def _as_items(user_state):
+    return [
+        (address, state.balance, state.nft_ids, state.last_positive_balance_update_day, state.last_negative_balance_update_day)
+        for address, state in user_state.items()
+    ]
+
+
+class TestCopyOnWriteUserState:
+    def test_untouched_users_are_shared(self):
+        """Test that only users accessed for writing are cloned and the base state is not changed"""
+        base = {"0xa": UserState(10, {1}), "0xb": UserState(20)}
+        user_state = CopyOnWriteUserState(base)
+        user_state["0xa"].balance -= 5
+        user_state["0xa"].nft_ids.add(2)
+
+        assert base["0xa"].balance == 10
+        assert base["0xa"].nft_ids == {1}
+        assert user_state.get("0xa").balance == 5
+        assert user_state.get("0xb") is base["0xb"]
+        assert list(user_state.changed.keys()) == ["0xa"]
+
+    def test_missing_users_are_created(self):
+        """Test that accessing a missing user creates an empty state like defaultdict"""
+        user_state = CopyOnWriteUserState({"0xa": UserState(10)})
+        assert "0xc" not in user_state
+        assert user_state.get("0xc") is None
+        assert user_state["0xc"].balance == 0
+        assert "0xc" in user_state
+        assert len(user_state) == 2
+
+    def test_matches_deepcopy(self):
+        """Test that events applied to the copy-on-write state give the same state and order as to a deep copy"""
+        base = defaultdict(UserState)
+        for event in [_transfer(ZERO_ADDRESS, "0xa", 100), _transfer(ZERO_ADDRESS, "0xb", 50), _nft_transfer(ZERO_ADDRESS, "0xb", 1)]:
+            base = process_event_above_user_state(event, base, "2025-09-01")
+        events = [
+            _transfer("0xb", "0xc", 20),
+            _nft_transfer("0xb", "0xd", 1),
+            _transfer(ZERO_ADDRESS, "0xa", 5),
+        ]
+
+        expected = copy.deepcopy(base)
+        for event in events:
+            expected = process_event_above_user_state(event, expected, "2025-09-02")
+        base_before = _as_items(base)
+
+        user_state = CopyOnWriteUserState(dict(base))
+        for event in events:
+            user_state = process_event_above_user_state(event, user_state, "2025-09-02")
+
+        assert _as_items(user_state) == _as_items(expected)
+        assert _as_items(user_state.base) == base_before
+        assert _as_items(user_state.commit()) == _as_items(expected)
+
+    def test_delete(self):
+        """Test that deleted users are removed from the state and from the base state on commit"""
+        user_state = CopyOnWriteUserState({"0xa": UserState(10), "0xb": UserState(20)})
+        del user_state["0xa"]
+        assert list(user_state) == ["0xb"]
+        assert len(user_state) == 1
+        assert list(user_state.commit().keys()) == ["0xb"]
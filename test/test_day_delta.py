@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+import pytest
+
+from src.daily_states_v2 import StateFormat, process_daily_states
+from src.synthetic_chain import SyntheticChainConfig, generate_synthetic_chain
+from src.utils.day_delta import DayDelta
+from src.utils.event_type import EventType
+from src.utils.process_event_above_user_state import UserState, ZERO_ADDRESS, process_event_above_user_state
+
+DAYS_AMOUNT = 5
+A = "0x" + "a" * 40
+B = "0x" + "b" * 40
+C = "0x" + "c" * 40
+
+
+def _transfer(from_addr, to_addr, value):
+    return {"event_type": EventType.TRANSFER, "args": {"from": from_addr, "to": to_addr, "value": value}}
+
+
+def _nft_transfer(from_addr, to_addr, token_id):
+    return {"event_type": EventType.NFT, "args": {"from": from_addr, "to": to_addr, "tokenId": token_id}}
+
+
+def _apply_delta(events, user_state):
+    day_delta = DayDelta(0, "2026-01-02", 0, 0)
+    for event in events:
+        day_delta.add_event(event)
+    return day_delta.apply(user_state)
+
+
+def _replay(events, user_state):
+    for event in events:
+        user_state = process_event_above_user_state(event, user_state, "2026-01-02")
+    return user_state
+
+
+def _as_items(user_state):
+    return [
+        (address, state.balance, state.nft_mask, state.last_positive_balance_update_day, state.last_negative_balance_update_day)
+        for address, state in user_state.items()
+    ]
+
+
+def _start_state():
+    user_state = defaultdict(UserState)
+    return _replay([_transfer(ZERO_ADDRESS, A, 100), _nft_transfer(ZERO_ADDRESS, A, 1)], user_state)
+
+
+class TestDayDelta:
+    def test_delta_matches_replay(self):
+        """Test that applying a day's delta gives the same state and user order as replaying it"""
+        events = [
+            _transfer(A, B, 60),
+            _nft_transfer(A, C, 1),
+            _transfer(B, A, 10),
+            _nft_transfer(C, B, 1),
+            _nft_transfer(ZERO_ADDRESS, C, 2),
+            _transfer(B, ZERO_ADDRESS, 50),
+        ]
+        expected = _replay(events, _start_state())
+        assert _as_items(_apply_delta(events, _start_state())) == _as_items(expected)
+
+    def test_negative_balance_within_day(self):
+        """Test that a balance going negative within the day is detected even if the day ends positive"""
+        events = [_transfer(A, B, 150), _transfer(ZERO_ADDRESS, A, 100)]
+        with pytest.raises(ValueError, match="negative"):
+            _replay(events, _start_state())
+        with pytest.raises(ValueError, match="negative"):
+            _apply_delta(events, _start_state())
+
+    def test_invalid_nft_moves(self):
+        """Test that NFT transfers from a user that does not hold the token are rejected"""
+        with pytest.raises(ValueError, match="not found"):
+            _apply_delta([_nft_transfer(B, C, 1)], _start_state())
+        with pytest.raises(ValueError, match="not found"):
+            _apply_delta([_nft_transfer(A, B, 1), _nft_transfer(A, C, 1)], _start_state())
+
+    def test_parallel_states_match_serial(self, tmp_path, monkeypatch):
+        """Test that states composed from parallel day deltas equal the serial replay"""
+        generate_synthetic_chain(
+            tmp_path,
+            SyntheticChainConfig(days=DAYS_AMOUNT, users=15, events_per_day=40, blocks_per_day=100, nft_event_ratio=0.3),
+        )
+        monkeypatch.chdir(tmp_path)
+        states_dir = tmp_path / "data" / "states"
+
+        process_daily_states()
+        expected = [(states_dir / f"{day_index}.json").read_text() for day_index in range(DAYS_AMOUNT)]
+        process_daily_states(workers=2)
+        assert [(states_dir / f"{day_index}.json").read_text() for day_index in range(DAYS_AMOUNT)] == expected
+
+        process_daily_states(StateFormat.DELTA, workers=2)
+        assert not states_dir.joinpath("0.json").exists()
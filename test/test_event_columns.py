@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from src.build_event_columns import build_event_columns
+from src.synthetic_chain import SyntheticChainConfig, generate_synthetic_chain
+from src.utils.event_columns import (
+    get_column_offsets,
+    get_event_columns_file,
+    is_day_columns_current,
+    open_event_columns,
+)
+from src.utils.read_combined_sorted_events import read_combined_sorted_events
+
+DAYS_AMOUNT = 3
+
+
+def _without_transaction_hashes(block_number_to_events):
+    return {
+        block_number: [{key: value for key, value in event.items() if key != "transactionHash"} for event in events]
+        for block_number, events in block_number_to_events.items()
+    }
+
+
+@pytest.fixture
+def chain(tmp_path, monkeypatch):
+    generate_synthetic_chain(
+        tmp_path,
+        SyntheticChainConfig(days=DAYS_AMOUNT, users=15, events_per_day=50, blocks_per_day=100, nft_event_ratio=0.3),
+    )
+    monkeypatch.chdir(tmp_path)
+
+
+class TestEventColumns:
+    def test_same_events_as_json(self, chain):
+        """Test that days read from columns files equal days read from the JSON event files"""
+        json_days = [_without_transaction_hashes(read_combined_sorted_events(day_index)) for day_index in range(DAYS_AMOUNT)]
+        build_event_columns()
+        for day_index in range(DAYS_AMOUNT):
+            assert is_day_columns_current(day_index)
+            block_number_to_events = read_combined_sorted_events(day_index)
+            assert block_number_to_events == json_days[day_index]
+            assert list(block_number_to_events.keys()) == sorted(block_number_to_events.keys())
+
+    def test_outdated_columns_fall_back_to_json(self, chain):
+        """Test that a columns file older than the day's JSON files is not used and is rewritten"""
+        build_event_columns()
+        events_file = "data/events/nft/1.json"
+        mtime_ns = os.stat(get_event_columns_file(1)).st_mtime_ns
+        os.utime(events_file, ns=(mtime_ns + 1, mtime_ns + 1))
+        assert not is_day_columns_current(1)
+        assert "transactionHash" in next(iter(read_combined_sorted_events(1).values()))[0]
+
+        build_event_columns()
+        assert is_day_columns_current(1)
+        assert "transactionHash" not in next(iter(read_combined_sorted_events(1).values()))[0]
+
+    def test_numpy_reads_columns_in_place(self, chain):
+        """Test that columns can be memory-mapped by numpy at their offsets"""
+        np = pytest.importorskip("numpy")
+        build_event_columns()
+        path = get_event_columns_file(0)
+        columns = open_event_columns(path)
+        offsets = get_column_offsets(len(columns))
+        block_numbers = np.memmap(path, dtype="<u8", mode="r", offset=offsets["block_numbers"], shape=(len(columns),))
+        assert block_numbers.tolist() == columns.block_numbers.tolist()
+        values = np.frombuffer(columns.values, dtype="<u8").reshape(len(columns), 4)
+        assert [int(limbs[0]) + (int(limbs[1]) << 64) for limbs in values] == [
+            columns.get_value(i) for i in range(len(columns))
+        ]
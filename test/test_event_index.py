@@ -0,0 +1,170 @@
+import json
+
+import pytest
+
+from src.daily_states_v2 import process_daily_states
+from src import event_index
+from src.build_event_columns import build_event_columns
+from src.event_index import AddressEventIndex
+from src.state_query import StateQuery
+from src.synthetic_chain import SyntheticChainConfig, generate_synthetic_chain
+from src.utils.process_event_above_user_state import get_event_addresses
+
+DAYS_AMOUNT = 4
+
+
+def _scan_positions(days_amount):
+    positions = {}
+    for day_index in range(days_amount):
+        for folder in ("nft", "pilot_vault"):
+            with open(f"data/events/{folder}/{day_index}.json") as f:
+                events = json.load(f)["events"]
+            for event in events:
+                for address in get_event_addresses(event):
+                    positions.setdefault(address, []).append(
+                        [day_index, event["blockNumber"], event["transactionIndex"], event["logIndex"], folder]
+                    )
+    return {address: sorted(address_positions) for address, address_positions in positions.items()}
+
+
+def _generate(root):
+    generate_synthetic_chain(
+        root,
+        SyntheticChainConfig(days=DAYS_AMOUNT, users=12, events_per_day=30, blocks_per_day=100, nft_event_ratio=0.3),
+    )
+
+
+class TestAddressEventIndex:
+    def test_positions_match_scan(self, tmp_path, monkeypatch):
+        """Test that the index has the positions of every address's events in replay order"""
+        _generate(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        index = AddressEventIndex()
+        assert index.update() == list(range(DAYS_AMOUNT))
+
+        expected = _scan_positions(DAYS_AMOUNT)
+        for address, positions in expected.items():
+            assert index.get_positions(address) == positions
+            assert index.get_positions(address.upper().replace("0X", "0x")) == positions
+            events = index.get_events(address)
+            assert [[p[0], e["blockNumber"], e["transactionIndex"], e["logIndex"]] for p, e in zip(positions, events)] == [p[:4] for p in positions]
+            assert all(address in get_event_addresses(event) for event in events)
+        assert index.get_positions("0x" + "f" * 40) == []
+
+    def test_incremental_update(self, tmp_path, monkeypatch):
+        """Test that only new and changed days are indexed"""
+        _generate(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        index = AddressEventIndex()
+        assert index.update(DAYS_AMOUNT - 1) == list(range(DAYS_AMOUNT - 1))
+        assert index.update(DAYS_AMOUNT) == [DAYS_AMOUNT - 1]
+        assert index.update(DAYS_AMOUNT) == []
+        assert index.is_up_to_date(DAYS_AMOUNT)
+
+        path = tmp_path / "data" / "events" / "pilot_vault" / "1.json"
+        data = json.loads(path.read_text())
+        data["events"] = data["events"][: len(data["events"]) // 2]
+        path.write_text(json.dumps(data))
+        assert not index.is_up_to_date(DAYS_AMOUNT)
+        assert index.update(DAYS_AMOUNT) == [1]
+
+        expected = _scan_positions(DAYS_AMOUNT)
+        for address, positions in expected.items():
+            assert index.get_positions(address) == positions
+
+    def test_update_touches_only_shards_of_updated_days(self, tmp_path, monkeypatch):
+        """Test that a new day is appended to its shards and a changed day rewrites only its shards"""
+        _generate(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        index = AddressEventIndex()
+        index.update(DAYS_AMOUNT - 1)
+
+        written = {"append": [], "rewrite": []}
+        for name, kind in (("_append_lines", "append"), ("_write_lines", "rewrite")):
+            function = getattr(event_index, name)
+            monkeypatch.setattr(
+                event_index, name, lambda path, lines, f=function, k=kind: (written[k].append(path), f(path, lines))
+            )
+
+        def get_shards(day_index):
+            return {index.get_shard(address) for address, positions in _scan_positions(DAYS_AMOUNT).items() if any(p[0] == day_index for p in positions)}
+
+        index.update(DAYS_AMOUNT)
+        assert written["rewrite"] == []
+        assert set(written["append"]) == {index.get_shard_path(shard) for shard in get_shards(DAYS_AMOUNT - 1)}
+
+        written["append"].clear()
+        old_shards = get_shards(1)
+        path = tmp_path / "data" / "events" / "pilot_vault" / "1.json"
+        data = json.loads(path.read_text())
+        data["events"] = data["events"][:1]
+        path.write_text(json.dumps(data))
+        index.update(DAYS_AMOUNT)
+        assert set(written["rewrite"]) == {index.get_shard_path(shard) for shard in old_shards}
+        assert written["append"] == []
+        expected = _scan_positions(DAYS_AMOUNT)
+        for address, positions in expected.items():
+            assert index.get_positions(address) == positions
+
+    def test_interrupted_update_is_not_duplicated(self, tmp_path, monkeypatch):
+        """Test that an update stopped between shard writes leaves no second copy of a day once indexed again"""
+        _generate(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        index = AddressEventIndex()
+        index.update(DAYS_AMOUNT - 1)
+
+        append_lines = event_index._append_lines
+        appended = []
+
+        def append_then_stop(path, lines):
+            if len(appended) == 2:
+                raise KeyboardInterrupt
+            appended.append(path)
+            append_lines(path, lines)
+
+        monkeypatch.setattr(event_index, "_append_lines", append_then_stop)
+        with pytest.raises(KeyboardInterrupt):
+            index.update(DAYS_AMOUNT)
+        monkeypatch.setattr(event_index, "_append_lines", append_lines)
+        assert not index.is_up_to_date(DAYS_AMOUNT)
+        assert index.update(DAYS_AMOUNT) == [DAYS_AMOUNT - 1]
+
+        for path in (tmp_path / "data" / "event_index" / "shards").iterdir():
+            days = [json.loads(line)["day_index"] for line in path.read_text().splitlines()]
+            assert len(days) == len(set(days))
+        for address, positions in _scan_positions(DAYS_AMOUNT).items():
+            assert index.get_positions(address) == positions
+
+    def test_state_query_uses_index(self, tmp_path, monkeypatch):
+        """Test that state queries give the same results with a current event index"""
+        _generate(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        process_daily_states()
+        query_without_index = StateQuery()
+        assert query_without_index.event_index is None
+
+        AddressEventIndex().update()
+        query = StateQuery()
+        assert query.event_index is not None
+        # Events are read from the event files, then from the event columns
+        for with_columns in (False, True):
+            if with_columns:
+                build_event_columns(DAYS_AMOUNT)
+            for block_number in range(query.start_blocks[0], query.end_blocks[-1] + 1, 37):
+                for address in _scan_positions(DAYS_AMOUNT):
+                    expected = query_without_index.state_at(address, block_number)
+                    state = query.state_at(address, block_number)
+                    assert (state.balance, state.nft_mask) == (expected.balance, expected.nft_mask)
+
+    def test_events_from_columns(self, tmp_path, monkeypatch):
+        """Test that events read at indexed positions from event columns equal the event files' events"""
+        _generate(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        index = AddressEventIndex()
+        index.update()
+        expected = {address: index.get_events(address) for address in _scan_positions(DAYS_AMOUNT)}
+        build_event_columns(DAYS_AMOUNT)
+        for address, events in expected.items():
+            for event in events:
+                del event["transactionHash"]
+            assert index.get_events(address) == events
@@ -0,0 +1,235 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src import nft_events, pilot_vault_events
+from src.synthetic_chain import SyntheticChainConfig, generate_synthetic_chain
+from src.utils import aggregated_w3_request, chunk_size_controller, events_fetcher
+from src.utils.events_fetcher import EventsSource, fetch_events, get_event_ranges, get_day_block_files
+from test.utils.fake_rpc import FakeProvider, FakeW3, get_request_window
+from test.utils.load_events_sorted import load_events_sorted
+
+DAYS_AMOUNT = 6
+EVENT_MODULES = {"nft": nft_events, "pilot_vault": pilot_vault_events}
+
+
+@pytest.fixture(autouse=True)
+def reset_provider_limits():
+    yield
+    aggregated_w3_request.provider_max_in_flight.clear()
+    aggregated_w3_request.provider_lags.clear()
+    aggregated_w3_request.shutdown_provider_executors()
+    chunk_size_controller.chunk_size_controllers.clear()
+
+
+@pytest.fixture
+def chain(tmp_path, monkeypatch, request):
+    """Synthetic chain whose events are served by fake providers, with data/events removed"""
+    generate_synthetic_chain(
+        tmp_path,
+        SyntheticChainConfig(days=DAYS_AMOUNT, users=20, events_per_day=30, blocks_per_day=100, nft_event_ratio=0.3),
+    )
+    monkeypatch.chdir(tmp_path)
+    chain_events = {name: load_events_sorted(name) for name in EVENT_MODULES}
+    shutil.rmtree(tmp_path / "data" / "events")
+    with open(tmp_path / "data" / "deployment_blocks.json", "r") as f:
+        deployments = json.load(f)["deployments"]
+    provider_limits = getattr(request, "param", {})
+    contract_events = {deployments[name]["address"]: chain_events[name] for name in EVENT_MODULES}
+    providers = [
+        FakeProvider(f"https://rpc{i}.test", contract_events, delay=0.01, **provider_limits) for i in range(3)
+    ]
+    w3_instances = [FakeW3(provider) for provider in providers]
+    sources = [
+        EventsSource(
+            name,
+            deployments[name]["address"],
+            deployments[name]["block_number"],
+            w3_instances,
+            module.TRANSFER_EVENT_ABI,
+            module.save_events,
+        )
+        for name, module in EVENT_MODULES.items()
+    ]
+    return providers, sources, chain_events
+
+
+def _write_rpc_limits(providers, **limits):
+    with open("data/rpc_limits.json", "w") as f:
+        json.dump({provider.endpoint_uri: limits for provider in providers}, f)
+
+
+def _read_events(name, day_index):
+    with open(f"data/events/{name}/{day_index}.json", "r") as f:
+        return json.load(f)["events"]
+
+
+class TestEventsFetcher:
+    def test_event_ranges(self, chain):
+        """Test that day 0 starts at the deployment block and every later day at the first block after the previous day"""
+        ranges = get_event_ranges(100, get_day_block_files())
+        assert len(ranges) == DAYS_AMOUNT
+        assert ranges[0][:2] == (0, 100)
+        for (_, _, end_block), (_, start_block, _) in zip(ranges, ranges[1:]):
+            assert start_block == end_block + 1
+
+    def test_writes_same_day_files(self, chain):
+        """Test that the concurrent fetch writes every day of both contracts with the served events"""
+        providers, sources, chain_events = chain
+        fetch_events(sources, max_in_flight=3)
+        for name in EVENT_MODULES:
+            assert load_events_sorted(name) == chain_events[name]
+            for day_index in range(DAYS_AMOUNT):
+                assert all(
+                    event["blockNumber"] >= 23_000_000 + day_index * 100
+                    for event in _read_events(name, day_index)
+                )
+
+    def test_in_flight_limit(self, chain):
+        """Test that requests overlap across days and contracts but never exceed a provider's limit"""
+        providers, sources, _ = chain
+        # Windows of a single day, so the days are fetched in several batches
+        _write_rpc_limits(providers, chunk_size=100, max_chunk_size=100)
+        aggregated_w3_request.set_provider_limit(providers[0].endpoint_uri, 1)
+        fetch_events(sources, max_in_flight=3)
+        assert providers[0].max_in_flight == 1
+        for provider in providers[1:]:
+            assert 1 < provider.max_in_flight <= 3
+        # Requests of the provider that lags behind the quorum may be cancelled
+        for provider in providers:
+            assert len(provider.requests) <= DAYS_AMOUNT * len(sources)
+        assert sum(len(provider.requests) for provider in providers) >= 2 * DAYS_AMOUNT * len(sources)
+
+    def test_skips_existing_days(self, chain):
+        """Test that days whose file exists are not fetched again"""
+        providers, sources, _ = chain
+        fetch_events(sources)
+        requests_amount = len(providers[0].requests)
+        shutil.move("data/events/nft/2.json", "2.json")
+        fetch_events(sources)
+        assert len(providers[0].requests) == requests_amount + 1
+        with open("2.json", "r") as f:
+            assert _read_events("nft", 2) == json.load(f)["events"]
+
+    @pytest.mark.parametrize("chain", [{"max_range": 30, "max_results": 4}], indirect=True)
+    def test_adaptive_chunk_size(self, chain):
+        """Test that failed windows are split without fetching any block twice and the limits are kept for the next run"""
+        providers, sources, chain_events = chain
+        fetch_events(sources)
+        for name in EVENT_MODULES:
+            assert load_events_sorted(name) == chain_events[name]
+
+        for provider in providers:
+            fetched_blocks = [
+                (addresses, block)
+                for addresses, from_block, to_block in map(get_request_window, (params for _, params in provider.responses))
+                for block in range(from_block, to_block + 1)
+            ]
+            # Requests cancelled once the other providers agreed may leave blocks unfetched
+            assert len(fetched_blocks) == len(set(fetched_blocks)) <= DAYS_AMOUNT * 100 * len(sources)
+
+        with open("data/rpc_limits.json", "r") as f:
+            rpc_limits = json.load(f)
+        for provider in providers:
+            assert rpc_limits[provider.endpoint_uri]["max_chunk_size"] <= 30
+            assert rpc_limits[provider.endpoint_uri]["max_results"] is not None
+
+        failed_amount = len(providers[0].requests) - len(providers[0].responses)
+        shutil.rmtree("data/events")
+        chunk_size_controller.chunk_size_controllers.clear()
+        for provider in providers:
+            provider.requests.clear()
+            provider.responses.clear()
+        fetch_events(sources)
+        assert len(providers[0].requests) - len(providers[0].responses) < failed_amount
+
+    @pytest.mark.parametrize("chain", [{}, {"max_range": 30, "max_results": 6}], indirect=True)
+    def test_combined_requests(self, chain):
+        """Test that one multi-address request per window writes the same files as separate requests"""
+        providers, sources, chain_events = chain
+        fetch_events(sources, combined=True)
+        for name in EVENT_MODULES:
+            assert load_events_sorted(name) == chain_events[name]
+
+        addresses = tuple(source.contract_address for source in sources)
+        for provider in providers:
+            assert {get_request_window(params)[0] for _, params in provider.requests} == {addresses}
+            if provider.max_range is None:
+                assert len(provider.requests) == 1
+
+    def test_multi_day_windows(self, chain):
+        """Test that windows span several days and their events are bucketed into the day files"""
+        providers, sources, chain_events = chain
+        _write_rpc_limits(providers, chunk_size=250)
+        fetch_events(sources)
+        for name in EVENT_MODULES:
+            assert load_events_sorted(name) == chain_events[name]
+            for day_index, start_block, end_block in get_event_ranges(23_000_000, get_day_block_files()):
+                assert all(start_block <= event["blockNumber"] <= end_block for event in _read_events(name, day_index))
+        # 600 blocks per contract, the first window grows the chunk size past the rest
+        windows = [get_request_window(params) for _, params in providers[0].requests]
+        assert [window[1:] for window in windows if window[0] == (sources[0].contract_address,)] == [
+            (23_000_000, 23_000_249),
+            (23_000_250, 23_000_599),
+        ]
+
+    def test_resumes_from_journal(self, chain, monkeypatch):
+        """Test that a run stopped by an outage leaves no partial day file and the next run fetches only missing blocks"""
+        monkeypatch.setattr(events_fetcher, "BLOCK_RETRY_DELAY", 0)
+        providers, sources, chain_events = chain
+        # Windows of half a day, the outage starts in the middle of a day
+        _write_rpc_limits(providers, chunk_size=50, max_chunk_size=50)
+        for provider in providers:
+            provider.fail_after = 5
+        with pytest.raises(Exception):
+            fetch_events(sources, max_in_flight=1)
+
+        journaled = set()
+        for source in sources:
+            with open(source.journal_file, "r") as f:
+                windows = [json.loads(line) for line in f]
+            journaled |= {
+                (source.contract_address, block)
+                for window in windows
+                for block in range(window["fromBlock"], window["toBlock"] + 1)
+            }
+        assert journaled
+        assert len(list(Path("data/events/nft").glob("*.json"))) < DAYS_AMOUNT
+        assert not list(Path("data/events").glob("*/*.tmp"))
+
+        for provider in providers:
+            provider.fail_after = None
+            provider.responses.clear()
+        chunk_size_controller.chunk_size_controllers.clear()
+        fetch_events(sources, max_in_flight=1)
+        for name in EVENT_MODULES:
+            assert load_events_sorted(name) == chain_events[name]
+        for provider in providers:
+            for addresses, from_block, to_block in map(get_request_window, (params for _, params in provider.responses)):
+                assert not journaled & {(address, block) for address in addresses for block in range(from_block, to_block + 1)}
+        assert not any(os.path.exists(source.journal_file) for source in sources)
+
+    def test_disagreement_refetches_disagreed_blocks(self, chain):
+        """Test that when providers disagree only the blocks without a majority are fetched again"""
+        providers, sources, chain_events = chain
+        lagging_block = chain_events["nft"][0]["blockNumber"]
+        eth_getLogs = providers[0].eth_getLogs
+
+        def lagging_eth_getLogs(filter_params):
+            # The first response misses the logs of one block, like a provider behind the chain head
+            response = eth_getLogs(filter_params)
+            if len(providers[0].requests) == 1:
+                response["result"] = [log for log in response["result"] if int(log["blockNumber"], 16) != lagging_block]
+            return response
+
+        providers[0].eth_getLogs = lagging_eth_getLogs
+        providers[1].fail_after = 0
+        fetch_events(sources, combined=True)
+        for name in EVENT_MODULES:
+            assert load_events_sorted(name) == chain_events[name]
+
+        windows = [get_request_window(params)[1:] for _, params in providers[2].requests]
+        assert windows == [(23_000_000, 23_000_599), (lagging_block, lagging_block)]
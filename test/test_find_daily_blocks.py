@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from src import find_daily_blocks
+from src.utils import aggregated_w3_request
+from src.utils.aggregated_w3_request import get_blocks, get_raw_block_headers
+from test.utils.fake_rpc import FakeProvider, FakeW3
+
+FIRST_BLOCK = 23_000_000
+# 2025-01-01 00:00:05 UTC, blocks every 12 seconds
+FIRST_TIMESTAMP = 1_735_689_605
+BLOCK_TIME = 12
+
+
+def _get_block_timestamp(block_number):
+    return FIRST_TIMESTAMP + (block_number - FIRST_BLOCK) * BLOCK_TIME
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    providers = [FakeProvider(f"https://rpc{i}.test", get_block_timestamp=_get_block_timestamp) for i in range(3)]
+    monkeypatch.setattr(find_daily_blocks, "w3_instances", [FakeW3(provider) for provider in providers])
+    yield providers
+    aggregated_w3_request.shutdown_provider_executors()
+
+
+class TestFindDailyBlocks:
+    def test_get_blocks(self, providers):
+        """Test that blocks are fetched with one batch request per provider for every MAX_BATCH_SIZE blocks"""
+        block_numbers = list(range(FIRST_BLOCK, FIRST_BLOCK + aggregated_w3_request.MAX_BATCH_SIZE + 1))
+        blocks = get_blocks(block_numbers, find_daily_blocks.w3_instances)
+        assert [block.number for block in blocks] == block_numbers
+        assert blocks[1]["timestamp"] == FIRST_TIMESTAMP + BLOCK_TIME
+        assert blocks[1].parentHash == blocks[0].hash
+        # The batches of a provider that lags behind the quorum may be cancelled
+        for provider in providers:
+            assert len(provider.requests) <= 2
+            assert all(method == "batch" for method, _ in provider.requests)
+        assert sum(len(provider.requests) for provider in providers) >= 4
+
+    def test_get_blocks_without_batch_requests(self, providers, monkeypatch):
+        """Test that providers without batch requests, as in web3 6, get one request per block"""
+        monkeypatch.delattr(FakeProvider, "make_batch_request")
+        block_numbers = [FIRST_BLOCK, FIRST_BLOCK + 1, FIRST_BLOCK + 2]
+        blocks = get_blocks(block_numbers, find_daily_blocks.w3_instances)
+        assert [block.number for block in blocks] == block_numbers
+        assert blocks[2].timestamp == FIRST_TIMESTAMP + 2 * BLOCK_TIME
+        for provider in providers:
+            assert all(method == "eth_getBlockByNumber" for method, _ in provider.requests)
+        assert max(len(provider.requests) for provider in providers) == len(block_numbers)
+
+    def test_short_batch_response_raises(self, providers, monkeypatch):
+        """Test that a batch response missing blocks raises instead of dropping them"""
+        provider = providers[0]
+        make_batch_request = provider.make_batch_request
+        monkeypatch.setattr(provider, "make_batch_request", lambda requests: make_batch_request(requests)[:-1])
+        with pytest.raises(ValueError, match="returned 2 responses"):
+            get_raw_block_headers(FakeW3(provider), [FIRST_BLOCK, FIRST_BLOCK + 1, FIRST_BLOCK + 2])
+
+    def test_search_finds_first_block_of_next_day(self, providers):
+        """Test that the search finds the first block after a day in a handful of round trips"""
+        latest_block = FIRST_BLOCK + 1_000_000
+        target_day = datetime.fromtimestamp(FIRST_TIMESTAMP, tz=timezone.utc).date()
+        first_after = find_daily_blocks.find_first_block_strictly_after_day(FIRST_BLOCK, latest_block, target_day)
+
+        blocks_per_day = 24 * 60 * 60 // BLOCK_TIME
+        assert first_after == FIRST_BLOCK + blocks_per_day
+        # A binary search over a million blocks makes about 20 sequential requests
+        assert len(providers[0].requests) <= 6
+
+    def test_search_without_next_day(self, providers):
+        """Test that the search returns None when every block is in the day"""
+        target_day = datetime.fromtimestamp(FIRST_TIMESTAMP, tz=timezone.utc).date()
+        assert find_daily_blocks.find_first_block_strictly_after_day(FIRST_BLOCK, FIRST_BLOCK + 100, target_day) is None
@@ -0,0 +1,31 @@
+from src.utils.fingerprint import get_fingerprint, hash_file
+
+
+class TestFingerprint:
+    def test_same_inputs_same_fingerprint(self, tmp_path):
+        """Test that unchanged files and parameters give the same fingerprint"""
+        path = tmp_path / "0.json"
+        path.write_text('{"events": []}')
+        assert get_fingerprint([str(path)], {"rate": 1500}) == get_fingerprint([str(path)], {"rate": 1500})
+
+    def test_changed_file_changes_fingerprint(self, tmp_path):
+        """Test that a change of file content changes the fingerprint"""
+        path = tmp_path / "0.json"
+        path.write_text('{"events": []}')
+        before = get_fingerprint([str(path)], {})
+        path.write_text('{"events": [1]}')
+        assert get_fingerprint([str(path)], {}) != before
+
+    def test_changed_parameters_change_fingerprint(self, tmp_path):
+        """Test that a change of parameters changes the fingerprint"""
+        path = tmp_path / "0.json"
+        path.write_text("{}")
+        assert get_fingerprint([str(path)], {"rate": 1500}) != get_fingerprint([str(path)], {"rate": 2130})
+
+    def test_missing_file(self, tmp_path):
+        """Test that a missing file hashes to an empty string and still contributes to the fingerprint"""
+        missing = tmp_path / "missing.json"
+        assert hash_file(str(missing)) == ""
+        missing_fingerprint = get_fingerprint([str(missing)], {})
+        missing.write_text("{}")
+        assert get_fingerprint([str(missing)], {}) != missing_fingerprint
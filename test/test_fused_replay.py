@@ -0,0 +1,120 @@
+import json
+from collections import defaultdict
+
+from src.check_lp_integrity import LpIntegrityChecker
+from src.daily_points_v2 import (
+    DailyPointsProcessor,
+    get_user_state_at_day,
+    load_lp_balances_snapshot_data,
+)
+from src.daily_states_v2 import process_daily_states
+from src.fused_replay import (
+    LpIntegrityObserver,
+    PointsObserver,
+    StateFileObserver,
+    process_days_fused,
+)
+from src.synthetic_chain import SyntheticChainConfig, generate_synthetic_chain
+from src.utils.get_additional_data import (
+    get_day_date,
+    get_end_block_for_day,
+    get_start_block_for_day,
+)
+from src.utils.process_event_above_user_state import process_event_above_user_state
+from src.utils.read_combined_sorted_events import read_combined_sorted_events
+
+DAYS_AMOUNT = 4
+
+
+def _read_outputs(root):
+    outputs = []
+    for day_index in range(DAYS_AMOUNT):
+        state = (root / "data" / "states" / f"{day_index}.json").read_text()
+        points = json.loads((root / "data" / "points" / f"{day_index}.json").read_text())
+        outputs.append((state, list(points["points"].items())))
+    return outputs
+
+
+def _check_lp_integrity_per_day():
+    snapshot, snapshot_start_block = load_lp_balances_snapshot_data()
+    checker = LpIntegrityChecker(snapshot, snapshot_start_block)
+    user_to_first_broken_integrity_block = defaultdict(lambda: -1)
+    for day_index in range(DAYS_AMOUNT):
+        user_to_first_broken_integrity_block = checker._check_lp_integrity_at_day(
+            day_index, user_to_first_broken_integrity_block
+        )
+    return dict(user_to_first_broken_integrity_block)
+
+
+def _check_lp_integrity_applying_all_events():
+    snapshot, snapshot_start_block = load_lp_balances_snapshot_data()
+    checker = LpIntegrityChecker(snapshot, snapshot_start_block)
+    user_to_first_broken_integrity_block = {}
+    for day_index in range(DAYS_AMOUNT):
+        block_number_to_events = read_combined_sorted_events(day_index)
+        user_state = get_user_state_at_day(day_index, "start_state")
+        date = get_day_date(day_index)
+        for block_number in range(
+            get_start_block_for_day(day_index), get_end_block_for_day(day_index) + 1
+        ):
+            for event in block_number_to_events[block_number]:
+                user_state = process_event_above_user_state(event, user_state, date)
+            if block_number < snapshot_start_block:
+                continue
+            for address, is_integrity_broken in checker._validate_lp_integrity(user_state, date).items():
+                if is_integrity_broken:
+                    user_to_first_broken_integrity_block.setdefault(address, block_number)
+    return user_to_first_broken_integrity_block
+
+
+class TestFusedReplay:
+    def test_fused_replay_matches_separate_passes(self, tmp_path, monkeypatch):
+        """Test that one fused replay writes the same states, points and integrity results as the separate passes"""
+        generate_synthetic_chain(
+            tmp_path,
+            SyntheticChainConfig(
+                days=DAYS_AMOUNT, users=15, events_per_day=25, blocks_per_day=200, snapshot_day=1
+            ),
+        )
+        monkeypatch.chdir(tmp_path)
+
+        snapshot, snapshot_start_block = load_lp_balances_snapshot_data()
+        process_daily_states()
+        DailyPointsProcessor(snapshot, snapshot_start_block).process_points()
+        expected_outputs = _read_outputs(tmp_path)
+        expected_broken_blocks = _check_lp_integrity_per_day()
+
+        snapshot, snapshot_start_block = load_lp_balances_snapshot_data()
+        integrity_observer = LpIntegrityObserver(LpIntegrityChecker(snapshot, snapshot_start_block))
+        process_days_fused([
+            StateFileObserver(),
+            PointsObserver(DailyPointsProcessor(snapshot, snapshot_start_block)),
+            integrity_observer,
+        ])
+
+        assert _read_outputs(tmp_path) == expected_outputs
+        assert dict(integrity_observer.user_to_first_broken_integrity_block) == expected_broken_blocks
+        assert len(expected_broken_blocks) > 0
+
+    def test_fused_replay_applies_snapshot_day_events_before_snapshot_start_block(self, tmp_path, monkeypatch):
+        """Test that the fused integrity check applies the snapshot day's events before a mid-day snapshot start block"""
+        generate_synthetic_chain(
+            tmp_path,
+            SyntheticChainConfig(
+                days=DAYS_AMOUNT, users=15, events_per_day=25, blocks_per_day=200, snapshot_day=1
+            ),
+        )
+        monkeypatch.chdir(tmp_path)
+        snapshot_path = tmp_path / "data" / "lp_balances_snapshot.json"
+        snapshot_data = json.loads(snapshot_path.read_text())
+        snapshot_data["start_block"] += 100
+        snapshot_path.write_text(json.dumps(snapshot_data))
+        process_daily_states()
+
+        snapshot, snapshot_start_block = load_lp_balances_snapshot_data()
+        integrity_observer = LpIntegrityObserver(LpIntegrityChecker(snapshot, snapshot_start_block))
+        process_days_fused([integrity_observer])
+
+        expected_broken_blocks = _check_lp_integrity_applying_all_events()
+        assert dict(integrity_observer.user_to_first_broken_integrity_block) == expected_broken_blocks
+        assert snapshot_start_block in expected_broken_blocks.values()
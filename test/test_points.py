@@ -3,12 +3,15 @@ from pathlib import Path
 import json
 from collections import defaultdict
 import sys
+import random
+import pytest
 from datetime import datetime, timedelta
 
 # Add parent directory to path to import daily_points_v2
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from src.daily_points_v2 import DailyPointsProcessor, POINTS_PER_PILOT_VAULT_TOKEN, POINTS_PER_PILOT_VAULT_TOKEN_FOR_NFT, LP_PROGRAM_DURATION_DAYS
-from src.utils.process_event_above_user_state import UserState
+from src.daily_points_v2 import DailyPointsProcessor, AccrualMode, POINTS_PER_PILOT_VAULT_TOKEN, POINTS_PER_PILOT_VAULT_TOKEN_FOR_NFT, LP_PROGRAM_DURATION_DAYS
+from src.utils.process_event_above_user_state import UserState, ZERO_ADDRESS
+from src.utils.event_type import EventType
 
 DATA_DIR = Path("data")
 
@@ -379,3 +382,99 @@ class TestPoints:
         expected_points = 400 * POINTS_PER_PILOT_VAULT_TOKEN  # 600000
         assert result["0x8888888888888888888888888888888888888888"] == expected_points
         assert result["0x8888888888888888888888888888888888888888"] == 600000
+
+
+def _make_random_day(seed, start_block, end_block, users_amount=12, events_amount=40):
+    """Build a consistent start state and sorted events for one synthetic day"""
+    rng = random.Random(seed)
+    addresses = [f"0x{i:040x}" for i in range(1, users_amount + 1)]
+    user_state = defaultdict(UserState)
+    balances = defaultdict(int)
+    nft_owner = {}
+    for index, address in enumerate(addresses[: users_amount // 2]):
+        user_state[address].balance = rng.randint(1, 10**24)
+        user_state[address].last_positive_balance_update_day = "2026-01-01"
+        balances[address] = user_state[address].balance
+        if index % 2 == 0:
+            user_state[address].nft_ids.add(index)
+            nft_owner[index] = address
+
+    block_number_to_events = defaultdict(list)
+    block_numbers = sorted(rng.randint(start_block, end_block) for _ in range(events_amount))
+    for log_index, block_number in enumerate(block_numbers):
+        if rng.random() < 0.7:
+            from_addr = rng.choice([ZERO_ADDRESS] + [a for a in addresses if balances[a] > 0])
+            to_addr = rng.choice(addresses)
+            max_value = balances[from_addr] if from_addr != ZERO_ADDRESS else 10**22
+            value = rng.randint(0, max_value)
+            if from_addr != ZERO_ADDRESS:
+                balances[from_addr] -= value
+            balances[to_addr] += value
+            event = {"event_type": EventType.TRANSFER, "args": {"from": from_addr, "to": to_addr, "value": value}}
+        else:
+            token_id = rng.choice(list(nft_owner.keys()) + [1000 + log_index])
+            from_addr = nft_owner.get(token_id, ZERO_ADDRESS)
+            to_addr = rng.choice(addresses)
+            nft_owner[token_id] = to_addr
+            event = {"event_type": EventType.NFT, "args": {"from": from_addr, "to": to_addr, "tokenId": token_id}}
+        event.update({"blockNumber": block_number, "transactionIndex": 0, "logIndex": log_index})
+        block_number_to_events[block_number].append(event)
+    return user_state, block_number_to_events, addresses
+
+
+class TestAccrualModes:
+    def _accrue_both(self, seed, snapshot_start_block, lp_balances_snapshot=None, modes=(AccrualMode.PER_BLOCK, AccrualMode.INTERVAL)):
+        start_block, end_block = 1000, 1200
+        results = []
+        for mode in modes:
+            user_state, block_number_to_events, addresses = _make_random_day(seed, start_block, end_block)
+            processor = DailyPointsProcessor(
+                lp_balances_snapshot if lp_balances_snapshot is not None else {},
+                snapshot_start_block,
+                mode,
+            )
+            accrue_points = {
+                AccrualMode.PER_BLOCK: processor.accrue_points_per_block,
+                AccrualMode.INTERVAL: processor.accrue_points_by_interval,
+                AccrualMode.VECTORIZED: processor.accrue_points_vectorized,
+            }[mode]
+            points, end_state = accrue_points(start_block, end_block, block_number_to_events, user_state, "2026-01-15")
+            results.append((
+                [(address, value) for address, value in points.items() if value > 0],
+                {address: (state.balance, state.nft_ids) for address, state in end_state.items()},
+            ))
+        return results
+
+    def test_interval_accrual_matches_per_block(self):
+        """Test that interval accrual gives the same points and end state as per block accrual"""
+        for seed in range(20):
+            per_block, interval = self._accrue_both(seed, 0)
+            assert per_block == interval
+
+    def test_interval_accrual_respects_snapshot_start_block(self):
+        """Test that blocks up to the snapshot start block are not credited in interval mode"""
+        for seed in range(10):
+            for snapshot_start_block in (999, 1000, 1100, 1200, 1300):
+                per_block, interval = self._accrue_both(seed, snapshot_start_block)
+                assert per_block == interval
+
+    def test_interval_accrual_excludes_snapshot_balance(self):
+        """Test that interval accrual subtracts snapshot balances the same way"""
+        snapshot_entry = UserState(balance=10**23)
+        snapshot_entry.last_positive_balance_update_day = "2026-01-01"
+        lp_balances_snapshot = defaultdict(UserState, {f"0x{1:040x}": snapshot_entry})
+        for seed in range(10):
+            per_block, interval = self._accrue_both(seed, 1050, lp_balances_snapshot)
+            assert per_block == interval
+
+    def test_vectorized_accrual_matches_per_block(self):
+        """Test that the numpy kernel gives the same points as per block accrual"""
+        pytest.importorskip("numpy")
+        snapshot_entry = UserState(balance=10**23)
+        snapshot_entry.last_positive_balance_update_day = "2026-01-01"
+        lp_balances_snapshot = defaultdict(UserState, {f"0x{1:040x}": snapshot_entry})
+        modes = (AccrualMode.PER_BLOCK, AccrualMode.VECTORIZED)
+        for seed in range(10):
+            for snapshot_start_block in (0, 1100, 1300):
+                per_block, vectorized = self._accrue_both(seed, snapshot_start_block, lp_balances_snapshot, modes)
+                assert per_block == vectorized
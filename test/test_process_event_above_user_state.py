@@ -567,3 +567,70 @@ class TestProcessEventAboveUserState:
         except ValueError as e:
             assert "Token" in str(e) and "already exists" in str(e)
 
+
+
+class TestUserState:
+    def test_nft_ids_behave_like_a_set(self):
+        """Test that nft_ids stored as a bitmask can be used as a set"""
+        state = UserState(0, {3, 70})
+        state.nft_ids.add(5)
+        state.nft_ids.discard(3)
+        state.nft_ids.discard(1000)
+
+        assert state.nft_ids == {5, 70}
+        assert list(state.nft_ids) == [5, 70]
+        assert len(state.nft_ids) == 2
+        assert 70 in state.nft_ids and 3 not in state.nft_ids
+        assert state.has_nft
+        state.nft_ids = set()
+        assert not state.has_nft
+
+    def test_large_token_ids_stay_small(self):
+        """Test that a token id of 2**200 is kept out of the bitmask and moves like any token"""
+        large_id = 2**200
+        user_state = defaultdict(UserState)
+        user_state["0xa"].nft_ids = {1, large_id}
+        assert user_state["0xa"].nft_mask == 0b10
+        assert user_state["0xa"].large_nft_ids == (large_id,)
+        assert list(user_state["0xa"].nft_ids) == [1, large_id]
+
+        event = {"event_type": EventType.NFT, "args": {"from": "0xa", "to": "0xb", "tokenId": large_id}}
+        process_nft_event(event, user_state)
+        copied = user_state["0xb"].copy()
+        assert user_state["0xa"].nft_ids == {1} and copied.nft_ids == {large_id}
+        assert copied.nft_mask == 0 and copied.has_nft and len(copied.nft_ids) == 1
+        try:
+            process_nft_event(event, user_state)
+            assert False, "Should have raised ValueError"
+        except ValueError as e:
+            assert "not found" in str(e)
+
+    def test_days_are_stored_as_ordinals(self):
+        """Test that balance update days read back as the strings they were set to"""
+        state = UserState()
+        assert state.last_positive_balance_update_day == ""
+        state.last_positive_balance_update_day = "2026-01-01"
+        state.last_negative_balance_update_day = "2025-12-31"
+        assert state.last_positive_balance_update_day == "2026-01-01"
+        assert state.last_negative_balance_update_day == "2025-12-31"
+        assert state.last_positive_balance_update_ordinal - state.last_negative_balance_update_ordinal == 1
+
+    def test_copy_is_independent(self):
+        """Test that changes to a copy do not change the original state"""
+        state = UserState(10, {1})
+        state.last_positive_balance_update_day = "2026-01-01"
+        copied = state.copy()
+        copied.balance += 1
+        copied.nft_ids.add(2)
+        copied.last_positive_balance_update_day = "2026-01-02"
+        assert (state.balance, state.nft_ids, state.last_positive_balance_update_day) == (10, {1}, "2026-01-01")
+
+    def test_addresses_are_lowercased(self):
+        """Test that events with checksummed addresses update the lowercased user"""
+        user_state = defaultdict(UserState)
+        event = {
+            "event_type": EventType.TRANSFER,
+            "args": {"from": ZERO_ADDRESS, "to": "0xABCDEFABCDEFABCDEFABCDEFABCDEFABCDEFABCD", "value": 7},
+        }
+        result = process_event_above_user_state(event, user_state, "2026-01-01")
+        assert list(result.keys()) == ["0xabcdefabcdefabcdefabcdefabcdefabcdefabcd"]
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+from src.daily_points_v2 import validate_end_state
+from src.daily_states_v2 import DailyState, write_user_state_to_file
+from src.utils.copy_on_write_user_state import CopyOnWriteUserState
+from src.utils.process_event_above_user_state import UserState
+from src.utils.state_digest import (
+    get_state_diff,
+    get_state_digest,
+    get_user_state_hash,
+    update_state_digest,
+)
+
+
+def _make_user_state(balance, nft_ids=(), day=""):
+    state = UserState(balance, set(nft_ids))
+    state.last_positive_balance_update_day = day
+    return state
+
+
+def _write_day(user_state_before, user_state_after, start_digest=None):
+    return write_user_state_to_file(
+        DailyState(
+            day_index=0,
+            date="2025-09-01",
+            start_block=100,
+            end_block=199,
+            user_state=user_state_after,
+        ),
+        user_state_before,
+        start_digest,
+    )
+
+
+class TestStateDigest:
+    def test_digest_does_not_depend_on_order(self):
+        """Test that the digest of a state does not depend on user order"""
+        a = {"0xa": _make_user_state(1), "0xb": _make_user_state(2, [7], "2025-09-01")}
+        b = {"0xb": _make_user_state(2, [7], "2025-09-01"), "0xa": _make_user_state(1)}
+        assert get_state_digest(a) == get_state_digest(b)
+
+    def test_empty_users_are_ignored(self):
+        """Test that users not written to state files do not change the digest"""
+        a = {"0xa": _make_user_state(1)}
+        b = {"0xa": _make_user_state(1), "0xb": UserState()}
+        assert get_state_digest(a) == get_state_digest(b)
+
+    def test_update_digest_for_changed_users(self):
+        """Test that updating the digest with changed users equals the digest of the new state"""
+        before = {"0xa": _make_user_state(1), "0xb": _make_user_state(2)}
+        after = {"0xa": _make_user_state(1), "0xb": _make_user_state(5), "0xc": _make_user_state(3)}
+        removed = get_user_state_hash("0xb", before["0xb"])
+        added = get_user_state_hash("0xb", after["0xb"]) + get_user_state_hash("0xc", after["0xc"])
+        assert update_state_digest(get_state_digest(before), removed, added) == get_state_digest(after)
+
+    def test_state_file_digest_updated_for_changed_users(self, tmp_path, monkeypatch):
+        """Test that state file digests updated from the previous day equal full digests"""
+        monkeypatch.chdir(tmp_path)
+        before = {"0xa": _make_user_state(1), "0xb": _make_user_state(2), "0xd": _make_user_state(4)}
+        after = CopyOnWriteUserState(before)
+        after["0xb"].balance = 5
+        after["0xc"] = _make_user_state(3, [7])
+        del after["0xd"]
+        end_digest = _write_day(before, after, get_state_digest(before))
+
+        state = json.loads((tmp_path / "data" / "states" / "0.json").read_text())
+        assert state["digest"]["start_state"] == get_state_digest(before)
+        assert end_digest == state["digest"]["end_state"] == get_state_digest(dict(after.items()))
+
+    def test_diff_reports_every_mismatch(self):
+        """Test that the diff lists every mismatching field of every user"""
+        result = {"0xa": _make_user_state(1), "0xb": _make_user_state(2, [7]), "0xc": _make_user_state(3)}
+        expected = {"0xa": _make_user_state(1), "0xb": _make_user_state(4, [8]), "0xd": _make_user_state(3)}
+        diff = get_state_diff(result, expected)
+        assert diff == {
+            "0xb": {"balance": (2, 4), "nft_ids": ([7], [8])},
+            "0xc": {"balance": (3, 0)},
+            "0xd": {"balance": (0, 3)},
+        }
+
+    def test_validate_end_state(self, tmp_path, monkeypatch):
+        """Test that the end state is verified by digest and mismatches are all reported"""
+        monkeypatch.chdir(tmp_path)
+        before = {"0xa": _make_user_state(1), "0xb": _make_user_state(2)}
+        after = {"0xa": _make_user_state(1), "0xb": _make_user_state(5)}
+        _write_day(before, after)
+
+        validate_end_state(0, after, {"0xb"}, get_user_state_hash("0xb", before["0xb"]))
+        validate_end_state(0, after)
+
+        wrong = {"0xa": _make_user_state(0), "0xb": _make_user_state(6)}
+        with pytest.raises(AssertionError) as error:
+            validate_end_state(0, wrong)
+        assert "in 2 users" in str(error.value)
+        assert "0xa balance: 0 != 1" in str(error.value)
+        assert "0xb balance: 6 != 5" in str(error.value)
+
+    def test_validate_end_state_without_digest(self, tmp_path, monkeypatch):
+        """Test that state files written before digests are still verified"""
+        monkeypatch.chdir(tmp_path)
+        after = {"0xa": _make_user_state(1)}
+        _write_day({}, after)
+        path = tmp_path / "data" / "states" / "0.json"
+        state = json.loads(path.read_text())
+        del state["digest"]
+        path.write_text(json.dumps(state))
+
+        validate_end_state(0, after)
+        with pytest.raises(AssertionError):
+            validate_end_state(0, {"0xa": _make_user_state(2)})
@@ -0,0 +1,70 @@
+import random
+from collections import defaultdict
+
+from src.daily_states_v2 import process_daily_states
+from src.state_query import StateQuery
+from src.synthetic_chain import SyntheticChainConfig, generate_synthetic_chain
+from src.utils.get_additional_data import get_day_date
+from src.utils.process_event_above_user_state import UserState, process_event_above_user_state
+from src.utils.read_combined_sorted_events import read_combined_sorted_events
+
+DAYS_AMOUNT = 4
+
+
+def _replay_until(block_number):
+    user_state = defaultdict(UserState)
+    for day_index in range(DAYS_AMOUNT):
+        block_number_to_events = read_combined_sorted_events(day_index)
+        for event_block_number in sorted(block_number_to_events.keys()):
+            if event_block_number > block_number:
+                return user_state
+            for event in block_number_to_events[event_block_number]:
+                user_state = process_event_above_user_state(event, user_state, get_day_date(day_index))
+    return user_state
+
+
+def _as_tuple(state):
+    return (
+        state.balance,
+        set(state.nft_ids),
+        state.last_positive_balance_update_day,
+        state.last_negative_balance_update_day,
+    )
+
+
+class TestStateQuery:
+    def test_state_at_matches_full_replay(self, tmp_path, monkeypatch):
+        """Test that state_at and holders_at equal a replay of every event up to the block"""
+        generate_synthetic_chain(
+            tmp_path,
+            SyntheticChainConfig(days=DAYS_AMOUNT, users=10, events_per_day=40, blocks_per_day=100, nft_event_ratio=0.3),
+        )
+        monkeypatch.chdir(tmp_path)
+        process_daily_states()
+
+        query = StateQuery()
+        rng = random.Random(1)
+        first_block, last_block = query.start_blocks[0], query.end_blocks[-1]
+        blocks = [first_block - 1, first_block, last_block] + [rng.randint(first_block, last_block) for _ in range(10)]
+        for block_number in blocks:
+            expected = _replay_until(block_number)
+            for address in expected.keys():
+                assert _as_tuple(query.state_at(address, block_number)) == _as_tuple(expected[address])
+            holders = query.holders_at(block_number)
+            assert {address: _as_tuple(state) for address, state in holders.items()} == {
+                address: _as_tuple(state)
+                for address, state in expected.items()
+                if state.balance > 0 or len(state.nft_ids) > 0
+            }
+
+    def test_block_after_last_day(self, tmp_path, monkeypatch):
+        """Test that blocks after the processed days are rejected"""
+        generate_synthetic_chain(tmp_path, SyntheticChainConfig(days=1, users=3, events_per_day=5, blocks_per_day=10))
+        monkeypatch.chdir(tmp_path)
+        process_daily_states()
+        query = StateQuery()
+        try:
+            query.state_at("0x" + "1" * 40, query.end_blocks[-1] + 1)
+            assert False, "Should have raised ValueError"
+        except ValueError as e:
+            assert "after the last processed block" in str(e)
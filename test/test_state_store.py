@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from src.daily_points_v2 import get_user_state_at_day, process_points
+from src.daily_states_v2 import DailyState, StateFormat, process_daily_states, write_user_state_to_store
+from src.utils.copy_on_write_user_state import CopyOnWriteUserState
+from src.utils.process_event_above_user_state import UserState
+from src.synthetic_chain import SyntheticChainConfig, generate_synthetic_chain
+from src.utils.state_store import StateStore, load_state_data
+
+DAYS_AMOUNT = 5
+
+
+def _generate(root):
+    generate_synthetic_chain(
+        root,
+        SyntheticChainConfig(days=DAYS_AMOUNT, users=20, events_per_day=30, blocks_per_day=100, snapshot_day=2),
+    )
+
+
+def _read_points(root):
+    outputs = []
+    for day_index in range(DAYS_AMOUNT):
+        points = json.loads((root / "data" / "points" / f"{day_index}.json").read_text())
+        outputs.append(list(points["points"].items()))
+    return outputs
+
+
+class TestStateStore:
+    def test_materialized_states_match_state_files(self, tmp_path, monkeypatch):
+        """Test that states materialized from checkpoints and deltas equal the full state files"""
+        _generate(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        process_daily_states()
+        full_states = [
+            (tmp_path / "data" / "states" / f"{day_index}.json").read_text()
+            for day_index in range(DAYS_AMOUNT)
+        ]
+
+        process_daily_states(StateFormat.DELTA, checkpoint_interval=2)
+        assert not (tmp_path / "data" / "states" / "0.json").exists()
+        store = StateStore()
+        assert sorted(p.name for p in (tmp_path / "data" / "state_store" / "checkpoints").iterdir()) == ["0.json", "2.json", "4.json"]
+
+        for day_index in range(DAYS_AMOUNT):
+            assert json.loads(full_states[day_index]) == load_state_data(day_index)
+            assert json.dumps(store.load_state_data(day_index), indent=2) == full_states[day_index]
+        assert [json.dumps(state, indent=2) for state in store.iter_state_data()] == full_states
+
+        start_state = load_state_data(3, ["start_state"])
+        assert "end_state" not in start_state["pilot_vault"]
+        assert list(get_user_state_at_day(3, "start_state").keys()) == list(get_user_state_at_day(2, "end_state").keys())
+
+    def test_changed_checkpoint_interval(self, tmp_path, monkeypatch):
+        """Test that checkpoints of an earlier run with another interval are not used"""
+        _generate(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        process_daily_states(StateFormat.DELTA, checkpoint_interval=3)
+        expected = [load_state_data(day_index) for day_index in range(DAYS_AMOUNT)]
+        process_daily_states(StateFormat.DELTA, checkpoint_interval=2)
+        assert not (tmp_path / "data" / "state_store" / "checkpoints" / "3.json").exists()
+        assert [load_state_data(day_index) for day_index in range(DAYS_AMOUNT)] == expected
+
+    def test_points_from_state_store(self, tmp_path, monkeypatch):
+        """Test that points computed from the state store equal points computed from state files"""
+        _generate(tmp_path)
+        monkeypatch.chdir(tmp_path)
+        process_daily_states()
+        process_points()
+        expected = _read_points(tmp_path)
+
+        process_daily_states(StateFormat.DELTA)
+        process_points()
+        assert _read_points(tmp_path) == expected
+
+    def test_missing_day_names_both_places(self, tmp_path, monkeypatch):
+        """Test that a missing day's error names the day, its state file and the state store"""
+        monkeypatch.chdir(tmp_path)
+        with pytest.raises(FileNotFoundError) as error:
+            load_state_data(3)
+        assert "day 3" in str(error.value)
+        assert "data/states/3.json" in str(error.value)
+        assert "data/state_store/deltas/3.json" in str(error.value)
+
+    def test_deleted_users_reach_the_delta(self, tmp_path, monkeypatch):
+        """Test that a user deleted from a copy-on-write state is removed in the stored day"""
+        monkeypatch.chdir(tmp_path)
+        before = {"0xa": UserState(1), "0xb": UserState(2)}
+        after = CopyOnWriteUserState(before)
+        after["0xa"].balance = 3
+        del after["0xb"]
+        store = StateStore(checkpoint_interval=10)
+        write_user_state_to_store(store, DailyState(0, "2025-09-01", 100, 199, after), before)
+
+        end_state = store.load_state_data(0)["pilot_vault"]["end_state"]
+        assert list(end_state.keys()) == ["0xa"]
+        assert end_state["0xa"]["balance"] == 3
@@ -2,14 +2,20 @@ import json
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
 from web3 import Web3
+from src.utils.aggregated_w3_request import get_blocks
 from src.utils.get_rpc import get_rpc
+from src.utils.state_store import StateStore
 
 DATA_DIR = Path(__file__).parent.parent / "data"
 STATES_DIR = DATA_DIR / "states"
+STATE_STORE_DIR = DATA_DIR / "state_store"
 
 
 def load_states_sorted():
     files = sorted(STATES_DIR.glob("*.json"), key=lambda f: int(f.stem))
+    if len(files) == 0:
+        # States written with --state-format delta
+        return list(StateStore(STATE_STORE_DIR).iter_state_data())
     return [json.loads(f.read_text()) for f in files]
 
 
@@ -28,10 +34,10 @@ class TestStates:
     def test_block_corresponds_to_day(self):
         states = load_states_sorted()
         w3 = Web3(Web3.HTTPProvider(get_rpc()))
-        for state in states:
+        start_block_days = self._get_block_days(w3, [state["start_block"] for state in states])
+        end_block_days = self._get_block_days(w3, [state["end_block"] for state in states])
+        for state, start_block_day, end_block_day in zip(states, start_block_days, end_block_days):
             current_day = datetime.fromisoformat(state["date"]).day
-            start_block_day = self._get_block_day(w3, state["start_block"])
-            end_block_day = self._get_block_day(w3, state["end_block"])
 
             assert (
                 end_block_day == current_day
@@ -43,9 +49,9 @@ class TestStates:
     def test_start_block_is_first_of_day(self):
         states = load_states_sorted()
         w3 = Web3(Web3.HTTPProvider(get_rpc()))
-        for state in states[1:]:
+        start_block_days = self._get_block_days(w3, [state["start_block"] - 1 for state in states[1:]])
+        for state, start_block_day in zip(states[1:], start_block_days):
             current_date = datetime.fromisoformat(state["date"])
-            start_block_day = self._get_block_day(w3, state["start_block"] - 1)
             assert (
                 start_block_day == (current_date - timedelta(days=1)).day
             ), f"Day {state['day_index']} start block is not the first of the day"
@@ -53,14 +59,15 @@ class TestStates:
     def test_end_block_is_last_of_day(self):
         states = load_states_sorted()
         w3 = Web3(Web3.HTTPProvider(get_rpc()))
-        for state in states:
+        end_block_days = self._get_block_days(w3, [state["end_block"] + 1 for state in states])
+        for state, end_block_day in zip(states, end_block_days):
             current_date = datetime.fromisoformat(state["date"])
-            end_block_day = self._get_block_day(w3, state["end_block"] + 1)
             assert (
                 end_block_day == (current_date + timedelta(days=1)).day
             ), f"Day {state['day_index']} end block is not the last of the day"
 
-    def _get_block_day(self, w3, block_number):
-        return datetime.fromtimestamp(
-            w3.eth.get_block(block_number).timestamp, tz=timezone.utc
-        ).day
+    def _get_block_days(self, w3, block_numbers):
+        return [
+            datetime.fromtimestamp(block.timestamp, tz=timezone.utc).day
+            for block in get_blocks(block_numbers, [w3])
+        ]
@@ -0,0 +1,63 @@
+import pytest
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+
+from src.nft_events import TRANSFER_EVENT_ABI as NFT_TRANSFER_EVENT_ABI
+from src.pilot_vault_events import TRANSFER_EVENT_ABI as VAULT_TRANSFER_EVENT_ABI
+from src.utils.transfer_log_decoder import decode_transfer_log
+from test.utils.fake_rpc import get_raw_log
+
+CONTRACT = "0x" + "1" * 40
+FROM = "0xAbCdEf0123456789aBcDeF0123456789AbCdEf01"
+TO = "0x" + "0" * 40
+POSITION = {"blockNumber": 23_000_123, "transactionHash": "ab" * 32, "logIndex": 7, "transactionIndex": 3}
+
+
+def _decode_with_abi(event_abi, raw_log):
+    """Event as stored before, from web3's ABI decoding of the formatted log"""
+    log = AttributeDict(
+        {
+            **raw_log,
+            "address": Web3.to_checksum_address(raw_log["address"]),
+            "topics": [HexBytes(topic) for topic in raw_log["topics"]],
+            "data": HexBytes(raw_log["data"]),
+            "blockNumber": int(raw_log["blockNumber"], 16),
+            "transactionHash": HexBytes(raw_log["transactionHash"]),
+            "transactionIndex": int(raw_log["transactionIndex"], 16),
+            "blockHash": HexBytes(raw_log["blockHash"]),
+            "logIndex": int(raw_log["logIndex"], 16),
+        }
+    )
+    event = Web3().eth.contract(abi=event_abi).events.Transfer().process_log(log)
+    return {
+        "blockNumber": event.blockNumber,
+        "transactionHash": event.transactionHash.hex(),
+        "logIndex": event.logIndex,
+        "args": dict(event.args),
+        "transactionIndex": event.transactionIndex,
+    }
+
+
+class TestTransferLogDecoder:
+    @pytest.mark.parametrize(
+        "event_abi, args",
+        [
+            (VAULT_TRANSFER_EVENT_ABI, {"from": FROM, "to": TO, "value": 10**24 + 1}),
+            (NFT_TRANSFER_EVENT_ABI, {"from": FROM, "to": TO, "tokenId": 42}),
+        ],
+    )
+    def test_same_event_as_abi_decoding(self, event_abi, args):
+        """Test that sliced logs give the stored schema of ABI decoded logs, with lowercase addresses"""
+        raw_log = get_raw_log(CONTRACT, {**POSITION, "args": args})
+        expected = _decode_with_abi(event_abi, raw_log)
+        expected["args"] = {key: value.lower() if isinstance(value, str) else value for key, value in expected["args"].items()}
+        assert decode_transfer_log(raw_log) == expected
+        assert decode_transfer_log(raw_log)["args"]["from"] == FROM.lower()
+
+    def test_unexpected_topics(self):
+        """Test that a log that is neither an ERC-20 nor an ERC-721 Transfer is rejected"""
+        raw_log = get_raw_log(CONTRACT, {**POSITION, "args": {"from": FROM, "to": TO, "value": 1}})
+        raw_log["topics"] = raw_log["topics"][:2]
+        with pytest.raises(ValueError, match="2 topics"):
+            decode_transfer_log(raw_log)
@@ -0,0 +1,63 @@
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.utils import vectorized_points
+from src.utils.vectorized_points import (
+    compute_points_for_blocks,
+    compute_weighted_balances,
+    ints_to_limbs,
+    limbs_to_ints,
+    normalize_limbs,
+)
+
+
+class TestVectorizedPoints:
+    def test_limbs_round_trip(self):
+        """Test that ints survive conversion to limbs and back"""
+        values = [0, 1, 2**24 - 1, 2**24, 10**27, 2**200 + 12345]
+        assert limbs_to_ints(ints_to_limbs(values, 10)) == values
+
+    @pytest.mark.parametrize("limb_bits", [8, 16, 32])
+    def test_limbs_follow_limb_width(self, monkeypatch, limb_bits):
+        """Test that limbs of another width are cut from the bytes of that width"""
+        monkeypatch.setattr(vectorized_points, "LIMB_BITS", limb_bits)
+        monkeypatch.setattr(vectorized_points, "LIMB_BYTES", limb_bits // 8)
+        values = [0, 1, 2**limb_bits - 1, 2**limb_bits, 2**100 + 12345]
+        limbs = ints_to_limbs(values, 128 // limb_bits)
+        assert limbs[3].tolist()[:2] == [0, 1]
+        assert limbs_to_ints(limbs) == values
+
+    def test_numpy_is_not_imported_by_other_modes(self):
+        """Test that loading the points modules does not import numpy"""
+        code = "import sys, src.daily_points_v2; sys.exit('numpy' in sys.modules)"
+        assert subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent.parent).returncode == 0
+
+    def test_normalize_limbs_handles_borrow(self):
+        """Test that limb subtraction borrows from higher limbs"""
+        a = ints_to_limbs([2**48], 4)
+        b = ints_to_limbs([1], 4)
+        assert limbs_to_ints(normalize_limbs(a - b)) == [2**48 - 1]
+
+    def test_weighted_balances_are_exact(self):
+        """Test that wei-scale balances times large factors match Python ints"""
+        rng = random.Random(0)
+        balances = [rng.randint(0, 10**30) for _ in range(200)]
+        excluded = [rng.choice([0, rng.randint(0, 10**30)]) for _ in range(200)]
+        factors = [rng.randint(0, 2130 * 7200) for _ in range(200)]
+        expected = [max(0, b - e) * f for b, e, f in zip(balances, excluded, factors)]
+        assert compute_weighted_balances(balances, excluded, np.array(factors)) == expected
+
+    def test_points_for_blocks_uses_nft_rate(self):
+        """Test that holders of an NFT get the NFT rate"""
+        result = compute_points_for_blocks([100, 100], [0, 0], [False, True], 1500, 2130, 10)
+        assert result == [100 * 1500 * 10, 100 * 2130 * 10]
+
+    def test_empty_input(self):
+        """Test that no users gives no points"""
+        assert compute_points_for_blocks([], [], [], 1500, 2130, 10) == []
@@ -0,0 +1,152 @@
+import threading
+import time
+from src.utils.transfer_log_decoder import TRANSFER_TOPIC
+
+
+def _get_word(value):
+    return "0x" + format(value, "064x")
+
+
+def _get_address_word(address):
+    return "0x" + "0" * 24 + address[2:].lower()
+
+
+def get_raw_log(address, event):
+    """Raw eth_getLogs result log of an event as stored in data/events"""
+    args = event["args"]
+    topics = [TRANSFER_TOPIC, _get_address_word(args["from"]), _get_address_word(args["to"])]
+    if "tokenId" in args:
+        topics.append(_get_word(args["tokenId"]))
+        data = "0x"
+    else:
+        data = _get_word(args["value"])
+    return {
+        "address": address.lower(),
+        "topics": topics,
+        "data": data,
+        "blockNumber": hex(event["blockNumber"]),
+        "transactionHash": "0x" + event["transactionHash"],
+        "transactionIndex": hex(event["transactionIndex"]),
+        "blockHash": "0x" + "0" * 64,
+        "logIndex": hex(event["logIndex"]),
+        "removed": False,
+    }
+
+
+class FakeProvider:
+    """
+    JSON-RPC provider serving eth_getLogs from chain_events, the events of every
+    contract address as stored in data/events. Records the requests made to it and
+    how many were in flight at once.
+    """
+
+    def __init__(
+        self,
+        endpoint_uri,
+        chain_events=None,
+        delay=0.0,
+        max_range=None,
+        max_results=None,
+        fail_after=None,
+        get_block_timestamp=None,
+        latest_block=0,
+    ):
+        self.endpoint_uri = endpoint_uri
+        self.chain_events = {address.lower(): events for address, events in (chain_events or {}).items()}
+        self.delay = delay
+        # getLogs limits, requests above them fail like on public providers
+        self.max_range = max_range
+        self.max_results = max_results
+        # Every request fails once this many requests succeeded, like an outage
+        self.fail_after = fail_after
+        # Block number -> timestamp, for eth_getBlockByNumber
+        self.get_block_timestamp = get_block_timestamp
+        self.latest_block = latest_block
+        self.requests = []
+        # (method, params) of the requests that did not fail
+        self.responses = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def make_request(self, method, params):
+        with self.lock:
+            self.requests.append((method, params))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if self.fail_after is not None and len(self.responses) >= self.fail_after:
+                return {"jsonrpc": "2.0", "id": len(self.requests), "error": {"code": -32603, "message": "service unavailable"}}
+            response = getattr(self, method)(*params)
+            if "error" not in response:
+                with self.lock:
+                    self.responses.append((method, params))
+            return {"jsonrpc": "2.0", "id": len(self.requests), **response}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def make_batch_request(self, batch_requests):
+        """A batch is a single request, every call in it gets its own response"""
+        with self.lock:
+            self.requests.append(("batch", batch_requests))
+        time.sleep(self.delay)
+        responses = [
+            {"jsonrpc": "2.0", "id": i, **getattr(self, method)(*params)}
+            for i, (method, params) in enumerate(batch_requests)
+        ]
+        with self.lock:
+            self.responses.append(("batch", batch_requests))
+        return responses
+
+    def eth_blockNumber(self):
+        return {"result": hex(self.latest_block)}
+
+    def eth_getBlockByNumber(self, block_number, full_transactions):
+        number = int(block_number, 16)
+        return {
+            "result": {
+                "number": block_number,
+                "hash": _get_word(number),
+                "parentHash": _get_word(number - 1),
+                "timestamp": hex(self.get_block_timestamp(number)),
+                "transactions": [],
+            }
+        }
+
+    def eth_getLogs(self, filter_params):
+        addresses = filter_params["address"]
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        from_block, to_block = int(filter_params["fromBlock"], 16), int(filter_params["toBlock"], 16)
+        if self.max_range is not None and to_block - from_block + 1 > self.max_range:
+            return {"error": {"code": -32005, "message": f"block range is too wide, maximum is {self.max_range}"}}
+
+        events = sorted(
+            (
+                (address, event)
+                for address in addresses
+                for event in self.chain_events.get(address.lower(), [])
+                if from_block <= event["blockNumber"] <= to_block
+            ),
+            key=lambda item: (item[1]["blockNumber"], item[1]["transactionIndex"], item[1]["logIndex"]),
+        )
+        if self.max_results is not None and len(events) > self.max_results:
+            return {"error": {"code": -32005, "message": f"query returned more than {self.max_results} results"}}
+        return {"result": [get_raw_log(address, event) for address, event in events]}
+
+
+class FakeW3:
+    def __init__(self, provider):
+        self.provider = provider
+
+
+def get_request_window(params):
+    """(addresses, from block, to block) of eth_getLogs params"""
+    filter_params = params[0]
+    return (
+        tuple(filter_params["address"]),
+        int(filter_params["fromBlock"], 16),
+        int(filter_params["toBlock"], 16),
+    )